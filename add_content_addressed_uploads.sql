@@ -0,0 +1,41 @@
+-- Content-addressed upload store for invoice images
+
+-- One row (and one file on disk) per distinct upload content
+-- ref_count is the number of invoice_images rows pointing at the content, kept by a trigger
+CREATE TABLE IF NOT EXISTS stored_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    path TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    ocr_text TEXT,
+    ocr_processed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_stored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Images uploaded before this migration keep their own files and have no content hash
+ALTER TABLE invoice_images ADD COLUMN IF NOT EXISTS content_sha256 CHAR(64) REFERENCES stored_files(sha256);
+
+CREATE INDEX IF NOT EXISTS idx_invoice_images_content_sha256 ON invoice_images(content_sha256);
+CREATE INDEX IF NOT EXISTS idx_stored_files_unreferenced ON stored_files(last_stored_at) WHERE ref_count <= 0;
+
+CREATE OR REPLACE FUNCTION maintain_stored_file_refs() 
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.content_sha256 IS NOT NULL THEN
+        UPDATE stored_files SET ref_count = ref_count - 1 WHERE sha256 = OLD.content_sha256;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.content_sha256 IS NOT NULL THEN
+        UPDATE stored_files SET ref_count = ref_count + 1 WHERE sha256 = NEW.content_sha256;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS maintain_stored_file_refs_trigger ON invoice_images;
+CREATE TRIGGER maintain_stored_file_refs_trigger AFTER INSERT OR DELETE OR UPDATE OF content_sha256 ON invoice_images FOR EACH ROW EXECUTE FUNCTION maintain_stored_file_refs();
+
+-- Recount in case the migration is re-run over existing references
+UPDATE stored_files sf SET ref_count = (
+    SELECT COUNT(*) FROM invoice_images im WHERE im.content_sha256 = sf.sha256
+);
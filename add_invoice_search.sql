@@ -0,0 +1,15 @@
+-- Full-text search for GET /api/invoices/search (invoice number, notes, OCR text, student name)
+
+-- Search document for an invoice's own text; shared by idx_invoices_search and /api/invoices/search
+CREATE OR REPLACE FUNCTION invoice_search_document(invoice_number TEXT, notes TEXT, physical_invoice_notes TEXT) 
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', COALESCE(invoice_number, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(notes, '')), 'C')
+        || setweight(to_tsvector('simple', COALESCE(physical_invoice_notes, '')), 'C')
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE INDEX IF NOT EXISTS idx_invoices_search ON invoices USING GIN (invoice_search_document(invoice_number, notes, physical_invoice_notes));
+CREATE INDEX IF NOT EXISTS idx_invoice_images_ocr_search ON invoice_images USING GIN (to_tsvector('simple', COALESCE(ocr_text, '')));
+CREATE INDEX IF NOT EXISTS idx_students_name_search ON students USING GIN (to_tsvector('simple', COALESCE(name, '')));
+
+SELECT 'Invoice search indexes added successfully!' as message;
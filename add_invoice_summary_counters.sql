@@ -0,0 +1,76 @@
+-- Invoice summary counters for the analytics endpoints
+
+-- Incrementally maintained invoice counters read by /api/invoices/analytics/*
+-- dimension: all | status | type | month (YYYY-MM of created_at) | acknowledged |
+--            physical_captured | issued_due (YYYY-MM-DD of due_date, issued invoices only)
+CREATE TABLE IF NOT EXISTS invoice_summary_counters (
+    dimension VARCHAR(30) NOT NULL,
+    bucket VARCHAR(100) NOT NULL,
+    invoice_count BIGINT NOT NULL DEFAULT 0,
+    total_value DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dimension, bucket)
+);
+
+-- Add (sign = 1) or remove (sign = -1) one invoice row from the summary counters
+CREATE OR REPLACE FUNCTION apply_invoice_summary_delta(inv invoices, sign INTEGER) 
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO invoice_summary_counters AS c (dimension, bucket, invoice_count, total_value)
+    SELECT k.dimension, k.bucket, sign, sign * COALESCE(inv.total_value, 0)
+    FROM (VALUES
+        ('all', 'all'),
+        ('status', COALESCE(inv.status, 'unknown')),
+        ('type', COALESCE(inv.invoice_type, 'unknown')),
+        ('month', TO_CHAR(inv.created_at, 'YYYY-MM')),
+        ('acknowledged', CASE WHEN inv.acknowledged_by_student THEN 'true' END),
+        ('physical_captured', CASE WHEN inv.physical_invoice_captured THEN 'true' END),
+        ('issued_due', CASE WHEN inv.status = 'issued' THEN TO_CHAR(inv.due_date, 'YYYY-MM-DD') END)
+    ) AS k(dimension, bucket)
+    WHERE k.bucket IS NOT NULL
+    ON CONFLICT (dimension, bucket) DO UPDATE SET
+        invoice_count = c.invoice_count + EXCLUDED.invoice_count,
+        total_value = c.total_value + EXCLUDED.total_value,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_invoice_summary() 
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_invoice_summary_delta(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_invoice_summary_delta(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS maintain_invoice_summary_trigger ON invoices;
+CREATE TRIGGER maintain_invoice_summary_trigger AFTER INSERT OR DELETE OR UPDATE OF status, invoice_type, created_at, due_date, total_value, acknowledged_by_student, physical_invoice_captured ON invoices FOR EACH ROW EXECUTE FUNCTION maintain_invoice_summary();
+
+BEGIN;
+LOCK TABLE invoices IN SHARE MODE;
+-- Backfill from the current invoices
+DELETE FROM invoice_summary_counters;
+INSERT INTO invoice_summary_counters (dimension, bucket, invoice_count, total_value)
+SELECT k.dimension, k.bucket, COUNT(*), COALESCE(SUM(i.total_value), 0)
+FROM invoices i
+CROSS JOIN LATERAL (VALUES
+    ('all', 'all'),
+    ('status', COALESCE(i.status, 'unknown')),
+    ('type', COALESCE(i.invoice_type, 'unknown')),
+    ('month', TO_CHAR(i.created_at, 'YYYY-MM')),
+    ('acknowledged', CASE WHEN i.acknowledged_by_student THEN 'true' END),
+    ('physical_captured', CASE WHEN i.physical_invoice_captured THEN 'true' END),
+    ('issued_due', CASE WHEN i.status = 'issued' THEN TO_CHAR(i.due_date, 'YYYY-MM-DD') END)
+) AS k(dimension, bucket)
+WHERE k.bucket IS NOT NULL
+GROUP BY k.dimension, k.bucket;
+COMMIT;
+
+COMMENT ON TABLE invoice_summary_counters IS 'Invoice counts and values by status, type, month and due date, kept current by trigger';
+
+SELECT 'Invoice summary counters added successfully!' as message;
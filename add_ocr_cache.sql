@@ -0,0 +1,36 @@
+-- OCR result cache keyed by file content and OCR configuration version
+
+-- Replaces stored_files.ocr_text: entries also cover files OCR'd without being
+-- stored (/ocr/extract), carry the parsed invoice fields, and are evicted
+-- least recently used first by the nightly scheduler job
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    sha256 CHAR(64) NOT NULL,
+    config_version INTEGER NOT NULL,
+    ocr_text TEXT NOT NULL,
+    extracted_data JSONB,
+    confidence_score REAL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sha256, config_version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_accessed ON ocr_cache(last_accessed_at);
+
+-- Carry over text cached on stored_files (produced by OCR configuration version 1)
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'stored_files' AND column_name = 'ocr_text'
+    ) THEN
+        INSERT INTO ocr_cache (sha256, config_version, ocr_text, created_at, last_accessed_at)
+        SELECT sha256, 1, ocr_text, ocr_processed_at, ocr_processed_at
+        FROM stored_files
+        WHERE ocr_processed_at IS NOT NULL AND COALESCE(TRIM(ocr_text), '') <> ''
+        ON CONFLICT (sha256, config_version) DO NOTHING;
+    END IF;
+END $$;
+
+ALTER TABLE stored_files DROP COLUMN IF EXISTS ocr_text;
+ALTER TABLE stored_files DROP COLUMN IF EXISTS ocr_processed_at;
@@ -0,0 +1,22 @@
+-- Background OCR jobs for invoice uploads
+
+-- One row per queued extraction; clients poll it through GET /api/invoices/ocr/jobs/{id}
+-- content_sha256 has no foreign key so the upload store cleanup is never blocked by old jobs
+CREATE TABLE IF NOT EXISTS ocr_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    image_id UUID REFERENCES invoice_images(id) ON DELETE CASCADE,
+    content_sha256 CHAR(64),
+    file_path TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'completed', 'failed')),
+    progress SMALLINT NOT NULL DEFAULT 0,
+    ocr_text TEXT,
+    extracted_data JSONB,
+    confidence_score REAL,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Unfinished jobs are re-queued on server startup
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_unfinished ON ocr_jobs(created_at) WHERE status IN ('queued', 'processing');
@@ -0,0 +1,24 @@
+-- Specification filters and facets for products
+
+-- GIN index for ?spec.<key>=<value> containment filters (specifications @> '{"voltage": "5V"}')
+CREATE INDEX IF NOT EXISTS idx_products_specifications ON products USING GIN (specifications jsonb_path_ops);
+
+-- Facet counts per specification key/value, refreshed periodically by the backend scheduler
+CREATE MATERIALIZED VIEW IF NOT EXISTS product_spec_facets AS
+SELECT spec.key AS spec_key,
+       spec.value #>> '{}' AS spec_value,
+       COUNT(*) AS product_count,
+       CURRENT_TIMESTAMP AS refreshed_at
+FROM products p
+CROSS JOIN LATERAL jsonb_each(p.specifications) AS spec
+WHERE p.status = 'active'
+  AND jsonb_typeof(p.specifications) = 'object'
+  AND jsonb_typeof(spec.value) IN ('string', 'number', 'boolean')
+GROUP BY spec.key, spec.value #>> '{}';
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_spec_facets_key_value ON product_spec_facets(spec_key, spec_value);
+
+COMMENT ON MATERIALIZED VIEW product_spec_facets IS 'Product counts per specification key/value for filter facets';
+
+SELECT 'Product specification filters added successfully!' as message;
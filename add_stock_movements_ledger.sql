@@ -0,0 +1,122 @@
+-- Inventory movement ledger and balance snapshots
+
+-- Append-only ledger of every change to products.quantity_available
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id BIGSERIAL PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    movement_type VARCHAR(30) NOT NULL,  -- opening, order, order_approval, order_cancel, return, adjustment, manual
+    quantity_change INTEGER NOT NULL,
+    balance_after INTEGER NOT NULL,
+    reference_type VARCHAR(50),
+    reference_id UUID,
+    reason TEXT,
+    performed_by VARCHAR(200),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- Periodic per-product balances; history at time T = latest snapshot before T + ledger tail
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity_available INTEGER NOT NULL,
+    quantity_total INTEGER NOT NULL,
+    last_movement_id BIGINT NOT NULL DEFAULT 0,
+    snapshot_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_product_time ON stock_movements(product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_snapshots_product_time ON stock_snapshots(product_id, snapshot_at DESC);
+
+CREATE OR REPLACE FUNCTION prevent_stock_movement_update() 
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'stock_movements is append-only; record a correcting movement instead';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stock_movements_append_only ON stock_movements;
+CREATE TRIGGER stock_movements_append_only BEFORE UPDATE ON stock_movements FOR EACH ROW EXECUTE FUNCTION prevent_stock_movement_update();
+
+-- Order, approval, return and cancel stock changes made by the order_items trigger are recorded in the ledger
+CREATE OR REPLACE FUNCTION update_product_quantity() 
+RETURNS TRIGGER AS $$
+DECLARE
+    new_balance INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE products 
+        SET quantity_available = quantity_available - NEW.quantity_approved
+        WHERE id = NEW.product_id
+        RETURNING quantity_available INTO new_balance;
+        
+        INSERT INTO product_transactions (
+            product_id, transaction_type, quantity_change, 
+            quantity_before, quantity_after, reference_type, reference_id
+        )
+        SELECT 
+            NEW.product_id, 'stock_out', -NEW.quantity_approved,
+            p.quantity_available + NEW.quantity_approved,
+            p.quantity_available,
+            'order', NEW.order_id
+        FROM products p WHERE p.id = NEW.product_id;
+        
+        IF NEW.quantity_approved <> 0 THEN
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'order', -NEW.quantity_approved, new_balance, 'order', NEW.order_id);
+        END IF;
+        
+        RETURN NEW;
+    END IF;
+    
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.quantity_approved != NEW.quantity_approved THEN
+            UPDATE products 
+            SET quantity_available = quantity_available + OLD.quantity_approved - NEW.quantity_approved
+            WHERE id = NEW.product_id
+            RETURNING quantity_available INTO new_balance;
+            
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'order_approval', OLD.quantity_approved - NEW.quantity_approved, new_balance, 'order', NEW.order_id);
+        END IF;
+        
+        IF OLD.quantity_returned != NEW.quantity_returned THEN
+            UPDATE products 
+            SET quantity_available = quantity_available + (NEW.quantity_returned - OLD.quantity_returned)
+            WHERE id = NEW.product_id
+            RETURNING quantity_available INTO new_balance;
+            
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'return', NEW.quantity_returned - OLD.quantity_returned, new_balance, 'order', NEW.order_id);
+        END IF;
+        
+        RETURN NEW;
+    END IF;
+    
+    IF TG_OP = 'DELETE' THEN
+        UPDATE products 
+        SET quantity_available = quantity_available + OLD.quantity_approved - OLD.quantity_returned
+        WHERE id = OLD.product_id
+        RETURNING quantity_available INTO new_balance;
+        
+        IF OLD.quantity_approved - OLD.quantity_returned <> 0 AND new_balance IS NOT NULL THEN
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (OLD.product_id, 'order_cancel', OLD.quantity_approved - OLD.quantity_returned, new_balance, 'order', OLD.order_id);
+        END IF;
+        
+        RETURN OLD;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Opening snapshot so history starts from today's balances
+INSERT INTO stock_snapshots (product_id, quantity_available, quantity_total, last_movement_id)
+SELECT p.id, p.quantity_available, p.quantity_total, COALESCE((SELECT MAX(id) FROM stock_movements), 0)
+FROM products p
+WHERE NOT EXISTS (SELECT 1 FROM stock_snapshots ss WHERE ss.product_id = p.id);
+
+COMMENT ON TABLE stock_movements IS 'Append-only ledger of product stock changes';
+COMMENT ON TABLE stock_snapshots IS 'Periodic per-product stock balances for historical queries';
+
+SELECT 'Stock movement ledger added successfully!' as message;
@@ -0,0 +1,60 @@
+"""
+Per-document timing of the OCR invoice parser over the golden corpus.
+
+Logging stays configured as in the server (file handlers included) since log
+formatting is part of the per-document cost; console output is discarded while
+timing. Pass another module that defines parse_text_simple, e.g. a copy of an
+older parser, to compare against it.
+
+Usage: python benchmark_invoice_text_parser.py [--rounds N] [--module NAME]
+"""
+import argparse
+import importlib
+import logging
+import os
+import random
+import statistics
+import time
+
+from test_invoice_text_parser import documents
+
+
+def time_document(parse, text: str, rounds: int) -> float:
+    """Median seconds per parse of one document"""
+    timings = []
+    for _ in range(rounds):
+        random.seed(0)
+        start = time.perf_counter()
+        parse(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--module", default="invoice_text_parser")
+    args = parser.parse_args()
+
+    parse = importlib.import_module(args.module).parse_text_simple
+
+    with open(os.devnull, "w") as devnull:
+        console_handlers = [
+            handler for handler in logging.getLogger().handlers
+            if type(handler) is logging.StreamHandler
+        ]
+        streams = [handler.setStream(devnull) for handler in console_handlers]
+        try:
+            results = [(document.name, time_document(parse, document.read_text(), args.rounds)) for document in documents()]
+        finally:
+            for handler, stream in zip(console_handlers, streams):
+                handler.setStream(stream)
+
+    for name, seconds in results:
+        print(f"{name:32} {seconds * 1000:8.3f} ms")
+    total = sum(seconds for _, seconds in results)
+    print(f"{'mean per document':32} {total / len(results) * 1000:8.3f} ms  ({args.module}, {args.rounds} rounds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+OCR speed and accuracy over the labeled uploads corpus.
+
+Runs the full pipeline (ocr_service.extract_text_from_image, then
+invoice_text_parser.parse_text_simple) in this process, with the local Tesseract
+and no database, over every distinct file in the uploads directory that has a
+label in test_data/ocr_corpus/labels.json. Labels are keyed by the SHA-256 of
+the file, so re-uploads of the same invoice are measured once.
+
+Reported:
+  latency p50/p95     wall time per document over the timed rounds
+  CPU seconds         per document, including tesseract child processes
+  peak memory         largest Python heap peak of one document (tracemalloc,
+                      which sees NumPy arrays but not Pillow's buffers) and the
+                      peak RSS of the run where the platform reports it
+  accuracy            student name and ID: share of documents read exactly
+                      (IDs compared without separators); items: precision and
+                      recall of item names against the labels
+
+The first round measures memory and accuracy, the --rounds after it latency and
+CPU without tracemalloc overhead. Results are compared with the saved baseline
+when there is one; baselines are only comparable on the same machine and
+Tesseract version.
+
+To label a new invoice, add its SHA-256 (sha256sum <file>) to labels.json with
+the values printed on it.
+
+Usage: python benchmark_ocr.py [--rounds N] [--uploads DIR] [--save-baseline] [--fail-on-regression]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import ocr_service
+from invoice_text_parser import parse_text_simple
+
+BACKEND_DIR = Path(__file__).resolve().parent
+CORPUS_DIR = BACKEND_DIR / "test_data" / "ocr_corpus"
+LABELS_PATH = CORPUS_DIR / "labels.json"
+BASELINE_PATH = CORPUS_DIR / "baseline.json"
+DEFAULT_UPLOADS_DIR = BACKEND_DIR / "uploads" / "invoices"
+
+# metric: True when higher is better
+METRICS = {
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "cpu_seconds_per_document": False,
+    "peak_python_memory_mb": False,
+    "peak_rss_mb": False,
+    "student_name_accuracy": True,
+    "student_id_accuracy": True,
+    "items_precision": True,
+    "items_recall": True,
+}
+# Relative slowdown or memory growth reported as a regression; any accuracy drop is one
+PERFORMANCE_TOLERANCE = 0.10
+
+
+def normalize_text(value: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", (value or "").casefold()))
+
+
+def normalize_id(value: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", (value or "").upper())
+
+
+def load_corpus(uploads_dir: Path) -> List[dict]:
+    """One entry per distinct labeled file in uploads_dir"""
+    labels = json.loads(LABELS_PATH.read_text())
+    corpus = {}
+    for path in sorted(uploads_dir.iterdir()):
+        if not path.is_file():
+            continue
+        sha256 = hashlib.sha256(path.read_bytes()).hexdigest()
+        if sha256 in labels and sha256 not in corpus:
+            corpus[sha256] = {"sha256": sha256, "path": path, "label": labels[sha256]}
+    missing = len(labels) - len(corpus)
+    if missing:
+        print(f"{missing} labeled files are not in {uploads_dir}", file=sys.stderr)
+    return list(corpus.values())
+
+
+def run_pipeline(path: Path) -> dict:
+    random.seed(0)  # parse_text_simple gives unlabeled items random SKUs
+    return parse_text_simple(ocr_service.extract_text_from_image(str(path)))
+
+
+def score(extracted: dict, label: dict) -> dict:
+    expected_items = {normalize_text(name) for name in label["items"]}
+    found_items = {normalize_text(item.get("name", "")) for item in extracted.get("items", [])}
+    return {
+        "student_name": normalize_text(extracted.get("student_name")) == normalize_text(label["student_name"]),
+        "student_id": normalize_id(extracted.get("student_id")) == normalize_id(label["student_id"]),
+        "items_expected": len(expected_items),
+        "items_found": len(found_items),
+        "items_correct": len(expected_items & found_items),
+    }
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process and its finished children (pytesseract runs tesseract as a child)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak * unit / (1024 * 1024)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(corpus: List[dict], rounds: int) -> dict:
+    documents = []
+    tracemalloc.start()
+    for entry in corpus:
+        tracemalloc.reset_peak()
+        extracted = run_pipeline(entry["path"])
+        _, peak = tracemalloc.get_traced_memory()
+        documents.append({
+            "sha256": entry["sha256"],
+            "file": entry["path"].name,
+            "peak_python_memory_mb": peak / (1024 * 1024),
+            "extracted": {
+                "student_name": extracted.get("student_name", ""),
+                "student_id": extracted.get("student_id", ""),
+                "items": [item.get("name", "") for item in extracted.get("items", [])],
+            },
+            **score(extracted, entry["label"]),
+        })
+    tracemalloc.stop()
+
+    latencies, cpu_per_document = [], []
+    for _ in range(rounds):
+        for entry in corpus:
+            cpu_start, start = cpu_seconds(), time.perf_counter()
+            run_pipeline(entry["path"])
+            latencies.append(time.perf_counter() - start)
+            cpu_per_document.append(cpu_seconds() - cpu_start)
+
+    items_expected = sum(doc["items_expected"] for doc in documents)
+    items_found = sum(doc["items_found"] for doc in documents)
+    items_correct = sum(doc["items_correct"] for doc in documents)
+    metrics = {
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        "cpu_seconds_per_document": statistics.mean(cpu_per_document),
+        "peak_python_memory_mb": max(doc["peak_python_memory_mb"] for doc in documents),
+        "peak_rss_mb": peak_rss_mb(),
+        "student_name_accuracy": sum(doc["student_name"] for doc in documents) / len(documents),
+        "student_id_accuracy": sum(doc["student_id"] for doc in documents) / len(documents),
+        "items_precision": items_correct / items_found if items_found else 0.0,
+        "items_recall": items_correct / items_expected if items_expected else 0.0,
+    }
+    return {
+        "metrics": metrics,
+        "documents": documents,
+        "environment": environment(),
+        "rounds": rounds,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def environment() -> Dict[str, str]:
+    engine = ocr_service.get_ocr_engine()
+    tesseract_version = ""
+    if ocr_service.pytesseract is not None:
+        try:
+            tesseract_version = str(ocr_service.pytesseract.get_tesseract_version())
+        except Exception:
+            pass
+    return {
+        "ocr_engine": engine.name,
+        "tesseract_version": tesseract_version,
+        "ocr_config_version": str(ocr_service.OCR_CONFIG_VERSION),
+        "ocr_candidate_threads": str(ocr_service.OCR_CANDIDATE_THREADS),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """Print current metrics next to the baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'metric':28} {'baseline':>12} {'current':>12} {'change':>10}")
+    for metric, higher_is_better in METRICS.items():
+        old, new = baseline["metrics"].get(metric), current["metrics"].get(metric)
+        if old is None or new is None:
+            print(f"{metric:28} {_format(old):>12} {_format(new):>12}")
+            continue
+        if higher_is_better:
+            change = f"{new - old:+.3f}"
+            regressed = new < old
+        else:
+            change = f"{(new - old) / old:+.1%}" if old else ""
+            regressed = bool(old) and new > old * (1 + PERFORMANCE_TOLERANCE)
+        print(f"{metric:28} {_format(old):>12} {_format(new):>12} {change:>10}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(metric)
+
+    changed = [
+        doc["file"] for doc, old_doc in _paired_documents(current, baseline)
+        if doc["extracted"] != old_doc["extracted"]
+    ]
+    if changed:
+        print(f"\nExtracted fields changed for: {', '.join(changed)}")
+    if baseline.get("environment") != current["environment"]:
+        print("\nNote: baseline was recorded in a different environment:", baseline.get("environment"))
+    return regressions
+
+
+def _paired_documents(current: dict, baseline: dict):
+    previous = {doc["sha256"]: doc for doc in baseline.get("documents", [])}
+    return [(doc, previous[doc["sha256"]]) for doc in current["documents"] if doc["sha256"] in previous]
+
+
+def _format(value) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_report(results: dict):
+    print(f"{'document':40} {'name':>5} {'id':>5} {'items':>8} {'peak MB':>8}")
+    for doc in results["documents"]:
+        print(
+            f"{doc['file']:40} {'ok' if doc['student_name'] else '-':>5} {'ok' if doc['student_id'] else '-':>5} "
+            f"{doc['items_correct']:>3}/{doc['items_expected']:<4} {doc['peak_python_memory_mb']:>8.1f}"
+        )
+    print()
+    for metric, value in results["metrics"].items():
+        print(f"{metric:28} {_format(value):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3, help="timed passes over the corpus")
+    parser.add_argument("--uploads", type=Path, default=DEFAULT_UPLOADS_DIR)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if a metric regressed")
+    parser.add_argument("--output", type=Path, help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if not ocr_service.OCR_AVAILABLE:
+        sys.exit("OCR libraries are not available (pytesseract/tesserocr, Pillow, NumPy)")
+
+    corpus = load_corpus(args.uploads)
+    if not corpus:
+        sys.exit(f"No labeled files found in {args.uploads}")
+
+    ocr_service.get_ocr_engine()  # Engine start-up is not part of any document
+    results = measure(corpus, args.rounds)
+    print(f"{len(corpus)} documents, {args.rounds} timed rounds, engine {results['environment']['ocr_engine']}\n")
+    print_report(results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+    regressions = []
+    if args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()))
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(f"\nRegressed: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+HTTP file responses with validators, conditional requests and byte ranges.
+
+Full responses go through Starlette's FileResponse, which hands the file to the
+server's zero-copy send where the ASGI server supports it. Validators and the
+conditional and range handling are done here rather than left to FileResponse
+so that they key off the content's own hash: ETags are the SHA-256 of stored
+content, which is what lets it be cached as immutable, and every file served,
+whether an original upload or a generated image variant, goes through the same
+304 (If-None-Match), 206/416 (single byte ranges, honouring If-Range) path
+whatever the installed Starlette version does itself.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+from typing import Iterator, Optional
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """(start, end) inclusive for a single satisfiable range, None for an unsupported header
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None  # Multiple ranges or other units: answer with the full file
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(
+    request: Request,
+    path: Path,
+    media_type: Optional[str] = None,
+    etag: Optional[str] = None,
+    immutable: bool = False,
+    filename: Optional[str] = None,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """Respond with a file, answering conditional and range requests
+
+    etag should identify the content (e.g. its SHA-256); without one it is
+    derived from size and modification time.
+    """
+    stat = os.stat(path)
+    media_type = media_type or mimetypes.guess_type(str(path))[0]
+    etag = f'"{etag}"' if etag else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control or (IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL),
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if byte_range:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                "Content-Length": str(end - start + 1),
+            })
+            return StreamingResponse(
+                _read_range(path, start, end), status_code=206,
+                media_type=media_type, headers=headers
+            )
+
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Thumbnail and web-preview generation for uploaded invoice images
+
+Uploads are full-resolution phone photos, but grid views only need a small
+thumbnail and the image viewer a screen-sized preview. After each upload the
+missing variants are written as WebP by a ProcessPoolExecutor, off the request
+path, and served by GET /api/invoices/images/{id}?size=thumb|preview.
+
+Like invoice_renderer, worker processes only import this module (Pillow, no
+database or FastAPI).
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant
+VARIANT_SIZES = {"thumb": 320, "preview": 1280}
+VARIANT_MEDIA_TYPE = "image/webp"
+VARIANT_DIR = Path(os.getenv(
+    'IMAGE_VARIANT_DIR',
+    Path(__file__).resolve().parent / "uploads" / "variants"
+))
+VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
+# Formats Pillow can decode; PDFs and other documents are served as-is
+VARIANT_SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending: set = set()
+
+
+def variant_path(key: str, size: str) -> Path:
+    """File for one variant of an image; key is the content hash, or the image id for older uploads"""
+    return VARIANT_DIR / key[:2] / f"{key}_{size}.webp"
+
+
+def _write_variants(source_path: str, targets: Dict[str, str]) -> List[str]:
+    """Worker: decode the source once and write each requested size, largest first"""
+    sizes = sorted(targets, key=lambda size: VARIANT_SIZES[size], reverse=True)
+    largest = VARIANT_SIZES[sizes[0]]
+
+    with Image.open(source_path) as image:
+        # JPEG decoders can scale down while decoding, which is much cheaper than a full decode
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+
+        written = []
+        for size in sizes:
+            edge = VARIANT_SIZES[size]
+            # Each smaller size is scaled from the previous one rather than the original
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            target = Path(targets[size])
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = target.with_name(target.name + ".tmp")
+            image.save(temp_path, "WEBP", quality=VARIANT_QUALITY, method=4)
+            os.replace(temp_path, target)
+            written.append(size)
+    return written
+
+
+def get_variant_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+        logger.info(f"Image variant pool started with {VARIANT_WORKERS} workers")
+    return _executor
+
+
+def shutdown_variant_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def missing_variants(key: str, sizes: Iterable[str]) -> Dict[str, str]:
+    return {
+        size: str(variant_path(key, size))
+        for size in sizes
+        if not variant_path(key, size).exists()
+    }
+
+
+def schedule_variants(source_path: Path, key: str, sizes: Iterable[str]) -> Optional[Future]:
+    """Queue generation of the variants an image is missing and return immediately"""
+    source_path = Path(source_path)
+    if source_path.suffix.lower() not in VARIANT_SOURCE_EXTENSIONS or key in _pending:
+        return None
+    targets = missing_variants(key, sizes)
+    if not targets:
+        return None
+
+    _pending.add(key)
+    future = get_variant_executor().submit(_write_variants, str(source_path), targets)
+
+    def _done(finished: Future):
+        _pending.discard(key)
+        if finished.exception():
+            logger.warning(f"Failed to build image variants for {source_path}: {finished.exception()}")
+
+    future.add_done_callback(_done)
+    return future
+
+
+async def generate_variants_bulk(images: List[Tuple[Path, str]], sizes: Iterable[str]) -> Dict[str, int]:
+    """Build missing variants for many (source_path, key) pairs; used to backfill older uploads"""
+    sizes = list(sizes)
+    futures = []
+    skipped = 0
+    for source_path, key in images:
+        future = schedule_variants(source_path, key, sizes)
+        if future is None:
+            skipped += 1
+        else:
+            futures.append(asyncio.wrap_future(future))
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    failed = sum(1 for result in results if isinstance(result, BaseException))
+    return {"queued": len(futures), "generated": len(futures) - failed, "failed": failed, "skipped": skipped}
@@ -7,11 +7,13 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
 import uuid
+import os
 import time
 import json
 import requests
 import psycopg2
-from database_manager import get_db, DatabaseManager
+from psycopg2.extras import execute_values
+from database_manager import get_db, job_db, DatabaseManager, resolve_projection, parse_id_list
 from logging_config import api_logger, main_logger, db_logger, log_performance
 import logging
 
@@ -27,13 +29,16 @@ except ImportError as e:
 
 # Try to import invoice_router with error handling
 try:
-    from invoice_api import invoice_router
+    from invoice_api import invoice_router, invalidate_invoice_cache
     from auto_invoice_service import auto_generate_invoice_for_order
     INVOICE_MODULE_LOADED = True
 except ImportError as e:
     print(f"Warning: Could not import invoice_api: {e}")
     INVOICE_MODULE_LOADED = False
     invoice_router = None
+    
+    def invalidate_invoice_cache(invoice_id=None):
+        pass
 
 app = FastAPI(title="Inventory Management API", version="1.0.0")
 
@@ -78,6 +83,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Logging middleware
@@ -193,6 +199,147 @@ class Product(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+class ProductSummary(BaseModel):
+    """Sparse product row for list endpoints - only the columns asked for via ?fields="""
+    id: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    category_id: Optional[str] = None
+    category_name: Optional[str] = None
+    sku: Optional[str] = None
+    quantity_total: Optional[int] = None
+    quantity_available: Optional[int] = None
+    is_returnable: Optional[bool] = None
+    unit_price: Optional[float] = None
+    location: Optional[str] = None
+    minimum_stock_level: Optional[int] = None
+    image_url: Optional[str] = None
+    specifications: Optional[Dict[str, Any]] = None
+    tags: Optional[List[str]] = None
+    status: Optional[str] = None
+    date_of_purchase: Optional[date] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class StockAdjustmentLine(BaseModel):
+    sku: str
+    delta: Optional[int] = None     # Relative change, e.g. -2 for two damaged units
+    count: Optional[int] = None     # Absolute on-shelf count from a stock-take
+    reason: Optional[str] = None
+
+class StockAdjustmentRequest(BaseModel):
+    adjustments: List[StockAdjustmentLine]
+    reason: Optional[str] = None    # Default reason for lines without one
+    performed_by: Optional[str] = "system"
+
+# Column projections for product lists; heavy columns are only loaded on request
+PRODUCT_COLUMNS = {
+    'id': 'p.id',
+    'name': 'p.name',
+    'description': 'p.description',
+    'category_id': 'p.category_id',
+    'category_name': 'c.name',
+    'sku': 'p.sku',
+    'quantity_total': 'p.quantity_total',
+    'quantity_available': 'p.quantity_available',
+    'is_returnable': 'p.is_returnable',
+    'unit_price': 'p.unit_price',
+    'location': 'p.location',
+    'minimum_stock_level': 'p.minimum_stock_level',
+    'image_url': 'p.image_url',
+    'specifications': 'p.specifications',
+    'tags': 'p.tags',
+    'status': 'p.status',
+    'date_of_purchase': 'p.date_of_purchase',
+    'created_at': 'p.created_at',
+    'updated_at': 'p.updated_at',
+}
+PRODUCT_HEAVY_COLUMNS = ['description', 'specifications']
+PRODUCT_SUMMARY_COLUMNS = [name for name in PRODUCT_COLUMNS if name not in PRODUCT_HEAVY_COLUMNS]
+
+# Product list filters of the form ?spec.voltage=5V are matched against the
+# specifications JSONB column with containment (@>) so idx_products_specifications
+# (GIN, jsonb_path_ops) can serve them
+SPEC_FILTER_PREFIX = 'spec.'
+SPEC_FACETS_REFRESH_MINUTES = int(os.getenv('SPEC_FACETS_REFRESH_MINUTES', 15))
+
+def parse_spec_filters(query_params) -> List[List[Dict[str, Any]]]:
+    """Turn spec.<key>=<value> query parameters into containment documents.
+    
+    Each filter yields the alternatives it may match: the value as a string and,
+    when it also parses as a JSON number/boolean, that typed value too, since
+    specifications are entered both ways ("5" vs 5).
+    """
+    filters = []
+    for name, value in query_params.multi_items():
+        if not name.startswith(SPEC_FILTER_PREFIX):
+            continue
+        key = name[len(SPEC_FILTER_PREFIX):].strip()
+        if not key:
+            raise HTTPException(status_code=400, detail=f"Invalid specification filter: {name}")
+        
+        alternatives = [{key: value}]
+        try:
+            typed_value = json.loads(value)
+        except ValueError:
+            typed_value = None
+        if isinstance(typed_value, (int, float, bool)):
+            alternatives.append({key: typed_value})
+        filters.append(alternatives)
+    return filters
+
+def refresh_product_spec_facets(db: Optional[DatabaseManager] = None) -> bool:
+    """Rebuild product_spec_facets, the per key/value product counts behind
+    /api/products/spec-facets. Called on startup and by the scheduler.
+    
+    The view itself is created by add_product_spec_filters.sql.
+    """
+    try:
+        with job_db(db) as job_connection:
+            job_connection.execute_command("REFRESH MATERIALIZED VIEW CONCURRENTLY product_spec_facets")
+        api_logger.info("Product specification facets refreshed")
+        return True
+    except Exception as e:
+        api_logger.error(f"Failed to refresh product specification facets: {e}")
+        return False
+
+# Stock ledger: every change to quantity_available is appended to stock_movements
+# (order item approvals/returns/cancels are recorded by the update_product_quantity
+# trigger), and stock_snapshots holds periodic balances for historical lookups
+STOCK_SNAPSHOT_HOUR = int(os.getenv('STOCK_SNAPSHOT_HOUR', 1))
+
+def record_stock_movements(cursor, movements: List[tuple]):
+    """Append ledger rows inside the caller's transaction.
+    
+    Each movement is (product_id, movement_type, quantity_change, balance_after,
+    reference_type, reference_id, reason, performed_by).
+    """
+    movements = [movement for movement in movements if movement[2] != 0]
+    if not movements:
+        return
+    execute_values(cursor, """
+    INSERT INTO stock_movements (
+        product_id, movement_type, quantity_change, balance_after,
+        reference_type, reference_id, reason, performed_by
+    ) VALUES %s
+    """, movements, template="(%s::uuid, %s, %s, %s, %s, %s::uuid, %s, %s)", page_size=len(movements))
+
+def take_stock_snapshot(db: Optional[DatabaseManager] = None) -> bool:
+    """Store the current balance of every product. Called nightly by the scheduler."""
+    try:
+        with job_db(db) as job_connection:
+            job_connection.execute_command("""
+            INSERT INTO stock_snapshots (product_id, quantity_available, quantity_total, last_movement_id)
+            SELECT p.id, p.quantity_available, p.quantity_total,
+                   COALESCE((SELECT MAX(id) FROM stock_movements), 0)
+            FROM products p
+            """)
+        api_logger.info("Stock balance snapshot taken")
+        return True
+    except Exception as e:
+        api_logger.error(f"Failed to take stock snapshot: {e}")
+        return False
+
 class StudentCreate(BaseModel):
     student_id: Optional[str] = None  # Made optional, can be auto-generated
     name: str
@@ -498,17 +645,57 @@ async def create_category(category: CategoryCreate, db: DatabaseManager = Depend
     
     raise HTTPException(status_code=500, detail="Failed to create category")
 
+# Hot SKU map for barcode scans at the counter (sku -> product row)
+SKU_CACHE_TTL_SECONDS = int(os.getenv('SKU_CACHE_TTL_SECONDS', 30))
+_sku_cache: Dict[str, Dict[str, Any]] = {}
+
+def invalidate_sku_cache(sku: Optional[str] = None):
+    """Drop one SKU, or the whole map, after a write that changes product rows"""
+    if sku is None:
+        _sku_cache.clear()
+    else:
+        _sku_cache.pop(sku, None)
+
 # Product endpoints
-@app.get("/api/products", response_model=List[Product])
+@app.get("/api/products", response_model=List[ProductSummary], response_model_exclude_unset=True)
 async def get_products(
+    request: Request,
     category_id: Optional[str] = None,
     search: Optional[str] = None,
     status: Optional[str] = "active",
+    ids: Optional[str] = None,
+    fields: Optional[str] = "summary",
     db: DatabaseManager = Depends(get_db)
 ):
-    """Get all products with optional filtering"""
-    query = """
-    SELECT p.*, c.name as category_name 
+    """Get all products with optional filtering, or many specific products via ?ids=a,b,c
+    
+    Returns the summary projection by default (no description/specifications);
+    pass fields=all or a comma separated column list for more. Specification
+    filters are given as spec.<key>=<value>, e.g. ?spec.voltage=5V.
+    """
+    projection = resolve_projection(fields, PRODUCT_COLUMNS, PRODUCT_SUMMARY_COLUMNS)
+    
+    if ids is not None:
+        product_ids = parse_id_list(ids)
+        if not product_ids:
+            return []
+        
+        # One round trip for the whole batch instead of N calls to /api/products/{id}
+        query = f"""
+        SELECT {projection}
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = ANY(%s::uuid[])
+        """
+        results = db.execute_query(query, (product_ids,))
+        
+        # Keep the caller's ordering
+        positions = {product_id: index for index, product_id in enumerate(product_ids)}
+        results.sort(key=lambda row: positions.get(str(row['id']), len(positions)))
+        return results
+    
+    query = f"""
+    SELECT {projection}
     FROM products p
     LEFT JOIN categories c ON p.category_id = c.id
     WHERE 1=1
@@ -528,11 +715,117 @@ async def get_products(
         search_param = f"%{search}%"
         params.extend([search_param, search_param, search])
     
+    for alternatives in parse_spec_filters(request.query_params):
+        query += " AND (" + " OR ".join(["p.specifications @> %s::jsonb"] * len(alternatives)) + ")"
+        params.extend(json.dumps(document) for document in alternatives)
+    
     query += " ORDER BY p.name"
     
     results = db.execute_query(query, tuple(params) if params else None)
     return results
 
+@app.get("/api/products/spec-facets")
+async def get_product_spec_facets(key: Optional[str] = None, db: DatabaseManager = Depends(get_db)):
+    """Product counts per specification key/value, from the periodically refreshed summary"""
+    query = """
+    SELECT spec_key, spec_value, product_count, refreshed_at
+    FROM product_spec_facets
+    """
+    params = None
+    if key:
+        query += " WHERE spec_key = %s"
+        params = (key,)
+    query += " ORDER BY spec_key, product_count DESC, spec_value"
+    
+    results = db.execute_query(query, params)
+    
+    facets: Dict[str, List[Dict[str, Any]]] = {}
+    refreshed_at = None
+    for row in results:
+        facets.setdefault(row['spec_key'], []).append({
+            "value": row['spec_value'],
+            "count": row['product_count']
+        })
+        refreshed_at = refreshed_at or row['refreshed_at']
+    
+    return {
+        "facets": facets,
+        "refreshed_at": refreshed_at.isoformat() if refreshed_at else None
+    }
+
+@app.get("/api/products/stock-levels")
+async def get_stock_levels(
+    at: datetime,
+    product_ids: Optional[str] = None,
+    db: DatabaseManager = Depends(get_db)
+):
+    """Stock on the shelf at a point in time
+    
+    Each balance is the latest snapshot taken at or before `at` plus the ledger
+    movements recorded after it, so only a short tail of history is read.
+    quantity_available is null for products with no history that far back.
+    """
+    query = """
+    SELECT p.id as product_id, p.sku, p.name,
+           CASE WHEN s.snapshot_at IS NULL AND tail.quantity_change IS NULL THEN NULL
+                ELSE COALESCE(s.quantity_available, 0) + COALESCE(tail.quantity_change, 0)
+           END as quantity_available,
+           s.snapshot_at
+    FROM products p
+    LEFT JOIN LATERAL (
+        SELECT ss.quantity_available, ss.last_movement_id, ss.snapshot_at
+        FROM stock_snapshots ss
+        WHERE ss.product_id = p.id AND ss.snapshot_at <= %s
+        ORDER BY ss.snapshot_at DESC
+        LIMIT 1
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT SUM(m.quantity_change) as quantity_change
+        FROM stock_movements m
+        WHERE m.product_id = p.id
+          AND m.id > COALESCE(s.last_movement_id, 0)
+          AND m.created_at <= %s
+    ) tail ON true
+    WHERE 1=1
+    """
+    params = [at, at]
+    
+    if product_ids:
+        ids = parse_id_list(product_ids)
+        if not ids:
+            return {"at": at.isoformat(), "products": []}
+        query += " AND p.id = ANY(%s::uuid[])"
+        params.append(ids)
+    
+    query += " ORDER BY p.name"
+    
+    results = db.execute_query(query, tuple(params))
+    return {"at": at.isoformat(), "products": results}
+
+@app.get("/api/products/by-sku/{sku}", response_model=Product)
+async def get_product_by_sku(sku: str, db: DatabaseManager = Depends(get_db)):
+    """Get a product by SKU/barcode, served from the hot SKU map when possible"""
+    sku = sku.strip()
+    cached_entry = _sku_cache.get(sku)
+    if cached_entry and (time.time() - cached_entry['timestamp']) < SKU_CACHE_TTL_SECONDS:
+        return cached_entry['data']
+    
+    # Cache miss - single lookup through idx_products_sku
+    query = """
+    SELECT p.*, c.name as category_name 
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE p.sku = %s
+    """
+    results = db.execute_query(query, (sku,))
+    
+    if not results:
+        invalidate_sku_cache(sku)
+        raise HTTPException(status_code=404, detail=f"Product with SKU '{sku}' not found")
+    
+    _sku_cache[sku] = {'data': results[0], 'timestamp': time.time()}
+    return results[0]
+
 @app.get("/api/products/{product_id}", response_model=Product)
 async def get_product(product_id: str, db: DatabaseManager = Depends(get_db)):
     """Get a specific product"""
@@ -549,6 +842,35 @@ async def get_product(product_id: str, db: DatabaseManager = Depends(get_db)):
     
     return results[0]
 
+@app.get("/api/products/{product_id}/stock-movements")
+async def get_stock_movements(
+    product_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+    db: DatabaseManager = Depends(get_db)
+):
+    """Ledger entries for one product, newest first"""
+    query = """
+    SELECT id, movement_type, quantity_change, balance_after, reference_type,
+           reference_id, reason, performed_by, created_at
+    FROM stock_movements
+    WHERE product_id = %s
+    """
+    params = [product_id]
+    
+    if since:
+        query += " AND created_at >= %s"
+        params.append(since)
+    if until:
+        query += " AND created_at <= %s"
+        params.append(until)
+    
+    query += " ORDER BY id DESC LIMIT %s"
+    params.append(min(max(limit, 1), 1000))
+    
+    return db.execute_query(query, tuple(params))
+
 @app.post("/api/products", response_model=Product)
 async def create_product(product: ProductCreate, db: DatabaseManager = Depends(get_db)):
     """Create a new product"""
@@ -576,43 +898,43 @@ async def create_product(product: ProductCreate, db: DatabaseManager = Depends(g
         product.sku, product.quantity_total, product.quantity_available,
         product.is_returnable, product.unit_price, product.location,
         product.minimum_stock_level, product.image_url,
-        str(specifications_json), tags_array, product.date_of_purchase
+        json.dumps(specifications_json), tags_array, product.date_of_purchase
     )
     
     try:
-        result = db.execute_command(query, params)
-        
-        if result:
-            api_logger.info(f"Product created successfully: {product_id}")
+        # The product, its audit row and its opening ledger movement are written together
+        with db.transaction() as cursor:
+            cursor.execute(query, params)
             
             # Log the stock addition
             if product.quantity_total > 0:
-                transaction_query = """
+                cursor.execute("""
                 INSERT INTO product_transactions (
                     product_id, transaction_type, quantity_change, 
                     quantity_before, quantity_after, reference_type, performed_by
                 ) VALUES (%s, 'stock_in', %s, 0, %s, 'manual', 'system')
-                """
-                db.execute_command(transaction_query, (
-                    product_id, product.quantity_total, product.quantity_available
-                ))
-            
-            # Return the created product
-            query = """
-            SELECT p.*, c.name as category_name 
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            WHERE p.id = %s
-            """
-            results = db.execute_query(query, (product_id,))
-            
-            if not results:
-                raise HTTPException(status_code=404, detail="Product not found")
+                """, (product_id, product.quantity_total, product.quantity_available))
             
-            return results[0]
-        else:
-            api_logger.error("execute_command returned False")
-            raise HTTPException(status_code=400, detail="Product creation failed. This might be due to a duplicate SKU or invalid data.")
+            record_stock_movements(cursor, [(
+                product_id, 'opening', product.quantity_available, product.quantity_available,
+                'manual', None, 'Initial stock', 'system'
+            )])
+        
+        api_logger.info(f"Product created successfully: {product_id}")
+        
+        # Return the created product
+        query = """
+        SELECT p.*, c.name as category_name 
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = %s
+        """
+        results = db.execute_query(query, (product_id,))
+        
+        if not results:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        return results[0]
     
     except Exception as e:
         error_msg = str(e)
@@ -626,6 +948,115 @@ async def create_product(product: ProductCreate, db: DatabaseManager = Depends(g
         else:
             raise HTTPException(status_code=500, detail=f"Failed to create product: {error_msg}")
 
+@app.post("/api/products/stock-adjustments")
+async def apply_stock_adjustments(request: StockAdjustmentRequest, db: DatabaseManager = Depends(get_db)):
+    """Apply a stock-take or batch of corrections in one transaction
+    
+    Each line gives either a delta or an absolute count for a SKU. The affected
+    products are locked, updated with a single UPDATE ... FROM (VALUES ...) and
+    one product_transactions audit row is written per line. Either every line
+    applies or none do.
+    """
+    lines = request.adjustments
+    if not lines:
+        raise HTTPException(status_code=400, detail="No adjustments provided")
+    
+    errors = []
+    seen_skus = set()
+    for index, line in enumerate(lines):
+        line.sku = line.sku.strip()
+        if (line.delta is None) == (line.count is None):
+            errors.append(f"Line {index + 1} ({line.sku}): provide exactly one of delta or count")
+        elif line.count is not None and line.count < 0:
+            errors.append(f"Line {index + 1} ({line.sku}): count cannot be negative")
+        if line.sku in seen_skus:
+            errors.append(f"Line {index + 1} ({line.sku}): SKU appears more than once")
+        seen_skus.add(line.sku)
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "Invalid stock adjustments", "errors": errors})
+    
+    api_logger.info(f"Applying {len(lines)} stock adjustments")
+    
+    try:
+        with db.transaction() as cursor:
+            # Lock the rows first so the before/after values in the audit trail are exact
+            cursor.execute("""
+            SELECT id, sku, quantity_available, quantity_total
+            FROM products
+            WHERE sku = ANY(%s)
+            FOR UPDATE
+            """, (list(seen_skus),))
+            current = {row['sku']: row for row in cursor.fetchall()}
+            
+            missing = [line.sku for line in lines if line.sku not in current]
+            if missing:
+                raise HTTPException(status_code=404, detail={"message": "Unknown SKUs", "skus": missing})
+            
+            updates = []
+            audit_rows = []
+            results = []
+            for line in lines:
+                product = current[line.sku]
+                before = product['quantity_available']
+                change = line.delta if line.delta is not None else line.count - before
+                after = before + change
+                if after < 0:
+                    errors.append(f"{line.sku}: adjustment would leave {after} in stock")
+                    continue
+                new_total = max(product['quantity_total'] + change, after)
+                reason = line.reason or request.reason or 'stock adjustment'
+                
+                updates.append((str(product['id']), after, new_total))
+                audit_rows.append((
+                    str(product['id']), 'adjustment', change, before, after,
+                    'stock_adjustment', reason, request.performed_by, request.performed_by
+                ))
+                results.append({
+                    "sku": line.sku,
+                    "product_id": str(product['id']),
+                    "quantity_before": before,
+                    "quantity_after": after,
+                    "quantity_change": change
+                })
+            if errors:
+                raise HTTPException(status_code=400, detail={"message": "Invalid stock adjustments", "errors": errors})
+            
+            execute_values(cursor, """
+            UPDATE products p
+            SET quantity_available = v.quantity_available,
+                quantity_total = v.quantity_total,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, quantity_available, quantity_total)
+            WHERE p.id = v.id
+            """, updates, template="(%s::uuid, %s::integer, %s::integer)", page_size=len(updates))
+            
+            execute_values(cursor, """
+            INSERT INTO product_transactions (
+                product_id, transaction_type, quantity_change, quantity_before,
+                quantity_after, reference_type, notes, created_by, performed_by
+            ) VALUES %s
+            """, audit_rows, template="(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s)", page_size=len(audit_rows))
+            
+            record_stock_movements(cursor, [
+                (row[0], 'adjustment', row[2], row[4], 'stock_adjustment', None, row[6], row[7])
+                for row in audit_rows
+            ])
+    except HTTPException:
+        raise
+    except Exception as e:
+        api_logger.error(f"Error applying stock adjustments: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to apply stock adjustments: {str(e)}")
+    
+    for sku in seen_skus:
+        invalidate_sku_cache(sku)
+    
+    api_logger.info(f"Applied {len(results)} stock adjustments")
+    return {
+        "success": True,
+        "applied": len(results),
+        "adjustments": results
+    }
+
 @app.put("/api/products/{product_id}", response_model=Product)
 async def update_product(
     product_id: str, 
@@ -645,7 +1076,7 @@ async def update_product(
     for field, value in product_update.dict(exclude_unset=True).items():
         if field == "specifications":
             update_fields.append(f"{field} = %s::jsonb")
-            params.append(str(value) if value else '{}')
+            params.append(json.dumps(value) if value else '{}')
         else:
             update_fields.append(f"{field} = %s")
             params.append(value)
@@ -654,9 +1085,20 @@ async def update_product(
         raise HTTPException(status_code=400, detail="No fields to update")
     
     params.append(product_id)
-    query = f"UPDATE products SET {', '.join(update_fields)} WHERE id = %s"
-    
-    if db.execute_command(query, tuple(params)):
+    query = f"UPDATE products SET {', '.join(update_fields)} WHERE id = %s RETURNING quantity_available"
+    
+    with db.transaction() as cursor:
+        cursor.execute(query, tuple(params))
+        updated = cursor.fetchone()
+        if updated:
+            record_stock_movements(cursor, [(
+                product_id, 'manual',
+                updated['quantity_available'] - existing[0]['quantity_available'],
+                updated['quantity_available'], 'manual', None, 'Product edited', 'system'
+            )])
+    
+    if updated:
+        invalidate_sku_cache(existing[0]['sku'])
         return await get_product(product_id, db)
     
     raise HTTPException(status_code=500, detail="Failed to update product")
@@ -667,6 +1109,7 @@ async def delete_product(product_id: str, db: DatabaseManager = Depends(get_db))
     query = "DELETE FROM products WHERE id = %s"
     
     if db.execute_command(query, (product_id,)):
+        invalidate_sku_cache()
         return {"message": "Product deleted successfully"}
     
     raise HTTPException(status_code=500, detail="Failed to delete product")
@@ -1538,20 +1981,31 @@ async def create_order(order: OrderCreate, db: DatabaseManager = Depends(get_db)
                 api_logger.error(f"Failed to add item {item.product_id} to order {order_id}")
                 raise HTTPException(status_code=500, detail="Failed to add order item")
             
-            # Update product quantity (reduce available stock)
-            new_quantity = product_info['quantity_available'] - item.quantity_requested
+            # Update product quantity (reduce available stock) and record it in the ledger
             update_stock_query = """
             UPDATE products 
-            SET quantity_available = %s, updated_at = CURRENT_TIMESTAMP 
+            SET quantity_available = quantity_available - %s, updated_at = CURRENT_TIMESTAMP 
             WHERE id = %s
+            RETURNING quantity_available
             """
             
-            if not db.execute_command(update_stock_query, (new_quantity, item.product_id)):
-                api_logger.error(f"Failed to update stock for product {item.product_id}")
-                raise HTTPException(status_code=500, detail="Failed to update product stock")
+            with db.transaction() as cursor:
+                cursor.execute(update_stock_query, (item.quantity_requested, item.product_id))
+                updated = cursor.fetchone()
+                if not updated:
+                    api_logger.error(f"Failed to update stock for product {item.product_id}")
+                    raise HTTPException(status_code=500, detail="Failed to update product stock")
+                new_quantity = updated['quantity_available']
+                record_stock_movements(cursor, [(
+                    item.product_id, 'order', -item.quantity_requested, new_quantity,
+                    'order', order_id, None, None
+                )])
             
             api_logger.info(f"Updated stock for '{product_info['name']}': {product_info['quantity_available']} -> {new_quantity}")
         
+        # Stock levels changed, so cached SKU lookups are stale
+        invalidate_sku_cache()
+        
         # Update order total value
         db_logger.info(f"Updating order {order_id} total value to ${total_value}")
         if not db.execute_command(
@@ -1689,6 +2143,7 @@ async def update_order_status(order_id: str, status_update: OrderStatusUpdate, d
         WHERE order_id = %s
         """
         db.execute_command(items_query, (order_id,))
+        invalidate_sku_cache()
         
         # Create invoice if none exists
         existing_invoice_query = """
@@ -1723,6 +2178,7 @@ async def update_order_status(order_id: str, status_update: OrderStatusUpdate, d
             WHERE id = %s
             """
             db.execute_command(update_invoice_query, (invoice_id,))
+            invalidate_invoice_cache(invoice_id)
             invoice_message = f" Updated invoice {invoice_number} status to closed."
     
     api_logger.info(f"Order {order_id} status updated to {status_update.status}")
@@ -1993,6 +2449,7 @@ async def update_order(order_id: str, order_update: OrderUpdate, db: DatabaseMan
                     WHERE id = %s
                     """
                     db.execute_command(update_invoice_query, (invoice_id,))
+                    invalidate_invoice_cache(invoice_id)
                     
                     invoice_message = f" Updated existing invoice {invoice_number}."
                     
@@ -2068,6 +2525,7 @@ async def return_item(
     """
     
     if db.execute_command(query, (quantity, condition, quantity, item_id, order_id)):
+        invalidate_sku_cache()
         return {"message": "Item return recorded successfully"}
     
     raise HTTPException(status_code=400, detail="Failed to record item return")
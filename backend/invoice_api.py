@@ -3,7 +3,7 @@ Invoice Management API Endpoints
 Handles invoice creation, management, and camera upload functionality
 """
 from fastapi import APIRouter, HTTPException, Depends, File, UploadFile, Form, Response, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import uuid
@@ -13,61 +13,29 @@ import os
 import re
 import random
 import io
+import time
+import asyncio
 from pathlib import Path
 import shutil
 
-# OCR imports with robust error handling
-CV2_AVAILABLE = False
-OCR_AVAILABLE = False
-cv2 = None
-pytesseract = None
-np = None
-
-try:
-    # Import basic OCR dependencies first
-    from PIL import Image
-    from dateutil import parser as date_parser
-    
-    # Try importing numpy
-    try:
-        import numpy as np
-        print("NumPy imported successfully")
-    except ImportError as np_error:
-        print(f"NumPy not available: {np_error}")
-        np = None
-    
-    # Try importing tesseract
-    try:
-        import pytesseract
-        # Configure Tesseract path for Windows
-        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        print("Tesseract imported successfully")
-    except ImportError as tess_error:
-        print(f"Tesseract not available: {tess_error}")
-        pytesseract = None
-    
-    # Try importing cv2 last (most problematic)
-    try:
-        import cv2
-        CV2_AVAILABLE = True
-        print("OpenCV imported successfully")
-    except (ImportError, AttributeError) as cv2_error:
-        print(f"OpenCV not available: {cv2_error}")
-        cv2 = None
-    
-    # OCR is available if we have the basic tools
-    if pytesseract is not None:
-        OCR_AVAILABLE = True
-        print("OCR libraries loaded successfully")
-    else:
-        print("OCR not available - missing tesseract")
-        
-except ImportError as e:
-    print(f"OCR libraries not available: {e}")
-
-from database_manager import get_db, DatabaseManager
+from database_manager import get_db, job_db, DatabaseManager, resolve_projection, parse_id_list
 from invoice_models import *
 from logging_config import api_logger
+from invoice_renderer import render_invoices, RENDER_FORMATS
+from upload_store import (
+    read_upload, store_upload, StoredFile, resolve_upload_path
+)
+from file_serving import serve_file
+from image_variants import (
+    VARIANT_SIZES, VARIANT_MEDIA_TYPE, variant_path, schedule_variants, generate_variants_bulk
+)
+from settings_manager import get_settings
+from ocr_service import (
+    OCR_AVAILABLE, CV2_AVAILABLE, OCR_WORKERS, OCR_RETRY_AFTER_SECONDS, OCRQueueFull, OCRTimeout, run_ocr
+)
+from ocr_cache import get_cached_ocr, save_ocr_result
+from invoice_text_parser import parse_text_simple, parse_text_simple_fallback, convert_date_to_iso_format
+from psycopg2.extras import execute_values
 
 # Log OCR availability after logger is imported
 if OCR_AVAILABLE:
@@ -83,7 +51,146 @@ UPLOAD_DIR = Path("uploads/invoices")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf"}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Column projections for list endpoints (?fields=summary|all|col1,col2)
+# Heavy text columns are left out of the default summary and loaded by the detail endpoints
+INVOICE_LIST_COLUMNS = {
+    'id': 'i.id',
+    'invoice_number': 'i.invoice_number',
+    'order_id': 'i.order_id',
+    'student_id': 'i.student_id',
+    'invoice_type': 'i.invoice_type',
+    'status': 'i.status',
+    'total_items': 'i.total_items',
+    'total_value': 'i.total_value',
+    'lending_fee': 'i.lending_fee',
+    'damage_fee': 'i.damage_fee',
+    'replacement_fee': 'i.replacement_fee',
+    'issue_date': 'i.issue_date',
+    'due_date': 'i.due_date',
+    'acknowledgment_date': 'i.acknowledgment_date',
+    'has_physical_copy': 'i.has_physical_copy',
+    'physical_invoice_captured': 'i.physical_invoice_captured',
+    'physical_invoice_image_url': 'i.physical_invoice_image_url',
+    'issued_by': 'i.issued_by',
+    'acknowledged_by_student': 'i.acknowledged_by_student',
+    'lender_id': 'i.lender_id',
+    'issued_by_lender': 'i.issued_by_lender',
+    'created_at': 'i.created_at',
+    'updated_at': 'i.updated_at',
+    'notes': 'i.notes',
+    'physical_invoice_notes': 'i.physical_invoice_notes',
+    'student_signature_url': 'i.student_signature_url',
+    'lending_purpose': 'i.lending_purpose',
+    'lending_terms': 'i.lending_terms',
+    'special_instructions': 'i.special_instructions',
+    'borrower_address': 'i.borrower_address',
+    'order_number': 'o.order_number',
+    'order_status': 'o.status',
+    'requested_date': 'o.requested_date',
+    'expected_return_date': 'o.expected_return_date',
+    'student_name': 's.name',
+    'student_id_number': 's.student_id',
+    'student_email': 's.email',
+    'department': 's.department',
+    'year_of_study': 's.year_of_study',
+    'lender_name': 'l.name',
+    'lender_email': 'l.email',
+    'lender_department': 'l.department',
+    'lender_designation': 'l.designation',
+    'issued_by_lender_name': 'l2.name',
+    'item_count': 'ic.item_count',
+    'image_count': 'img.image_count',
+    'acknowledgment_count': 'ack.acknowledgment_count',
+    'latest_acknowledgment': 'ack.latest_acknowledgment',
+}
+# Per-invoice aggregates, joined only when the projection uses them and only
+# evaluated for the invoices on the requested page
+INVOICE_LIST_AGGREGATES = {
+    'ic': """LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS item_count FROM invoice_items ii WHERE ii.invoice_id = i.id
+    ) ic ON true""",
+    'img': """LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS image_count FROM invoice_images im WHERE im.invoice_id = i.id
+    ) img ON true""",
+    'ack': """LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS acknowledgment_count, MAX(sa.acknowledged_at) AS latest_acknowledgment
+        FROM student_acknowledgments sa WHERE sa.invoice_id = i.id
+    ) ack ON true""",
+}
+INVOICE_HEAVY_COLUMNS = [
+    'notes', 'physical_invoice_notes', 'student_signature_url', 'lending_purpose',
+    'lending_terms', 'special_instructions', 'borrower_address'
+]
+INVOICE_SUMMARY_COLUMNS = [name for name in INVOICE_LIST_COLUMNS if name not in INVOICE_HEAVY_COLUMNS]
+
+IMAGE_LIST_COLUMNS = {
+    name: name for name in [
+        'id', 'invoice_id', 'image_type', 'image_url', 'image_filename',
+        'image_size', 'image_format', 'uploaded_by', 'upload_method',
+        'device_info', 'capture_timestamp', 'processing_status',
+        'ocr_text', 'notes', 'content_sha256', 'created_at'
+    ]
+}
+IMAGE_HEAVY_COLUMNS = ['device_info', 'ocr_text', 'notes']
+IMAGE_SUMMARY_COLUMNS = [name for name in IMAGE_LIST_COLUMNS if name not in IMAGE_HEAVY_COLUMNS]
+
+# Image id / content hash -> file lookups for the image endpoints: key -> {'data': ..., 'timestamp': ...}
+# Image rows are never rewritten, so id entries only go stale when an invoice is deleted
+IMAGE_FILE_CACHE_TTL_SECONDS = int(os.getenv('IMAGE_FILE_CACHE_TTL_SECONDS', 3600))
+IMAGE_FILE_CACHE_MAX_ENTRIES = 10000
+_image_file_cache: Dict[str, Dict[str, Any]] = {}
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Invoice detail cache: invoice_id -> {'data': ..., 'timestamp': ...}
+# Entries are dropped by every write path that touches an invoice or its children;
+# the TTL only bounds staleness of joined order/student/lender data
+INVOICE_CACHE_TTL_SECONDS = int(os.getenv('INVOICE_CACHE_TTL_SECONDS', 60))
+_invoice_detail_cache: Dict[str, Dict[str, Any]] = {}
+
+def invalidate_invoice_cache(invoice_id: Optional[str] = None):
+    """Drop one cached invoice detail, or all of them"""
+    if invoice_id is None:
+        _invoice_detail_cache.clear()
+    else:
+        _invoice_detail_cache.pop(str(invoice_id), None)
+
+def enabled_image_variants() -> List[str]:
+    """Variant sizes switched on by the file upload settings"""
+    try:
+        settings = get_settings(get_db())
+        generate_thumbnails = settings.get_setting('file_upload', 'generate_thumbnails', True)
+        compress_images = settings.get_setting('file_upload', 'compress_images', True)
+    except Exception as e:
+        api_logger.warning(f"Could not read file upload settings, using defaults: {e}")
+        generate_thumbnails = compress_images = True
+    
+    sizes = []
+    if generate_thumbnails:
+        sizes.append('thumb')
+    if compress_images:
+        sizes.append('preview')
+    return sizes
+
+def ocr_busy_response(content: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """202 for uploads accepted while the OCR queue is full; the client may retry OCR later"""
+    return JSONResponse(
+        status_code=202,
+        content={
+            "processing_status": "pending",
+            "detail": "OCR queue is full, try again shortly",
+            "retry_after": OCR_RETRY_AFTER_SECONDS,
+            **content
+        },
+        headers={"Retry-After": str(OCR_RETRY_AFTER_SECONDS), **(headers or {})}
+    )
+
+def queue_image_variants(stored: StoredFile):
+    """Build thumbnail/preview for a new upload in the background"""
+    try:
+        schedule_variants(stored.path, stored.sha256, enabled_image_variants())
+    except Exception as e:
+        api_logger.warning(f"Failed to queue image variants for {stored.path}: {e}")
 
 def save_uploaded_image(image_data: str, filename: str, invoice_id: str) -> tuple[str, str]:
     """Save base64 image data to file and return (file_url, file_path)"""
@@ -589,21 +696,9 @@ async def create_invoice_with_student_and_image(
         
         if file and file.filename:
             try:
-                # Create permanent storage directory
-                upload_dir = Path("uploads/invoices")
-                upload_dir.mkdir(parents=True, exist_ok=True)
-                
-                # Generate unique filename
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                file_extension = Path(file.filename).suffix.lower() or '.jpg'
-                permanent_filename = f"bulk_{timestamp}_{uuid.uuid4().hex[:8]}{file_extension}"
-                permanent_file_path = upload_dir / permanent_filename
-                
-                # Save the file
-                file_content = await file.read()
-                api_logger.info(f"File content length: {len(file_content)} bytes")
-                with open(permanent_file_path, "wb") as f:
-                    f.write(file_content)
+                # Save the file in the content-addressed store
+                stored = await store_upload(db, file)
+                file_extension = stored.path.suffix
                 
                 # Store in database
                 image_id = str(uuid.uuid4())
@@ -611,8 +706,8 @@ async def create_invoice_with_student_and_image(
                 INSERT INTO invoice_images (
                     id, invoice_id, image_type, image_url, image_filename, 
                     image_size, image_format, uploaded_by, upload_method,
-                    capture_timestamp, processing_status, ocr_text, notes
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    capture_timestamp, processing_status, ocr_text, notes, content_sha256
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
                 
                 confidence_note = f"Bulk upload with OCR confidence: {ocr_confidence*100:.1f}%" if ocr_confidence else "Bulk upload"
@@ -623,24 +718,26 @@ async def create_invoice_with_student_and_image(
                         image_id,
                         invoice_uuid,
                         'bulk_upload',
-                        f"uploads/invoices/{permanent_filename}",
+                        stored.url,
                         file.filename,
-                        len(file_content),
+                        stored.size,
                         file_extension.lstrip('.'),
                         'Bulk Upload System',
                         'bulk_upload',
                         datetime.now(),
                         'completed',
                         ocr_text[:2000] if ocr_text else None,
-                        confidence_note
+                        confidence_note,
+                        stored.sha256
                     )
                 )
                 
                 image_stored = True
+                queue_image_variants(stored)
                 image_info = {
                     "id": image_id,
                     "filename": file.filename,
-                    "url": f"uploads/invoices/{permanent_filename}"
+                    "url": stored.url
                 }
                 api_logger.info(f"Successfully stored image {image_id} for invoice {invoice_uuid}")
                 
@@ -684,83 +781,212 @@ async def create_invoice_with_student_and_image(
         raise HTTPException(status_code=500, detail=f"Failed to create invoice: {str(e)}")
 
 
-@invoice_router.get("/", response_model=List[InvoiceDetail])
-async def get_invoices(
-    response: Response,
-    skip: int = 0,
-    limit: int = 100,
+def build_invoice_list_query(
+    fields: Optional[str] = "summary",
     status: Optional[str] = None,
     invoice_type: Optional[str] = None,
     student_id: Optional[str] = None,
-    db: DatabaseManager = Depends(get_db)
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
 ):
-    """Get all invoices with filtering options"""
-    # Set cache control headers to prevent caching
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    """Build the invoice list query and its parameters.
     
+    The page of invoices is selected first (filters, keyset cursor, LIMIT) and
+    the joins and count aggregates are applied to that page only. Pages are
+    ordered by (created_at, id) descending; ``cursor`` is the
+    "<created_at>,<id>" of the last row of the previous page.
+    """
     where_conditions = []
     params = []
     
     if status:
-        where_conditions.append("i.status = %s")
+        where_conditions.append("status = %s")
         params.append(status)
     
     if invoice_type:
-        where_conditions.append("i.invoice_type = %s")
+        where_conditions.append("invoice_type = %s")
         params.append(invoice_type)
     
     if student_id:
-        where_conditions.append("i.student_id = %s")
+        where_conditions.append("student_id = %s")
         params.append(student_id)
     
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = cursor.rsplit(',', 1)
+            cursor_created_at = datetime.fromisoformat(cursor_created_at)
+            uuid.UUID(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        where_conditions.append("(created_at, id) < (%s, %s::uuid)")
+        params.extend([cursor_created_at, cursor_id])
+    
     where_clause = ""
     if where_conditions:
         where_clause = "WHERE " + " AND ".join(where_conditions)
     
+    projection = resolve_projection(fields, INVOICE_LIST_COLUMNS, INVOICE_SUMMARY_COLUMNS)
+    aggregates = "\n    ".join(
+        join for alias, join in INVOICE_LIST_AGGREGATES.items() if f"{alias}." in projection
+    )
+    
+    offset_clause = ""
+    if skip and not cursor:
+        offset_clause = "OFFSET %s"
+        params.append(skip)
+    params.append(limit)
+    
     query = f"""
     SELECT 
-        i.*,
-        o.order_number,
-        o.status as order_status,
-        o.requested_date,
-        o.expected_return_date,
-        s.name as student_name,
-        s.student_id as student_id_number,
-        s.email as student_email,
-        s.department,
-        s.year_of_study,
-        l.name as lender_name,
-        l.email as lender_email,
-        l.department as lender_department,
-        l.designation as lender_designation,
-        l2.name as issued_by_lender_name,
-        (SELECT COUNT(*) FROM invoice_items ii WHERE ii.invoice_id = i.id) as item_count,
-        (SELECT COUNT(*) FROM invoice_images img WHERE img.invoice_id = i.id) as image_count,
-        (SELECT COUNT(*) FROM student_acknowledgments sa WHERE sa.invoice_id = i.id) as acknowledgment_count,
-        (SELECT MAX(acknowledged_at) FROM student_acknowledgments sa WHERE sa.invoice_id = i.id) as latest_acknowledgment
-    FROM invoices i
+        {projection}
+    FROM (
+        SELECT * FROM invoices
+        {where_clause}
+        ORDER BY created_at DESC, id DESC
+        {offset_clause}
+        LIMIT %s
+    ) i
     LEFT JOIN orders o ON i.order_id = o.id
     LEFT JOIN students s ON i.student_id = s.id
     LEFT JOIN lenders l ON i.lender_id = l.id
     LEFT JOIN lenders l2 ON i.issued_by_lender = l2.id
-    {where_clause}
-    ORDER BY i.created_at DESC
-    OFFSET %s LIMIT %s
+    {aggregates}
+    ORDER BY i.created_at DESC, i.id DESC
+    """
+    return query, tuple(params)
+
+@invoice_router.get("/", response_model=List[InvoiceListItem], response_model_exclude_unset=True)
+async def get_invoices(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    invoice_type: Optional[str] = None,
+    student_id: Optional[str] = None,
+    fields: Optional[str] = "summary",
+    cursor: Optional[str] = None,
+    db: DatabaseManager = Depends(get_db)
+):
+    """Get all invoices with filtering options
+    
+    Returns the summary projection by default; notes and other long text
+    columns come from GET /{invoice_id}, or via fields=all / fields=summary,notes.
+    For paging, pass the X-Next-Cursor header of one page as ?cursor= for the
+    next instead of using skip.
+    """
+    # Set cache control headers to prevent caching
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    
+    query, params = build_invoice_list_query(
+        fields, status, invoice_type, student_id, cursor, skip, limit
+    )
+    results = db.execute_query(query, params)
+    
+    if results and len(results) == limit and results[-1].get('created_at'):
+        last = results[-1]
+        response.headers["X-Next-Cursor"] = f"{last['created_at'].isoformat()},{last['id']}"
+    
+    return results
+
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+@invoice_router.get("/search")
+async def search_invoices(
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    db: DatabaseManager = Depends(get_db)
+):
+    """Full-text search over invoice numbers, notes, student names and OCR text
+    
+    Uses websearch syntax ("quoted phrases", -exclusions, OR). Candidates are
+    found through the GIN indexes on each source, ranked by ts_rank, and only
+    the returned page gets highlighted snippets (<mark>...</mark>).
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Search query is required")
+    limit = min(max(limit, 1), 100)
+    
+    query = """
+    WITH q AS (
+        SELECT websearch_to_tsquery('simple', %(q)s) AS query
+    ),
+    matches AS (
+        SELECT i.id FROM invoices i, q
+        WHERE invoice_search_document(i.invoice_number, i.notes, i.physical_invoice_notes) @@ q.query
+        UNION
+        SELECT im.invoice_id FROM invoice_images im, q
+        WHERE to_tsvector('simple', COALESCE(im.ocr_text, '')) @@ q.query
+        UNION
+        SELECT i.id FROM students s JOIN invoices i ON i.student_id = s.id, q
+        WHERE to_tsvector('simple', COALESCE(s.name, '')) @@ q.query
+    ),
+    ranked AS (
+        SELECT i.id, i.invoice_number, i.invoice_type, i.status, i.created_at,
+               s.name AS student_name,
+               concat_ws(' ', i.notes, i.physical_invoice_notes) AS notes_text,
+               ocr.ocr_text,
+               ts_rank(
+                   invoice_search_document(i.invoice_number, i.notes, i.physical_invoice_notes)
+                   || setweight(to_tsvector('simple', COALESCE(s.name, '')), 'A')
+                   || setweight(to_tsvector('simple', COALESCE(ocr.ocr_text, '')), 'B'),
+                   q.query
+               ) AS rank,
+               COUNT(*) OVER () AS total_count
+        FROM matches m
+        JOIN invoices i ON i.id = m.id
+        LEFT JOIN students s ON s.id = i.student_id
+        LEFT JOIN LATERAL (
+            SELECT string_agg(im.ocr_text, ' ') AS ocr_text
+            FROM invoice_images im WHERE im.invoice_id = i.id
+        ) ocr ON true
+        CROSS JOIN q
+        ORDER BY rank DESC, i.created_at DESC
+        OFFSET %(skip)s LIMIT %(limit)s
+    )
+    SELECT r.id, r.invoice_number, r.invoice_type, r.status, r.created_at,
+           r.student_name, r.rank, r.total_count,
+           CASE WHEN to_tsvector('simple', COALESCE(r.ocr_text, '')) @@ q.query
+                THEN ts_headline('simple', r.ocr_text, q.query, %(options)s) END AS ocr_snippet,
+           CASE WHEN to_tsvector('simple', r.notes_text) @@ q.query
+                THEN ts_headline('simple', r.notes_text, q.query, %(options)s) END AS notes_snippet
+    FROM ranked r CROSS JOIN q
+    ORDER BY r.rank DESC, r.created_at DESC
     """
     
-    params.extend([skip, limit])
-    return db.execute_query(query, tuple(params))
+    results = db.execute_query(query, {
+        'q': q, 'skip': skip, 'limit': limit, 'options': SEARCH_HEADLINE_OPTIONS
+    })
+    
+    total = results[0]['total_count'] if results else 0
+    for row in results:
+        row.pop('total_count', None)
+        row['rank'] = float(row['rank'])
+    
+    return {
+        "query": q,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "results": results
+    }
 
 # Fix the route to match frontend expectations
 @invoice_router.get("/{invoice_id}", response_model=InvoiceDetail)
 async def get_invoice(invoice_id: str, db: DatabaseManager = Depends(get_db)):
     """Get invoice by ID with all related data"""
+    cached_entry = _invoice_detail_cache.get(invoice_id)
+    if cached_entry and (time.time() - cached_entry['timestamp']) < INVOICE_CACHE_TTL_SECONDS:
+        return cached_entry['data']
+    
     try:
         api_logger.info(f"Fetching invoice with ID: {invoice_id}")
         
-        # Get main invoice data
+        # Invoice, items, images, acknowledgments and transactions in one round trip
         invoice_query = """
         SELECT 
             i.*,
@@ -777,7 +1003,23 @@ async def get_invoice(invoice_id: str, db: DatabaseManager = Depends(get_db)):
             l.email as lender_email,
             l.department as lender_department,
             l.designation as lender_designation,
-            l2.name as issued_by_lender_name
+            l2.name as issued_by_lender_name,
+            COALESCE((
+                SELECT json_agg(ii ORDER BY ii.created_at)
+                FROM invoice_items ii WHERE ii.invoice_id = i.id
+            ), '[]'::json) as items,
+            COALESCE((
+                SELECT json_agg(im ORDER BY im.created_at)
+                FROM invoice_images im WHERE im.invoice_id = i.id
+            ), '[]'::json) as images,
+            COALESCE((
+                SELECT json_agg(sa ORDER BY sa.acknowledged_at)
+                FROM student_acknowledgments sa WHERE sa.invoice_id = i.id
+            ), '[]'::json) as acknowledgments,
+            COALESCE((
+                SELECT json_agg(it ORDER BY it.created_at)
+                FROM invoice_transactions it WHERE it.invoice_id = i.id
+            ), '[]'::json) as transactions
         FROM invoices i
         LEFT JOIN orders o ON i.order_id = o.id
         LEFT JOIN students s ON i.student_id = s.id
@@ -787,45 +1029,21 @@ async def get_invoice(invoice_id: str, db: DatabaseManager = Depends(get_db)):
         """
         
         invoice_data = db.execute_query(invoice_query, (invoice_id,))
-        api_logger.info(f"Invoice query returned: {len(invoice_data) if invoice_data else 0} results")
         
         if not invoice_data:
             api_logger.warning(f"Invoice not found: {invoice_id}")
             raise HTTPException(status_code=404, detail="Invoice not found")
         
-        # Get the first result
-        invoice_data = invoice_data[0]
-        api_logger.info(f"Found invoice: {invoice_data.get('invoice_number', 'Unknown')}")
-        
-        # Get invoice items
-        items_query = "SELECT * FROM invoice_items WHERE invoice_id = %s ORDER BY created_at"
-        items_data = db.execute_query(items_query, (invoice_id,))
-        
-        # Get invoice images
-        images_query = "SELECT * FROM invoice_images WHERE invoice_id = %s ORDER BY created_at"
-        images_data = db.execute_query(images_query, (invoice_id,))
-        
-        # Get acknowledgments
-        acknowledgments_query = "SELECT * FROM student_acknowledgments WHERE invoice_id = %s ORDER BY acknowledged_at"
-        acknowledgments_data = db.execute_query(acknowledgments_query, (invoice_id,))
-        
-        # Get transactions
-        transactions_query = "SELECT * FROM invoice_transactions WHERE invoice_id = %s ORDER BY created_at"
-        transactions_data = db.execute_query(transactions_query, (invoice_id,))
-        
-        # Combine all data
-        result = dict(invoice_data)
+        result = dict(invoice_data[0])
+        acknowledgments_data = result['acknowledgments']
         result.update({
-            'items': items_data or [],
-            'images': images_data or [],
-            'acknowledgments': acknowledgments_data or [],
-            'transactions': transactions_data or [],
-            'item_count': len(items_data or []),
-            'image_count': len(images_data or []),
-            'acknowledgment_count': len(acknowledgments_data or []),
+            'item_count': len(result['items']),
+            'image_count': len(result['images']),
+            'acknowledgment_count': len(acknowledgments_data),
             'latest_acknowledgment': acknowledgments_data[-1]['acknowledged_at'] if acknowledgments_data else None
         })
         
+        _invoice_detail_cache[invoice_id] = {'data': result, 'timestamp': time.time()}
         api_logger.info(f"Successfully retrieved invoice {invoice_id}")
         return result
         
@@ -902,6 +1120,7 @@ async def update_invoice(invoice_id: str, invoice_update: InvoiceUpdate, db: Dat
         api_logger.debug(f"Update params: {params}")
         
         result = db.execute_query(query, tuple(params))
+        invalidate_invoice_cache(invoice_id)
         
         if not result:
             api_logger.error("Update query returned no results")
@@ -957,6 +1176,8 @@ async def delete_invoice(invoice_id: str, db: DatabaseManager = Depends(get_db))
         
         if db.execute_command(delete_query, (invoice_id,)):
             api_logger.info(f"Successfully deleted invoice {invoice_number} from database")
+            invalidate_invoice_cache(invoice_id)
+            invalidate_image_file_cache()
             
             # Clean up uploaded files
             if images_result:
@@ -1021,6 +1242,7 @@ async def add_invoice_item(invoice_id: str, item: InvoiceItemCreate, db: Databas
             item.lending_duration_days, item.expected_return_date, item.notes
         )
     )
+    invalidate_invoice_cache(invoice_id)
     
     return result[0] if result else None
 
@@ -1075,31 +1297,23 @@ async def upload_invoice_image(
                 }
             )
         
-        # Read file content
+        # Stream file into the content-addressed store
         try:
-            file_content = await file.read()
-            api_logger.info(f"File read successfully, size: {len(file_content)} bytes")
-            
-            # Save file
-            import base64
-            import os
-            
-            # Create unique filename
-            timestamp = int(datetime.now().timestamp() * 1000)
-            file_extension = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
-            unique_filename = f"invoice_{invoice_id}_{timestamp}{file_extension}"
-            
-            # Ensure upload directory exists
-            upload_dir = os.path.join(os.path.dirname(__file__), 'uploads', 'invoices')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            file_path = os.path.join(upload_dir, unique_filename)
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
-                
-            image_url = f"/uploads/invoices/{unique_filename}"
-            api_logger.info(f"File saved successfully: {file_path}")
+            stored = await store_upload(db, file)
+            file_path = str(stored.path)
+            image_url = stored.url
+            api_logger.info(f"File saved successfully: {file_path} ({stored.size} bytes, sha256 {stored.sha256})")
             
+        except HTTPException as e:
+            api_logger.warning(f"Rejected upload for invoice {invoice_id}: {e.detail}")
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers={
+                    "Access-Control-Allow-Origin": "http://localhost:3001",
+                    "Access-Control-Allow-Credentials": "true"
+                }
+            )
         except Exception as e:
             api_logger.error(f"Failed to save file: {e}")
             return JSONResponse(
@@ -1111,14 +1325,16 @@ async def upload_invoice_image(
                 }
             )
         
-        # Process OCR if it's a physical invoice
+        # Physical invoices are OCR'd by a background job unless the content was seen before
         ocr_text = ""
+        processing_status = "completed"
         if image_type == "physical_invoice" and OCR_AVAILABLE:
-            try:
-                ocr_text = extract_text_from_image(file_path)
-                api_logger.info(f"OCR extracted text: {ocr_text[:200]}...")
-            except Exception as e:
-                api_logger.warning(f"OCR processing failed: {e}")
+            cached = get_cached_ocr(db, stored.sha256)
+            if cached:
+                ocr_text = cached.ocr_text
+                api_logger.info(f"Reusing OCR text for content {stored.sha256}")
+            else:
+                processing_status = "queued"
         elif image_type == "physical_invoice":
             api_logger.info("OCR processing skipped - libraries not available")
         
@@ -1129,8 +1345,9 @@ async def upload_invoice_image(
         query = """
         INSERT INTO invoice_images (
             invoice_id, image_type, image_url, image_filename, uploaded_by,
-            upload_method, device_info, capture_timestamp, notes, ocr_text, processing_status
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            upload_method, device_info, capture_timestamp, notes, ocr_text, processing_status,
+            image_size, image_format, content_sha256
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id, processing_status
         """
         
@@ -1141,7 +1358,8 @@ async def upload_invoice_image(
                     invoice_id, image_type, image_url,
                     file.filename, "system",  # uploaded_by
                     "file_upload", None,  # upload_method, device_info
-                    capture_time, notes, ocr_text, "completed"
+                    capture_time, notes, ocr_text, processing_status,
+                    stored.size, stored.path.suffix.lstrip('.'), stored.sha256
                 )
             )
             
@@ -1157,6 +1375,12 @@ async def upload_invoice_image(
             
             image_record = result[0]
             api_logger.info(f"Image record saved with ID: {image_record.get('id')}")
+            invalidate_invoice_cache(invoice_id)
+            queue_image_variants(stored)
+            
+            ocr_job_id = None
+            if processing_status == "queued":
+                ocr_job_id = create_ocr_job(db, stored, image_id=str(image_record['id']))
             
         except Exception as e:
             api_logger.error(f"Database error saving image record: {e}")
@@ -1180,6 +1404,7 @@ async def upload_invoice_image(
                 WHERE id = %s
                 """
                 db.execute_command(update_query, (image_url, invoice_id))
+                invalidate_invoice_cache(invoice_id)
                 api_logger.info("Updated invoice with physical capture info")
             except Exception as e:
                 api_logger.error(f"Failed to update invoice: {e}")
@@ -1197,15 +1422,20 @@ async def upload_invoice_image(
         # Create response with CORS headers
         response_data = CameraUploadResponse(
             success=True,
-            message="Image uploaded and processed successfully",
+            message=(
+                "Image uploaded; OCR is running in the background" if ocr_job_id
+                else "Image uploaded and processed successfully"
+            ),
             image_id=str(image_record['id']),
             image_url=image_url,
-            processing_status="completed",
-            ocr_extracted=invoice_info if ocr_text else None
+            processing_status=processing_status,
+            ocr_extracted=invoice_info if ocr_text else None,
+            job_id=ocr_job_id
         )
         
         # Return JSONResponse with explicit CORS headers
         return JSONResponse(
+            status_code=202 if ocr_job_id else 200,
             content=response_data.dict(),
             headers={
                 "Access-Control-Allow-Origin": "http://localhost:3001",
@@ -1268,32 +1498,16 @@ async def upload_invoice_file(
         if file_extension not in ALLOWED_IMAGE_EXTENSIONS:
             raise HTTPException(status_code=400, detail="Invalid file type")
         
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
-        
-        # Create invoice-specific directory
-        invoice_dir = UPLOAD_DIR / invoice_id
-        invoice_dir.mkdir(exist_ok=True)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_filename = f"{timestamp}_{uuid.uuid4().hex[:8]}{file_extension}"
-        file_path = invoice_dir / unique_filename
-        
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        image_url = f"uploads/invoices/{invoice_id}/{unique_filename}"
+        # Save file in the content-addressed store, enforcing MAX_FILE_SIZE while streaming
+        stored = await store_upload(db, file)
+        image_url = stored.url
         
         # Save to database
         query = """
         INSERT INTO invoice_images (
             invoice_id, image_type, image_url, image_filename, uploaded_by,
-            upload_method, image_size, image_format, notes
-        ) VALUES (%s, %s, %s, %s, %s, 'file_upload', %s, %s, %s)
+            upload_method, image_size, image_format, notes, content_sha256
+        ) VALUES (%s, %s, %s, %s, %s, 'file_upload', %s, %s, %s, %s)
         RETURNING id
         """
         
@@ -1301,32 +1515,43 @@ async def upload_invoice_file(
             query,
             (
                 invoice_id, image_type, image_url, file.filename,
-                uploaded_by, len(file_content), file_extension.lstrip('.'), notes
+                uploaded_by, stored.size, file_extension.lstrip('.'), notes, stored.sha256
             )
         )
         
         if not result:
             raise HTTPException(status_code=500, detail="Failed to save file record")
+        invalidate_invoice_cache(invoice_id)
+        queue_image_variants(stored)
 
-        return {"success": True, "image_id": result[0]['id'], "image_url": image_url}
+        return {
+            "success": True,
+            "image_id": result[0]['id'],
+            "image_url": image_url,
+            "size": stored.size,
+            "sha256": stored.sha256
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         api_logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @invoice_router.get("/{invoice_id}/images")
-async def get_invoice_images(invoice_id: str, db: DatabaseManager = Depends(get_db)):
-    """Get all images for an invoice - returns real data from database"""
+async def get_invoice_images(invoice_id: str, fields: Optional[str] = "summary", db: DatabaseManager = Depends(get_db)):
+    """Get all images for an invoice - returns real data from database
+    
+    OCR text, notes and device info are only included with fields=all or by name.
+    """
     try:
         api_logger.info(f"Fetching images for invoice: {invoice_id}")
         
         # Query the database for real images
-        query = """
+        projection = resolve_projection(fields, IMAGE_LIST_COLUMNS, IMAGE_SUMMARY_COLUMNS)
+        query = f"""
         SELECT 
-            id, invoice_id, image_type, image_url, image_filename, 
-            image_size, image_format, uploaded_by, upload_method,
-            device_info, capture_timestamp, processing_status, 
-            ocr_text, notes, created_at
+            {projection}
         FROM invoice_images 
         WHERE invoice_id = %s 
         ORDER BY created_at DESC
@@ -1345,6 +1570,8 @@ async def get_invoice_images(invoice_id: str, db: DatabaseManager = Depends(get_
                     image_dict['capture_timestamp'] = image_dict['capture_timestamp'].isoformat()
                 if image_dict.get('created_at'):
                     image_dict['created_at'] = image_dict['created_at'].isoformat()
+                if image_dict.get('content_sha256'):
+                    image_dict['content_url'] = f"/api/invoices/images/content/{image_dict['content_sha256']}"
                 images.append(image_dict)
             
             return {"success": True, "images": images, "count": len(images)}
@@ -1361,22 +1588,129 @@ async def options_invoice_images(invoice_id: str):
     """Handle preflight requests for invoice images"""
     return {"message": "OK"}
 
-@invoice_router.get("/images/{image_id}")
-async def get_image_file(image_id: str, db: DatabaseManager = Depends(get_db)):
-    """Serve uploaded image file"""
-    query = "SELECT image_url, image_filename FROM invoice_images WHERE id = %s"
-    result = db.execute_query(query, (image_id,))
+@invoice_router.post("/images/variants/backfill")
+async def backfill_image_variants(db: DatabaseManager = Depends(get_db)):
+    """Build thumbnails/previews for every stored image that is missing them"""
+    sizes = enabled_image_variants()
+    if not sizes:
+        return {"success": True, "queued": 0, "generated": 0, "failed": 0, "skipped": 0}
+    
+    rows = db.execute_query("SELECT id, image_url, content_sha256 FROM invoice_images")
+    images = [
+        (resolve_upload_path(row['image_url']), row['content_sha256'] or str(row['id']))
+        for row in rows
+    ]
+    images = [(path, key) for path, key in images if path.exists()]
+    
+    counts = await generate_variants_bulk(images, sizes)
+    api_logger.info(f"Image variant backfill: {counts}")
+    return {"success": counts['failed'] == 0, **counts}
+
+def lookup_image_file(db: DatabaseManager, image_id: str) -> Optional[Dict[str, Any]]:
+    """File, download name and content hash for an image id, served from memory after the first view"""
+    cached = _image_file_cache.get(image_id)
+    if cached and time.time() - cached['timestamp'] < IMAGE_FILE_CACHE_TTL_SECONDS:
+        return cached['data']
+    
+    result = db.execute_query(
+        "SELECT image_url, image_filename, content_sha256 FROM invoice_images WHERE id = %s",
+        (image_id,)
+    )
+    if not result:
+        return None
+    
+    data = {
+        'path': resolve_upload_path(result[0]['image_url']),
+        'filename': result[0]['image_filename'],
+        'sha256': result[0]['content_sha256'],
+    }
+    _remember_image_file(image_id, data)
+    return data
+
+def lookup_content_file(db: DatabaseManager, sha256: str) -> Optional[Path]:
+    """Stored file for a content hash; content never changes, so hits never expire"""
+    cached = _image_file_cache.get(sha256)
+    if cached:
+        return cached['data']['path']
     
+    result = db.execute_query("SELECT path FROM stored_files WHERE sha256 = %s", (sha256,))
     if not result:
-        raise HTTPException(status_code=404, detail="Image not found")
+        return None
     
-    image_data = result[0]
+    path = resolve_upload_path(result[0]['path'])
+    _remember_image_file(sha256, {'path': path})
+    return path
+
+def _remember_image_file(key: str, data: Dict[str, Any]):
+    if len(_image_file_cache) >= IMAGE_FILE_CACHE_MAX_ENTRIES:
+        # Dicts keep insertion order, so this drops the oldest entry
+        _image_file_cache.pop(next(iter(_image_file_cache)))
+    _image_file_cache[key] = {'data': data, 'timestamp': time.time()}
+
+def invalidate_image_file_cache():
+    _image_file_cache.clear()
+
+def _image_response(
+    request: Request, source: Path, key: str, size: Optional[str],
+    sha256: Optional[str], immutable: bool, filename: Optional[str] = None
+):
+    """Serve an original image or one of its variants; a missing variant falls back to the original"""
+    if size:
+        variant = variant_path(key, size)
+        if variant.exists():
+            return serve_file(
+                request, variant, VARIANT_MEDIA_TYPE,
+                etag=f"{sha256}-{size}" if sha256 else None, immutable=immutable
+            )
+        if source.exists():
+            schedule_variants(source, key, [size])
     
-    file_path = Path(image_data['image_url'])
-    if not file_path.exists():
+    if not source.exists():
         raise HTTPException(status_code=404, detail="Image file not found")
     
-    return FileResponse(file_path, filename=image_data['image_filename'])
+    # The original stands in for a variant that is not built yet; never let it be cached as one
+    return serve_file(
+        request, source, etag=sha256, immutable=immutable, filename=filename,
+        cache_control="no-store" if size else None
+    )
+
+@invoice_router.get("/images/content/{sha256}")
+async def get_image_content(sha256: str, request: Request, size: Optional[str] = None, db: DatabaseManager = Depends(get_db)):
+    """Serve stored image content by its SHA-256 hash (?size=thumb|preview for variants)
+    
+    The URL names the exact bytes returned, so responses are cacheable forever.
+    """
+    if size is not None and size not in VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid size. Use one of: {', '.join(VARIANT_SIZES)}")
+    if not CONTENT_HASH_PATTERN.match(sha256):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    path = lookup_content_file(db, sha256)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    return _image_response(request, path, sha256, size, sha256, immutable=True)
+
+@invoice_router.get("/images/{image_id}")
+async def get_image_file(image_id: str, request: Request, size: Optional[str] = None, db: DatabaseManager = Depends(get_db)):
+    """Serve uploaded image file, or its WebP thumbnail/preview with ?size=thumb|preview
+    
+    Variants are built in the background after upload; until one is ready the
+    original file is served (and its generation queued). Responses carry an ETag,
+    so repeat views revalidate with a 304 and no database access.
+    """
+    if size is not None and size not in VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid size. Use one of: {', '.join(VARIANT_SIZES)}")
+    
+    image_file = lookup_image_file(db, image_id)
+    if not image_file:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    key = image_file['sha256'] or image_id
+    return _image_response(
+        request, image_file['path'], key, size, image_file['sha256'],
+        immutable=False, filename=image_file['filename']
+    )
 
 # STUDENT ACKNOWLEDGMENTS
 
@@ -1419,11 +1753,180 @@ async def create_student_acknowledgment(
     WHERE id = %s
     """
     db.execute_command(update_query, (invoice_id,))
+    invalidate_invoice_cache(invoice_id)
     
     return created_acknowledgment
 
 # OCR PROCESSING ENDPOINTS
 
+# OCR JOBS
+# Uploads that should not hold the HTTP connection during OCR get a row in ocr_jobs
+# and are processed by OCR_WORKERS runner tasks feeding the OCR process pool.
+# Clients poll GET /ocr/jobs/{id}; unfinished jobs are picked up again on startup.
+
+_ocr_job_queue: Optional[asyncio.Queue] = None
+_ocr_job_runners: List[asyncio.Task] = []
+
+def create_ocr_job(db: DatabaseManager, stored: StoredFile, image_id: Optional[str] = None) -> str:
+    result = db.execute_query("""
+    INSERT INTO ocr_jobs (image_id, content_sha256, file_path)
+    VALUES (%s, %s, %s)
+    RETURNING id
+    """, (image_id, stored.sha256, stored.url))
+    if not result:
+        raise HTTPException(status_code=500, detail="Failed to create OCR job")
+    job_id = str(result[0]['id'])
+    enqueue_ocr_job(job_id)
+    return job_id
+
+def enqueue_ocr_job(job_id: str):
+    global _ocr_job_queue
+    if _ocr_job_queue is None:
+        _ocr_job_queue = asyncio.Queue()
+        _ocr_job_runners.extend(asyncio.create_task(_run_ocr_jobs()) for _ in range(OCR_WORKERS))
+    _ocr_job_queue.put_nowait(job_id)
+
+def resume_ocr_jobs(db: Optional[DatabaseManager] = None) -> int:
+    """Queue jobs left unfinished by a restart. Called on startup."""
+    db = db or get_db()
+    rows = db.execute_query(
+        "SELECT id FROM ocr_jobs WHERE status IN ('queued', 'processing') ORDER BY created_at"
+    )
+    for row in rows:
+        enqueue_ocr_job(str(row['id']))
+    if rows:
+        api_logger.info(f"Resumed {len(rows)} unfinished OCR jobs")
+    return len(rows)
+
+async def _run_ocr_jobs():
+    while True:
+        job_id = await _ocr_job_queue.get()
+        try:
+            await process_ocr_job(job_id)
+        except Exception as e:
+            api_logger.error(f"OCR job {job_id} crashed: {e}")
+        finally:
+            _ocr_job_queue.task_done()
+
+def _update_ocr_job(db: DatabaseManager, job_id: str, status: str, progress: int, **fields):
+    assignments = "".join(f", {column} = %s" for column in fields)
+    db.execute_command(
+        f"UPDATE ocr_jobs SET status = %s, progress = %s{assignments} WHERE id = %s",
+        (status, progress, *fields.values(), job_id)
+    )
+
+async def process_ocr_job(job_id: str):
+    db = get_db()
+    claimed = db.execute_query("""
+    UPDATE ocr_jobs SET status = 'processing', progress = 10, started_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND status IN ('queued', 'processing')
+    RETURNING id, image_id, content_sha256, file_path
+    """, (job_id,))
+    if not claimed:
+        return
+    job = claimed[0]
+    image_id = str(job['image_id']) if job['image_id'] else None
+    if image_id:
+        db.execute_command("UPDATE invoice_images SET processing_status = 'processing' WHERE id = %s", (image_id,))
+    
+    try:
+        cached = get_cached_ocr(db, job['content_sha256']) if job['content_sha256'] else None
+        ocr_text = cached.ocr_text if cached else await run_ocr_when_free(resolve_upload_path(job['file_path']))
+        _update_ocr_job(db, job_id, 'processing', 70, ocr_text=ocr_text)
+        
+        if cached and cached.extracted_data is not None:
+            extracted_data, confidence_score = cached.extracted_data, cached.confidence_score or 0.0
+        else:
+            extracted_data, confidence_score = parse_ocr_text(ocr_text)
+            if job['content_sha256']:
+                save_ocr_result(db, job['content_sha256'], ocr_text, extracted_data, confidence_score)
+        _update_ocr_job(
+            db, job_id, 'completed', 100,
+            extracted_data=json.dumps(extracted_data, default=str),
+            confidence_score=confidence_score,
+            finished_at=datetime.now()
+        )
+        
+        if image_id:
+            await _apply_image_ocr_result(db, image_id, ocr_text)
+        api_logger.info(f"OCR job {job_id} completed ({len(ocr_text)} characters)")
+    except Exception as e:
+        error = "OCR took too long for this image" if isinstance(e, OCRTimeout) else str(e)
+        api_logger.error(f"OCR job {job_id} failed: {error}")
+        _update_ocr_job(db, job_id, 'failed', 100, error=error, finished_at=datetime.now())
+        if image_id:
+            db.execute_command("UPDATE invoice_images SET processing_status = 'failed' WHERE id = %s", (image_id,))
+
+async def _apply_image_ocr_result(db: DatabaseManager, image_id: str, ocr_text: str):
+    """Store OCR text on the image and, for physical invoices, update the invoice from it"""
+    result = db.execute_query("""
+    UPDATE invoice_images SET ocr_text = %s, processing_status = 'completed'
+    WHERE id = %s
+    RETURNING invoice_id, image_type
+    """, (ocr_text, image_id))
+    if not result or not result[0]['invoice_id']:
+        return
+    invoice_id = str(result[0]['invoice_id'])
+    invalidate_invoice_cache(invoice_id)
+    
+    if result[0]['image_type'] == 'physical_invoice' and ocr_text:
+        try:
+            invoice_info = extract_invoice_information(ocr_text)
+            if invoice_info:
+                await update_invoice_from_ocr(db, invoice_id, invoice_info)
+        except Exception as e:
+            api_logger.warning(f"Failed to extract invoice info: {e}")
+
+def _ocr_job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    ocr_text = job.get('ocr_text') or ""
+    return {
+        "job_id": str(job['id']),
+        "status": job['status'],
+        "progress": job['progress'],
+        "success": job['status'] == 'completed' and len(ocr_text.strip()) > 10,
+        "image_id": str(job['image_id']) if job.get('image_id') else None,
+        "content_sha256": job.get('content_sha256'),
+        "image_url": job.get('file_path'),
+        "extracted_data": job.get('extracted_data') or {},
+        "confidence_score": job.get('confidence_score') or 0.0,
+        "raw_text": ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text,
+        "processing_method": "tesseract_ocr",
+        "error": job.get('error'),
+        "created_at": job['created_at'].isoformat() if job.get('created_at') else None,
+        "started_at": job['started_at'].isoformat() if job.get('started_at') else None,
+        "finished_at": job['finished_at'].isoformat() if job.get('finished_at') else None,
+    }
+
+@invoice_router.post("/ocr/jobs", status_code=202)
+async def create_ocr_extraction_job(file: UploadFile = File(...), db: DatabaseManager = Depends(get_db)):
+    """Store an invoice image or PDF and extract its data in the background
+    
+    Returns immediately with a job id; poll GET /ocr/jobs/{job_id} for the result.
+    """
+    if not OCR_AVAILABLE:
+        raise HTTPException(status_code=503, detail="OCR functionality not available - missing required libraries")
+    if not file.content_type or not file.content_type.startswith(('image/', 'application/pdf')):
+        raise HTTPException(status_code=400, detail="Only image and PDF files are supported")
+    
+    stored = await store_upload(db, file)
+    job_id = create_ocr_job(db, stored)
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "content_sha256": stored.sha256,
+        "status_url": f"/api/invoices/ocr/jobs/{job_id}"
+    }
+
+@invoice_router.get("/ocr/jobs/{job_id}")
+async def get_ocr_job(job_id: str, db: DatabaseManager = Depends(get_db)):
+    """Status, progress and (once completed) extracted fields of an OCR job"""
+    if not parse_id_list(job_id):
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    result = db.execute_query("SELECT * FROM ocr_jobs WHERE id = %s", (job_id,))
+    if not result:
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    return _ocr_job_response(result[0])
+
 @invoice_router.post("/ocr-upload")
 async def process_invoice_with_ocr(
     file: UploadFile = File(...),
@@ -1437,345 +1940,538 @@ async def process_invoice_with_ocr(
         if not file.content_type or not file.content_type.startswith(('image/', 'application/pdf')):
             raise HTTPException(status_code=400, detail="Only image and PDF files are supported")
         
-        # Read file content
-        file_content = await file.read()
+        # Stream into the content-addressed store; OCR reads the stored file directly
+        stored = await store_upload(db, file)
+        file_extension = stored.path.suffix
         
-        # Create permanent storage directory
-        upload_dir = Path("uploads/invoices")
-        upload_dir.mkdir(parents=True, exist_ok=True)
+        api_logger.info(f"Stored upload: {stored.path} ({stored.size} bytes, sha256 {stored.sha256})")
         
-        # Generate unique filename for permanent storage
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_extension = Path(file.filename).suffix.lower() if file.filename else '.jpg'
-        permanent_filename = f"ocr_{timestamp}_{uuid.uuid4().hex[:8]}{file_extension}"
-        permanent_file_path = upload_dir / permanent_filename
+        # Use the existing OCR system to extract text
+        api_logger.info(f"OCR_AVAILABLE: {OCR_AVAILABLE}, CV2_AVAILABLE: {CV2_AVAILABLE}")
         
-        # Save permanent file
-        with open(permanent_file_path, "wb") as f:
-            f.write(file_content)
+        extracted_data = {}
+        ocr_text = ""
         
-        api_logger.info(f"Saved permanent file: {permanent_file_path}")
+        if OCR_AVAILABLE:
+            try:
+                api_logger.info(f"Processing {file.filename} with OCR from path: {stored.path}")
+                ocr_text, extracted_data, confidence_score = await extract_invoice_data_cached(db, stored)
+                api_logger.info(f"OCR extracted text length: {len(ocr_text) if ocr_text else 0}")
+            except OCRQueueFull:
+                api_logger.warning(f"OCR queue full, {file.filename} stored without OCR")
+                return ocr_busy_response({
+                    "success": False,
+                    "image_url": stored.url,
+                    "content_sha256": stored.sha256,
+                    "invoice_id": invoice_id
+                })
+            except OCRTimeout:
+                raise HTTPException(status_code=504, detail="OCR took too long for this image")
+            except Exception as ocr_error:
+                api_logger.error(f"❌ OCR processing failed: {ocr_error}")
+                confidence_score = 0.0
+        else:
+            api_logger.warning("⚠️ OCR not available")
+            confidence_score = 0.0
         
-        # Create temporary file for OCR processing
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
+        # Determine invoice ID for image storage
+        target_invoice_id = invoice_id
         
-        try:
-            # Use the existing OCR system to extract text
-            api_logger.info(f"OCR_AVAILABLE: {OCR_AVAILABLE}, CV2_AVAILABLE: {CV2_AVAILABLE}")
-            
-            extracted_data = {}
-            ocr_text = ""
-            
-            if OCR_AVAILABLE:
-                try:
-                    api_logger.info(f"Processing {file.filename} with OCR from path: {temp_file_path}")
-                    ocr_text = extract_text_from_image(temp_file_path)
-                    api_logger.info(f"OCR extracted text length: {len(ocr_text) if ocr_text else 0}")
-                    
-                    if ocr_text and len(ocr_text.strip()) > 10:
-                        # Use our enhanced parse_text_simple function for comprehensive extraction
-                        try:
-                            extracted_data = parse_text_simple(ocr_text)
-                            confidence_score = min(extracted_data.get('confidence_score', 95), 95) / 100.0
-                            api_logger.info(f"✅ Data extraction successful with confidence: {confidence_score}")
-                        except Exception as parse_error:
-                            api_logger.error(f"❌ Error in parse_text_simple: {parse_error}")
-                            # Fallback to basic extraction
-                            try:
-                                api_logger.info("🔄 Trying fallback parser...")
-                                extracted_data = parse_text_simple_fallback(ocr_text)
-                                confidence_score = extracted_data.get('confidence_score', 30) / 100.0
-                                api_logger.info(f"✅ Fallback parser successful")
-                            except Exception as fallback_error:
-                                api_logger.error(f"❌ Even fallback parser failed: {fallback_error}")
-                                extracted_data = {
-                                    "student_name": "",
-                                    "student_id": "",
-                                    "student_email": "",
-                                    "department": "",
-                                    "due_date": "",
-                                    "items": [],
-                                    "confidence_score": 0
-                                }
-                                confidence_score = 0.0
-                    else:
-                        api_logger.warning("⚠️ OCR text too short or empty")
-                        confidence_score = 0.0
-                except Exception as ocr_error:
-                    api_logger.error(f"❌ OCR processing failed: {ocr_error}")
-                    confidence_score = 0.0
-            else:
-                api_logger.warning("⚠️ OCR not available")
-                confidence_score = 0.0
-            
-            # Determine invoice ID for image storage
-            target_invoice_id = invoice_id
-            
-            # Auto-create invoice if requested and student info is available
-            if auto_create_invoice and extracted_data.get('student_name'):
-                try:
-                    # Check if student exists
-                    student_query = """
-                    SELECT id FROM students 
-                    WHERE student_id = %s OR LOWER(name) = LOWER(%s) 
-                    LIMIT 1
-                    """
-                    student_result = db.execute_query(
-                        student_query,
-                        (extracted_data.get('student_id', ''), extracted_data.get('student_name', ''))
-                    )
-                    
-                    # Initialize student_id variable
-                    student_id = None
-                    
-                    # Log what was extracted for debugging
-                    api_logger.info(f"🔍 OCR Extracted Data: {json.dumps(extracted_data, indent=2)}")
-                    
-                    if student_result:
-                        student_id = student_result[0]['id']
-                        api_logger.info(f"✅ Found existing student: {student_result[0]['id']}")
-                    else:
-                        # Student not found - create automatically like we do for staff
-                        try:
-                            api_logger.info(f"🚫 Student not found, creating new student: '{extracted_data.get('student_name')}'")
-                            
-                            # Generate auto student ID
-                            import random
-                            year = datetime.now().year
-                            random_num = random.randint(1000, 9999)
-                            auto_student_id = f"STU{year}{random_num}"
-                            api_logger.info(f"🔢 Generated student ID: {auto_student_id}")
-                            
-                            # Create new student with extracted information
-                            student_uuid = str(uuid.uuid4())
-                            new_student_query = """
-                            INSERT INTO students (
-                                id, student_id, name, email, department, year_of_study
-                            ) VALUES (%s, %s, %s, %s, %s, %s)
-                            RETURNING id, name, student_id
-                            """
-                            
-                            new_student_params = (
-                                student_uuid,
-                                extracted_data.get('student_id') or auto_student_id,  # Use extracted ID or generate one
-                                extracted_data.get('student_name'),
-                                extracted_data.get('student_email', ''),  # Email might be empty
-                                extracted_data.get('department', 'Auto-Generated'),  # Default department
-                                1  # Default year
-                            )
-                            
-                            api_logger.info(f"🔄 Executing student creation query with params: {new_student_params}")
-                            
-                            new_student_result = db.execute_query(
-                                new_student_query,
-                                new_student_params
-                            )
-                            
-                            api_logger.info(f"📝 Student creation result: {new_student_result}")
-                            
-                            if new_student_result:
-                                student_id = new_student_result[0]['id']
-                                api_logger.info(f"✅ Auto-created student: {extracted_data.get('student_name')} (ID: {student_id})")
-                            else:
-                                api_logger.warning(f"⚠️ Failed to create student: {extracted_data.get('student_name')} - no result returned")
-                                return  # Can't continue without student
-                                
-                        except Exception as create_error:
-                            api_logger.error(f"❌ Error creating student {extracted_data.get('student_name')}: {create_error}")
-                            import traceback
-                            api_logger.error(f"❌ Traceback: {traceback.format_exc()}")
-                            return  # Can't continue without student
+        # Auto-create invoice if requested and student info is available
+        if auto_create_invoice and extracted_data.get('student_name'):
+            try:
+                # Check if student exists
+                student_query = """
+                SELECT id FROM students 
+                WHERE student_id = %s OR LOWER(name) = LOWER(%s) 
+                LIMIT 1
+                """
+                student_result = db.execute_query(
+                    student_query,
+                    (extracted_data.get('student_id', ''), extracted_data.get('student_name', ''))
+                )
+                
+                # Initialize student_id variable
+                student_id = None
+                
+                # Log what was extracted for debugging
+                api_logger.info(f"🔍 OCR Extracted Data: {json.dumps(extracted_data, indent=2)}")
+                
+                if student_result:
+                    student_id = student_result[0]['id']
+                    api_logger.info(f"✅ Found existing student: {student_result[0]['id']}")
+                else:
+                    # Student not found - create automatically like we do for staff
+                    try:
+                        api_logger.info(f"🚫 Student not found, creating new student: '{extracted_data.get('student_name')}'")
                         
-                        # Try to find lender in database if name was extracted
-                        lender_id = None
-                        issued_by_lender = None
-                        if extracted_data.get('lender_name'):
-                            lender_name = extracted_data['lender_name'].strip()
-                            api_logger.info(f"👤 Looking for staff/lender: '{lender_name}'")
-                            
-                            lender_query = """
-                            SELECT id, name FROM lenders 
-                            WHERE LOWER(name) LIKE LOWER(%s)
-                            LIMIT 1
-                            """
-                            lender_result = db.execute_query(
-                                lender_query, 
-                                (f"%{lender_name}%",)
-                            )
-                            api_logger.info(f"🔍 Lender search query result: {lender_result}")
-                            
-                            if lender_result:
-                                # Staff member found
-                                lender_id = lender_result[0]['id']
-                                issued_by_lender = lender_result[0]['id']
-                                api_logger.info(f"Found existing staff: {lender_result[0]['name']} (ID: {lender_id})")
-                            else:
-                                # Staff member not found - create automatically
-                                try:
-                                    api_logger.info(f"🚫 Staff not found, creating new staff: '{lender_name}'")
-                                    
-                                    # Generate auto staff ID
-                                    import random
-                                    year = datetime.now().year
-                                    random_num = random.randint(1000, 9999)
-                                    auto_staff_id = f"STF{year}{random_num}"
-                                    api_logger.info(f"🔢 Generated staff ID: {auto_staff_id}")
-                                    
-                                    # Create new staff member with minimal information
-                                    new_staff_query = """
-                                    INSERT INTO lenders (
-                                        name, employee_id, department, designation, 
-                                        authority_level, can_approve_lending, can_lend_high_value
-                                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                                    RETURNING id, name, employee_id
-                                    """
-                                    
-                                    new_staff_params = (
-                                        lender_name,
-                                        auto_staff_id,
-                                        'Auto-Generated',  # Default department
-                                        'Staff',          # Default designation
-                                        'standard',       # Default authority level
-                                        True,            # Can approve lending
-                                        False            # Cannot lend high value items
-                                    )
-                                    
-                                    api_logger.info(f"🔄 Executing staff creation query with params: {new_staff_params}")
-                                    
-                                    new_staff_result = db.execute_query(
-                                        new_staff_query,
-                                        new_staff_params
-                                    )
-                                    
-                                    api_logger.info(f"📝 Staff creation result: {new_staff_result}")
-                                    
-                                    if new_staff_result:
-                                        lender_id = new_staff_result[0]['id']
-                                        issued_by_lender = new_staff_result[0]['id']
-                                        api_logger.info(f"✅ Auto-created staff: {lender_name} (ID: {lender_id}, Employee ID: {auto_staff_id})")
-                                    else:
-                                        api_logger.warning(f"⚠️ Failed to create staff member: {lender_name} - no result returned")
-                                        
-                                except Exception as create_error:
-                                    api_logger.error(f"❌ Error creating staff member {lender_name}: {create_error}")
-                                    import traceback
-                                    api_logger.error(f"❌ Traceback: {traceback.format_exc()}")
-                                    # Continue without staff assignment if creation fails
-                        else:
-                            api_logger.info(f"ℹ️ No lender_name found in extracted data")
-                        invoice_uuid = str(uuid.uuid4())
-                        invoice_query = """
-                        INSERT INTO invoices (
-                            id, student_id, invoice_type, status, due_date, issued_by, notes, lender_id, issued_by_lender
-                        ) VALUES (%s, %s, %s, 'issued', %s, %s, %s, %s, %s)
-                        RETURNING id, invoice_number
+                        # Generate auto student ID
+                        import random
+                        year = datetime.now().year
+                        random_num = random.randint(1000, 9999)
+                        auto_student_id = f"STU{year}{random_num}"
+                        api_logger.info(f"🔢 Generated student ID: {auto_student_id}")
+                        
+                        # Create new student with extracted information
+                        student_uuid = str(uuid.uuid4())
+                        new_student_query = """
+                        INSERT INTO students (
+                            id, student_id, name, email, department, year_of_study
+                        ) VALUES (%s, %s, %s, %s, %s, %s)
+                        RETURNING id, name, student_id
                         """
                         
-                        invoice_result = db.execute_query(
-                            invoice_query,
-                            (
-                                invoice_uuid,
-                                student_id,
-                                'lending',
-                                extracted_data.get('due_date') or None,
-                                'OCR System',
-                                f"Auto-created from OCR processing. Original file: {file.filename}",
-                                lender_id,
-                                issued_by_lender
-                            )
+                        new_student_params = (
+                            student_uuid,
+                            extracted_data.get('student_id') or auto_student_id,  # Use extracted ID or generate one
+                            extracted_data.get('student_name'),
+                            extracted_data.get('student_email', ''),  # Email might be empty
+                            extracted_data.get('department', 'Auto-Generated'),  # Default department
+                            1  # Default year
                         )
                         
-                        if invoice_result:
-                            target_invoice_id = invoice_uuid
-                            api_logger.info(f"Auto-created invoice {invoice_uuid} for {extracted_data.get('student_name')}")
+                        api_logger.info(f"🔄 Executing student creation query with params: {new_student_params}")
                         
-                except Exception as e:
-                    api_logger.warning(f"Invoice auto-creation failed: {e}")
-            
-            # Store image in database if we have an invoice ID
-            image_stored = False
-            image_id = None
-            
-            if target_invoice_id:
-                try:
-                    image_id = str(uuid.uuid4())
-                    insert_query = """
-                    INSERT INTO invoice_images (
-                        id, invoice_id, image_type, image_url, image_filename, 
-                        image_size, image_format, uploaded_by, upload_method,
-                        capture_timestamp, processing_status, ocr_text, notes
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    
-                    # Get file size
-                    file_size = len(file_content)
-                    
-                    db.execute_command(
-                        insert_query,
-                        (
-                            image_id,
-                            target_invoice_id,
-                            'ocr_processed',
-                            f"uploads/invoices/{permanent_filename}",
-                            file.filename or permanent_filename,
-                            file_size,
-                            file_extension.lstrip('.'),
-                            'OCR System',
-                            'ocr_upload',
-                            datetime.now(),
-                            'completed',
-                            ocr_text[:2000] if ocr_text else None,  # Limit OCR text length
-                            f"OCR processed with confidence: {confidence_score*100:.1f}%"
+                        new_student_result = db.execute_query(
+                            new_student_query,
+                            new_student_params
                         )
-                    )
-                    
-                    image_stored = True
-                    api_logger.info(f"Stored image {image_id} for invoice {target_invoice_id}")
-                    
-                except Exception as e:
-                    api_logger.error(f"Failed to store image in database: {e}")
-            
-            # Build result
-            result = {
-                "success": True,
-                "extracted_data": extracted_data,
-                "confidence_score": confidence_score,
-                "raw_text": ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text,
-                "processing_method": "tesseract_ocr",
-                "parse_method": "enhanced_parse_text_simple",
-                "image_stored": image_stored,
-                "image_id": image_id,
-                "invoice_id": target_invoice_id,
-                "image_url": f"uploads/invoices/{permanent_filename}"
-            }
-            
-            if not OCR_AVAILABLE:
-                result.update({
-                    "success": False,
-                    "error": "OCR system not available. Please ensure Tesseract is installed."
-                })
-            elif not ocr_text or len(ocr_text.strip()) <= 10:
-                result.update({
-                    "success": False,
-                    "error": "No readable text found in image"
-                })
-            
-            return result
-                
-        finally:
-            # Clean up temporary file
+                        
+                        api_logger.info(f"📝 Student creation result: {new_student_result}")
+                        
+                        if new_student_result:
+                            student_id = new_student_result[0]['id']
+                            api_logger.info(f"✅ Auto-created student: {extracted_data.get('student_name')} (ID: {student_id})")
+                        else:
+                            api_logger.warning(f"⚠️ Failed to create student: {extracted_data.get('student_name')} - no result returned")
+                            return  # Can't continue without student
+                            
+                    except Exception as create_error:
+                        api_logger.error(f"❌ Error creating student {extracted_data.get('student_name')}: {create_error}")
+                        import traceback
+                        api_logger.error(f"❌ Traceback: {traceback.format_exc()}")
+                        return  # Can't continue without student
+                    
+                    # Try to find lender in database if name was extracted
+                    lender_id = None
+                    issued_by_lender = None
+                    if extracted_data.get('lender_name'):
+                        lender_name = extracted_data['lender_name'].strip()
+                        api_logger.info(f"👤 Looking for staff/lender: '{lender_name}'")
+                        
+                        lender_query = """
+                        SELECT id, name FROM lenders 
+                        WHERE LOWER(name) LIKE LOWER(%s)
+                        LIMIT 1
+                        """
+                        lender_result = db.execute_query(
+                            lender_query, 
+                            (f"%{lender_name}%",)
+                        )
+                        api_logger.info(f"🔍 Lender search query result: {lender_result}")
+                        
+                        if lender_result:
+                            # Staff member found
+                            lender_id = lender_result[0]['id']
+                            issued_by_lender = lender_result[0]['id']
+                            api_logger.info(f"Found existing staff: {lender_result[0]['name']} (ID: {lender_id})")
+                        else:
+                            # Staff member not found - create automatically
+                            try:
+                                api_logger.info(f"🚫 Staff not found, creating new staff: '{lender_name}'")
+                                
+                                # Generate auto staff ID
+                                import random
+                                year = datetime.now().year
+                                random_num = random.randint(1000, 9999)
+                                auto_staff_id = f"STF{year}{random_num}"
+                                api_logger.info(f"🔢 Generated staff ID: {auto_staff_id}")
+                                
+                                # Create new staff member with minimal information
+                                new_staff_query = """
+                                INSERT INTO lenders (
+                                    name, employee_id, department, designation, 
+                                    authority_level, can_approve_lending, can_lend_high_value
+                                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                                RETURNING id, name, employee_id
+                                """
+                                
+                                new_staff_params = (
+                                    lender_name,
+                                    auto_staff_id,
+                                    'Auto-Generated',  # Default department
+                                    'Staff',          # Default designation
+                                    'standard',       # Default authority level
+                                    True,            # Can approve lending
+                                    False            # Cannot lend high value items
+                                )
+                                
+                                api_logger.info(f"🔄 Executing staff creation query with params: {new_staff_params}")
+                                
+                                new_staff_result = db.execute_query(
+                                    new_staff_query,
+                                    new_staff_params
+                                )
+                                
+                                api_logger.info(f"📝 Staff creation result: {new_staff_result}")
+                                
+                                if new_staff_result:
+                                    lender_id = new_staff_result[0]['id']
+                                    issued_by_lender = new_staff_result[0]['id']
+                                    api_logger.info(f"✅ Auto-created staff: {lender_name} (ID: {lender_id}, Employee ID: {auto_staff_id})")
+                                else:
+                                    api_logger.warning(f"⚠️ Failed to create staff member: {lender_name} - no result returned")
+                                    
+                            except Exception as create_error:
+                                api_logger.error(f"❌ Error creating staff member {lender_name}: {create_error}")
+                                import traceback
+                                api_logger.error(f"❌ Traceback: {traceback.format_exc()}")
+                                # Continue without staff assignment if creation fails
+                    else:
+                        api_logger.info(f"ℹ️ No lender_name found in extracted data")
+                    invoice_uuid = str(uuid.uuid4())
+                    invoice_query = """
+                    INSERT INTO invoices (
+                        id, student_id, invoice_type, status, due_date, issued_by, notes, lender_id, issued_by_lender
+                    ) VALUES (%s, %s, %s, 'issued', %s, %s, %s, %s, %s)
+                    RETURNING id, invoice_number
+                    """
+                    
+                    invoice_result = db.execute_query(
+                        invoice_query,
+                        (
+                            invoice_uuid,
+                            student_id,
+                            'lending',
+                            extracted_data.get('due_date') or None,
+                            'OCR System',
+                            f"Auto-created from OCR processing. Original file: {file.filename}",
+                            lender_id,
+                            issued_by_lender
+                        )
+                    )
+                    
+                    if invoice_result:
+                        target_invoice_id = invoice_uuid
+                        api_logger.info(f"Auto-created invoice {invoice_uuid} for {extracted_data.get('student_name')}")
+                    
+            except Exception as e:
+                api_logger.warning(f"Invoice auto-creation failed: {e}")
+        
+        # Store image in database if we have an invoice ID
+        image_stored = False
+        image_id = None
+        
+        if target_invoice_id:
             try:
-                os.unlink(temp_file_path)
-            except:
-                pass
+                image_id = str(uuid.uuid4())
+                insert_query = """
+                INSERT INTO invoice_images (
+                    id, invoice_id, image_type, image_url, image_filename, 
+                    image_size, image_format, uploaded_by, upload_method,
+                    capture_timestamp, processing_status, ocr_text, notes, content_sha256
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """
+                
+                db.execute_command(
+                    insert_query,
+                    (
+                        image_id,
+                        target_invoice_id,
+                        'ocr_processed',
+                        stored.url,
+                        file.filename or stored.path.name,
+                        stored.size,
+                        file_extension.lstrip('.'),
+                        'OCR System',
+                        'ocr_upload',
+                        datetime.now(),
+                        'completed',
+                        ocr_text[:2000] if ocr_text else None,  # Limit OCR text length
+                        f"OCR processed with confidence: {confidence_score*100:.1f}%",
+                        stored.sha256
+                    )
+                )
+                
+                image_stored = True
+                queue_image_variants(stored)
+                api_logger.info(f"Stored image {image_id} for invoice {target_invoice_id}")
+                
+            except Exception as e:
+                api_logger.error(f"Failed to store image in database: {e}")
         
+        # Build result
+        result = {
+            "success": True,
+            "extracted_data": extracted_data,
+            "confidence_score": confidence_score,
+            "raw_text": ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text,
+            "processing_method": "tesseract_ocr",
+            "parse_method": "enhanced_parse_text_simple",
+            "image_stored": image_stored,
+            "image_id": image_id,
+            "invoice_id": target_invoice_id,
+            "image_url": stored.url
+        }
+        
+        if not OCR_AVAILABLE:
+            result.update({
+                "success": False,
+                "error": "OCR system not available. Please ensure Tesseract is installed."
+            })
+        elif not ocr_text or len(ocr_text.strip()) <= 10:
+            result.update({
+                "success": False,
+                "error": "No readable text found in image"
+            })
+        
+        return result
+        
+    except HTTPException:
+        raise
     except Exception as e:
         api_logger.error(f"Error processing OCR upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
+# BATCH OCR INGESTION
+
+MAX_OCR_BATCH_FILES = 50
+OCR_BATCH_COMMIT_SIZE = 10  # Slips turned into invoices per database transaction
+
+def _parse_ocr_date(value: Optional[str]) -> Optional[str]:
+    """ISO date for an OCR'd date string, or None when it cannot be read as one"""
+    if not value:
+        return None
+    iso_date = convert_date_to_iso_format(str(value))
+    try:
+        return datetime.strptime(iso_date, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+def create_invoices_from_ocr_batch(db: DatabaseManager, slips: List[Dict[str, Any]], issued_by: str) -> List[Dict[str, Any]]:
+    """Create the students, invoices, items and images for a batch of OCR'd slips in one transaction
+    
+    Each slip is {"index", "filename", "stored", "ocr_text", "extracted_data", "confidence_score"}.
+    Students are matched by student ID, email or name (including slips earlier in the
+    same batch) and created when missing; staff are matched by name but not created.
+    Returns {"index", "invoice_id", "invoice_number", "student_id", "items_created"} per slip.
+    """
+    student_ids = [s['extracted_data'].get('student_id') for s in slips if s['extracted_data'].get('student_id')]
+    emails = [s['extracted_data'].get('student_email') for s in slips if s['extracted_data'].get('student_email')]
+    names = [s['extracted_data']['student_name'].lower() for s in slips]
+    lender_names = [s['extracted_data'].get('lender_name', '').strip().lower() for s in slips]
+    
+    with db.transaction() as cursor:
+        cursor.execute("""
+        SELECT id, student_id, email, LOWER(name) AS name_key FROM students
+        WHERE student_id = ANY(%s) OR email = ANY(%s) OR LOWER(name) = ANY(%s)
+        """, (student_ids, emails, names))
+        known_students = {}
+        for row in cursor.fetchall():
+            for key in (('student_id', row['student_id']), ('email', row['email']), ('name', row['name_key'])):
+                if key[1]:
+                    known_students.setdefault(key, str(row['id']))
+        
+        cursor.execute(
+            "SELECT id, LOWER(name) AS name_key FROM lenders WHERE LOWER(name) = ANY(%s)",
+            ([name for name in lender_names if name],)
+        )
+        lenders = {row['name_key']: str(row['id']) for row in cursor.fetchall()}
+        
+        new_students, invoice_rows, item_rows, image_rows, transaction_rows = [], [], [], [], []
+        created = []
+        for slip, lender_name in zip(slips, lender_names):
+            data = slip['extracted_data']
+            keys = [('student_id', data.get('student_id')), ('email', data.get('student_email')),
+                    ('name', data['student_name'].lower())]
+            student_uuid = next((known_students[key] for key in keys if key[1] and key in known_students), None)
+            if student_uuid is None:
+                student_uuid = str(uuid.uuid4())
+                student_number = data.get('student_id') or f"STU{datetime.now().year}{uuid.uuid4().hex[:6].upper()}"
+                new_students.append((
+                    student_uuid, student_number, data['student_name'],
+                    data.get('student_email') or f"{student_number.lower()}@student.local",
+                    data.get('department') or 'Auto-Generated', 1
+                ))
+                for key in keys:
+                    if key[1]:
+                        known_students[key] = student_uuid
+            
+            invoice_uuid = str(uuid.uuid4())
+            items = []
+            for item in data.get('items') or []:
+                if not item.get('name'):
+                    continue
+                quantity = int(item.get('quantity') or 1)
+                unit_value = float(item.get('unit_value') or 0)
+                items.append((
+                    invoice_uuid, item['name'][:200], (item.get('sku') or '')[:100],
+                    item.get('serial_number') or None, quantity, unit_value,
+                    float(item.get('total_value') or quantity * unit_value)
+                ))
+            item_rows.extend(items)
+            lender_id = lenders.get(lender_name)
+            invoice_rows.append((
+                invoice_uuid, student_uuid, _parse_ocr_date(data.get('due_date')), issued_by,
+                f"Auto-created from batch OCR. Original file: {slip['filename']}",
+                lender_id, lender_id,
+                sum(row[4] for row in items), sum(row[6] for row in items)
+            ))
+            stored = slip['stored']
+            image_rows.append((
+                invoice_uuid, 'ocr_processed', stored.url, slip['filename'], stored.size,
+                stored.path.suffix.lstrip('.'), issued_by, 'ocr_batch', 'completed',
+                slip['ocr_text'][:2000] if slip['ocr_text'] else None,
+                f"OCR processed with confidence: {slip['confidence_score']*100:.1f}%", stored.sha256
+            ))
+            transaction_rows.append((invoice_uuid, issued_by))
+            created.append({
+                "index": slip['index'], "invoice_id": invoice_uuid,
+                "student_id": student_uuid, "items_created": len(items)
+            })
+        
+        if new_students:
+            execute_values(cursor, """
+            INSERT INTO students (id, student_id, name, email, department, year_of_study) VALUES %s
+            """, new_students, page_size=len(new_students))
+        invoice_numbers = execute_values(cursor, """
+        INSERT INTO invoices (
+            id, student_id, invoice_type, status, due_date, issued_by, notes,
+            lender_id, issued_by_lender, total_items, total_value
+        ) VALUES %s
+        RETURNING id, invoice_number
+        """, invoice_rows, template="(%s::uuid, %s::uuid, 'lending', 'issued', %s::date, %s, %s, %s::uuid, %s::uuid, %s, %s)",
+            page_size=len(invoice_rows), fetch=True)
+        if item_rows:
+            execute_values(cursor, """
+            INSERT INTO invoice_items (
+                invoice_id, product_name, product_sku, serial_number, quantity, unit_value, total_value
+            ) VALUES %s
+            """, item_rows, template="(%s::uuid, %s, %s, %s, %s, %s, %s)", page_size=len(item_rows))
+        execute_values(cursor, """
+        INSERT INTO invoice_images (
+            invoice_id, image_type, image_url, image_filename, image_size, image_format,
+            uploaded_by, upload_method, processing_status, ocr_text, notes, content_sha256
+        ) VALUES %s
+        """, image_rows, template="(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", page_size=len(image_rows))
+        execute_values(cursor, """
+        INSERT INTO invoice_transactions (
+            invoice_id, transaction_type, previous_status, new_status, performed_by, changes_summary
+        ) VALUES %s
+        """, transaction_rows, template="(%s::uuid, 'created', NULL, 'issued', %s, 'Created from batch OCR')",
+            page_size=len(transaction_rows))
+    
+    numbers = {str(row['id']): row['invoice_number'] for row in invoice_numbers}
+    for invoice in created:
+        invoice['invoice_number'] = numbers.get(invoice['invoice_id'])
+    return created
+
+async def _ocr_batch_file(db: DatabaseManager, index: int, filename: str, stored: StoredFile) -> tuple[Dict[str, Any], str]:
+    """OCR one file of a batch: the NDJSON result line and the full OCR text"""
+    result = {
+        "type": "ocr", "index": index, "filename": filename, "success": False,
+        "content_sha256": stored.sha256, "image_url": stored.url,
+        "extracted_data": {}, "confidence_score": 0.0, "raw_text": "", "error": None
+    }
+    try:
+        ocr_text, extracted_data, confidence_score = await extract_invoice_data_cached(db, stored, wait_for_slot=True)
+    except OCRTimeout:
+        result["error"] = "OCR took too long for this image"
+        return result, ""
+    except Exception as e:
+        api_logger.error(f"Batch OCR failed for {filename}: {e}")
+        result["error"] = str(e)
+        return result, ""
+    
+    success = bool(ocr_text) and len(ocr_text.strip()) > 10
+    result.update({
+        "success": success,
+        "extracted_data": extracted_data,
+        "confidence_score": confidence_score,
+        "raw_text": ocr_text[:500] + "..." if len(ocr_text) > 500 else ocr_text,
+        "error": None if success else "No readable text found in image"
+    })
+    return result, ocr_text
+
+@invoice_router.post("/ocr-batch")
+async def process_invoice_batch_with_ocr(
+    files: List[UploadFile] = File(...),
+    auto_create_invoice: bool = Form(True),
+    issued_by: str = Form("Bulk OCR System"),
+    db: DatabaseManager = Depends(get_db)
+):
+    """OCR a stack of scanned slips and stream the results as NDJSON
+    
+    All files are OCR'd concurrently through the OCR pool and a {"type": "ocr"} line
+    is written for each as soon as it finishes. With auto_create_invoice, slips that
+    name a student are turned into invoices OCR_BATCH_COMMIT_SIZE at a time, each group
+    in one transaction, followed by a {"type": "invoice"} line per slip. The last line
+    is {"type": "summary"}.
+    """
+    if not OCR_AVAILABLE:
+        raise HTTPException(status_code=503, detail="OCR functionality not available - missing required libraries")
+    if len(files) > MAX_OCR_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_OCR_BATCH_FILES} files per batch")
+    for file in files:
+        if not file.content_type or not file.content_type.startswith(('image/', 'application/pdf')):
+            raise HTTPException(status_code=400, detail=f"{file.filename}: only image and PDF files are supported")
+    
+    # Store every upload before streaming starts; the request body is gone after that
+    batch = []
+    for index, file in enumerate(files):
+        stored = await store_upload(db, file)
+        batch.append((index, file.filename or stored.path.name, stored))
+    api_logger.info(f"OCR batch of {len(batch)} files stored, auto_create_invoice={auto_create_invoice}")
+    
+    stored_by_index = {index: stored for index, _, stored in batch}
+    pending_slips = []
+    counts = {"files": len(batch), "ocr_succeeded": 0, "invoices_created": 0}
+    
+    def create_pending_invoices() -> List[str]:
+        """Turn the slips collected so far into invoices and return their NDJSON lines"""
+        slips = pending_slips[:]
+        pending_slips.clear()
+        if not slips:
+            return []
+        try:
+            created = create_invoices_from_ocr_batch(db, slips, issued_by)
+            lines = [{"type": "invoice", "success": True, **invoice} for invoice in created]
+            counts["invoices_created"] += len(created)
+            for slip in slips:
+                queue_image_variants(slip['stored'])
+        except Exception as e:
+            api_logger.error(f"Failed to create invoices for OCR batch: {e}")
+            lines = [{"type": "invoice", "index": slip['index'], "success": False, "error": str(e)} for slip in slips]
+        return [json.dumps(line, default=str) + "\n" for line in lines]
+    
+    async def results():
+        tasks = [asyncio.create_task(_ocr_batch_file(db, *entry)) for entry in batch]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result, ocr_text = await finished
+                yield json.dumps(result, default=str) + "\n"
+                if not result["success"]:
+                    continue
+                counts["ocr_succeeded"] += 1
+                if auto_create_invoice and result["extracted_data"].get("student_name"):
+                    pending_slips.append({
+                        "index": result["index"], "filename": result["filename"],
+                        "stored": stored_by_index[result["index"]], "ocr_text": ocr_text,
+                        "extracted_data": result["extracted_data"], "confidence_score": result["confidence_score"]
+                    })
+                if len(pending_slips) >= OCR_BATCH_COMMIT_SIZE:
+                    for line in create_pending_invoices():
+                        yield line
+            for line in create_pending_invoices():
+                yield line
+            yield json.dumps({"type": "summary", **counts}) + "\n"
+        finally:
+            # The client went away: OCR not started yet is not needed any more
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 # BULK OPERATIONS
 
 @invoice_router.post("/bulk-create", response_model=List[Invoice])
@@ -1783,58 +2479,262 @@ async def create_bulk_invoices(
     bulk_request: BulkInvoiceCreate,
     db: DatabaseManager = Depends(get_db)
 ):
-    """Create invoices for multiple orders"""
-    created_invoices = []
+    """Create invoices for multiple orders
+    
+    All approved orders in the request are invoiced by one statement: the
+    invoices are inserted from a SELECT over orders, and their items and
+    'created' transactions are copied in the same statement, so the batch
+    either lands completely or not at all. As for single invoices, only
+    approved order items are copied, at their approved quantity. Orders that
+    are missing or not approved are skipped, as before.
+    """
+    order_ids = parse_id_list(','.join(bulk_request.order_ids))
+    if not order_ids:
+        return []
     
-    for order_id in bulk_request.order_ids:
-        # Get order info
-        order_query = """
-        SELECT id, student_id, total_items, expected_return_date 
-        FROM orders 
-        WHERE id = %s AND status = 'approved'
-        """
-        order_result = db.execute_query(order_query, (order_id,))
-        
-        if order_result:
-            order_data = order_result[0]
-            # Create invoice
-            invoice_query = """
-            INSERT INTO invoices (
-                order_id, student_id, invoice_type, status, total_items,
-                due_date, issued_by, notes, lender_id, issued_by_lender
-            ) VALUES (%s, %s, 'lending', 'issued', %s, %s, %s, %s, %s, %s)
-            RETURNING *
-            """
-            
-            invoice_result = db.execute_query(
-                invoice_query,
-                (
-                    order_id, order_data['student_id'], order_data['total_items'],
-                    order_data['expected_return_date'], bulk_request.issued_by, bulk_request.notes,
-                    order_data.get('lender_id'), order_data.get('lender_name')
-                )
-            )
-            
-            if invoice_result:
-                created_invoices.append(invoice_result[0])
+    query = """
+    WITH order_totals AS (
+        SELECT oi.order_id, COALESCE(SUM(p.unit_price * oi.quantity_approved), 0) AS total_value
+        FROM order_items oi
+        LEFT JOIN products p ON p.id = oi.product_id
+        WHERE oi.order_id = ANY(%s::uuid[]) AND oi.status = 'approved'
+        GROUP BY oi.order_id
+    ),
+    new_invoices AS (
+        INSERT INTO invoices (
+            order_id, student_id, invoice_type, status, total_items, total_value,
+            due_date, issued_by, notes, lender_id, issued_by_lender
+        )
+        SELECT o.id, o.student_id, 'lending', 'issued', o.total_items,
+               COALESCE(ot.total_value, 0), o.expected_return_date, %s, %s,
+               o.lender_id, o.lender_id
+        FROM orders o
+        LEFT JOIN order_totals ot ON ot.order_id = o.id
+        WHERE o.id = ANY(%s::uuid[]) AND o.status = 'approved'
+        RETURNING *
+    ),
+    new_items AS (
+        INSERT INTO invoice_items (
+            invoice_id, order_item_id, product_id, product_name, product_sku,
+            quantity, unit_value, total_value, notes
+        )
+        SELECT ni.id, oi.id, oi.product_id, COALESCE(p.name, ''), COALESCE(p.sku, ''),
+               oi.quantity_approved, COALESCE(p.unit_price, 0),
+               COALESCE(p.unit_price, 0) * oi.quantity_approved, oi.notes
+        FROM new_invoices ni
+        JOIN order_items oi ON oi.order_id = ni.order_id AND oi.status = 'approved'
+        LEFT JOIN products p ON p.id = oi.product_id
+        RETURNING invoice_id
+    ),
+    new_transactions AS (
+        INSERT INTO invoice_transactions (
+            invoice_id, transaction_type, previous_status, new_status,
+            performed_by, changes_summary
+        )
+        SELECT ni.id, 'created', NULL, 'issued', %s, 'Bulk created from order'
+        FROM new_invoices ni
+        RETURNING invoice_id
+    )
+    SELECT * FROM new_invoices ORDER BY created_at, invoice_number
+    """
+    
+    try:
+        with db.transaction() as cursor:
+            cursor.execute(query, (
+                order_ids, bulk_request.issued_by, bulk_request.notes,
+                order_ids, bulk_request.issued_by
+            ))
+            created_invoices = [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        api_logger.error(f"Error creating bulk invoices: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to create invoices: {str(e)}")
     
+    skipped = len(order_ids) - len(created_invoices)
+    api_logger.info(f"Bulk created {len(created_invoices)} invoices ({skipped} orders skipped)")
     return created_invoices
 
+# INVOICE RENDERING (PDF/PNG)
+
+MAX_RENDER_BATCH = 500
+
+def fetch_invoices_for_render(db: DatabaseManager, invoice_ids: List[str]) -> List[Dict[str, Any]]:
+    """Load everything drawn on the printed invoice, plus the version and lender-name digest used as the render cache key"""
+    query = """
+    SELECT 
+        i.id, i.invoice_number, i.invoice_type, i.status, i.issue_date, i.due_date,
+        i.created_at, i.total_value, i.issued_by,
+        s.name as student_name,
+        s.student_id as student_id_number,
+        s.email as student_email,
+        l.name as lender_name,
+        l2.name as issued_by_lender_name,
+        COALESCE((
+            SELECT json_agg(ii ORDER BY ii.created_at)
+            FROM invoice_items ii WHERE ii.invoice_id = i.id
+        ), '[]'::json) as items,
+        GREATEST(i.updated_at, i.created_at, s.updated_at, (
+            SELECT MAX(ii.updated_at) FROM invoice_items ii WHERE ii.invoice_id = i.id
+        )) as render_version,
+        -- lenders have no updated_at, so renames are caught by hashing the names drawn
+        LEFT(md5(COALESCE(l.name, '') || '|' || COALESCE(l2.name, '')), 12) as render_names_digest
+    FROM invoices i
+    LEFT JOIN students s ON i.student_id = s.id
+    LEFT JOIN lenders l ON i.lender_id = l.id
+    LEFT JOIN lenders l2 ON i.issued_by_lender = l2.id
+    WHERE i.id = ANY(%s::uuid[])
+    """
+    return db.execute_query(query, (invoice_ids,))
+
+async def _rendered_invoice_response(invoice_id: str, fmt: str, db: DatabaseManager):
+    invoice_ids = parse_id_list(invoice_id)
+    invoices = fetch_invoices_for_render(db, invoice_ids) if invoice_ids else []
+    if not invoices:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    
+    invoice = invoices[0]
+    paths = await render_invoices([invoice], fmt)
+    path = paths.get(str(invoice['id']))
+    if not path:
+        raise HTTPException(status_code=500, detail="Failed to render invoice")
+    
+    filename = f"Invoice_{invoice.get('invoice_number') or invoice['id']}.{fmt}"
+    return FileResponse(path, media_type=RENDER_FORMATS[fmt], filename=filename)
+
+@invoice_router.get("/{invoice_id}/pdf")
+async def get_invoice_pdf(invoice_id: str, db: DatabaseManager = Depends(get_db)):
+    """Download the printable PDF for an invoice (rendered once per invoice version)"""
+    return await _rendered_invoice_response(invoice_id, "pdf", db)
+
+@invoice_router.get("/{invoice_id}/png")
+async def get_invoice_png(invoice_id: str, db: DatabaseManager = Depends(get_db)):
+    """Download the invoice as a PNG image (rendered once per invoice version)"""
+    return await _rendered_invoice_response(invoice_id, "png", db)
+
+@invoice_router.post("/render")
+async def render_invoice_batch(request: InvoiceRenderRequest, db: DatabaseManager = Depends(get_db)):
+    """Render many invoices in parallel worker processes
+    
+    Already rendered, unchanged invoices come straight from the disk cache.
+    Each result links to the download endpoint, which then serves the cached file.
+    """
+    fmt = request.format.lower()
+    if fmt not in RENDER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{request.format}'. Use pdf or png")
+    
+    invoice_ids = parse_id_list(','.join(request.invoice_ids))
+    if not invoice_ids:
+        raise HTTPException(status_code=400, detail="No valid invoice ids provided")
+    if len(invoice_ids) > MAX_RENDER_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RENDER_BATCH} invoices can be rendered per request")
+    
+    invoices = fetch_invoices_for_render(db, invoice_ids)
+    paths = await render_invoices(invoices, fmt)
+    
+    found = {str(invoice['id']): invoice for invoice in invoices}
+    results = []
+    for invoice_id in invoice_ids:
+        invoice = found.get(invoice_id)
+        if not invoice:
+            results.append({"invoice_id": invoice_id, "success": False, "error": "Invoice not found"})
+        elif invoice_id not in paths:
+            results.append({"invoice_id": invoice_id, "success": False, "error": "Rendering failed"})
+        else:
+            results.append({
+                "invoice_id": invoice_id,
+                "invoice_number": invoice.get('invoice_number'),
+                "success": True,
+                "url": f"/api/invoices/{invoice_id}/{fmt}"
+            })
+    
+    rendered = sum(1 for result in results if result['success'])
+    return {
+        "success": rendered == len(invoice_ids),
+        "format": fmt,
+        "rendered": rendered,
+        "failed": len(invoice_ids) - rendered,
+        "results": results
+    }
+
 # DASHBOARD AND ANALYTICS
 
+# Expected invoice_summary_counters contents, computed from the base table.
+# Must produce the same keys as apply_invoice_summary_delta() in the schema.
+INVOICE_SUMMARY_EXPECTED_QUERY = """
+SELECT k.dimension, k.bucket, COUNT(*) AS invoice_count, COALESCE(SUM(i.total_value), 0) AS total_value
+FROM invoices i
+CROSS JOIN LATERAL (VALUES
+    ('all', 'all'),
+    ('status', COALESCE(i.status, 'unknown')),
+    ('type', COALESCE(i.invoice_type, 'unknown')),
+    ('month', TO_CHAR(i.created_at, 'YYYY-MM')),
+    ('acknowledged', CASE WHEN i.acknowledged_by_student THEN 'true' END),
+    ('physical_captured', CASE WHEN i.physical_invoice_captured THEN 'true' END),
+    ('issued_due', CASE WHEN i.status = 'issued' THEN TO_CHAR(i.due_date, 'YYYY-MM-DD') END)
+) AS k(dimension, bucket)
+WHERE k.bucket IS NOT NULL
+GROUP BY k.dimension, k.bucket
+"""
+INVOICE_SUMMARY_RECONCILE_HOUR = int(os.getenv('INVOICE_SUMMARY_RECONCILE_HOUR', 2))
+
+def reconcile_invoice_summary(db: Optional[DatabaseManager] = None) -> Dict[str, Any]:
+    """Check the trigger-maintained invoice counters against the invoices table
+    and rebuild them if they have drifted. Run nightly by the scheduler."""
+    try:
+        with job_db(db) as job_connection, job_connection.transaction() as cursor:
+            # Block counter updates while comparing so in-flight writes can't look like drift
+            cursor.execute("LOCK TABLE invoice_summary_counters IN EXCLUSIVE MODE")
+            cursor.execute(f"""
+            WITH expected AS ({INVOICE_SUMMARY_EXPECTED_QUERY})
+            SELECT COALESCE(e.dimension, c.dimension) AS dimension,
+                   COALESCE(e.bucket, c.bucket) AS bucket,
+                   COALESCE(e.invoice_count, 0) AS expected_count,
+                   COALESCE(c.invoice_count, 0) AS actual_count
+            FROM expected e
+            FULL OUTER JOIN invoice_summary_counters c
+                ON c.dimension = e.dimension AND c.bucket = e.bucket
+            WHERE COALESCE(e.invoice_count, 0) <> COALESCE(c.invoice_count, 0)
+               OR COALESCE(e.total_value, 0) <> COALESCE(c.total_value, 0)
+            """)
+            mismatches = [dict(row) for row in cursor.fetchall()]
+            
+            if mismatches:
+                api_logger.warning(
+                    f"Invoice summary counters drifted in {len(mismatches)} buckets, rebuilding: "
+                    f"{mismatches[:10]}"
+                )
+                cursor.execute("DELETE FROM invoice_summary_counters")
+                cursor.execute(f"""
+                INSERT INTO invoice_summary_counters (dimension, bucket, invoice_count, total_value)
+                {INVOICE_SUMMARY_EXPECTED_QUERY}
+                """)
+            else:
+                # Drop buckets that have emptied out
+                cursor.execute("DELETE FROM invoice_summary_counters WHERE invoice_count = 0")
+        
+        api_logger.info(f"Invoice summary reconciliation complete ({len(mismatches)} mismatched buckets)")
+        return {"success": True, "mismatches": len(mismatches)}
+    except Exception as e:
+        api_logger.error(f"Invoice summary reconciliation failed: {e}")
+        return {"success": False, "error": str(e)}
+
 @invoice_router.get("/analytics/summary", response_model=InvoiceSummary)
 async def get_invoice_summary(db: DatabaseManager = Depends(get_db)):
-    """Get invoice analytics summary"""
+    """Get invoice analytics summary from the maintained counters"""
     query = """
     SELECT 
-        COUNT(*) as total_invoices,
-        COUNT(CASE WHEN status = 'issued' THEN 1 END) as issued_invoices,
-        COUNT(CASE WHEN acknowledged_by_student = true THEN 1 END) as acknowledged_invoices,
-        COUNT(CASE WHEN status = 'issued' AND due_date > CURRENT_DATE THEN 1 END) as pending_returns,
-        COUNT(CASE WHEN status = 'issued' AND due_date < CURRENT_DATE THEN 1 END) as overdue_returns,
-        COUNT(CASE WHEN physical_invoice_captured = true THEN 1 END) as physical_invoices_captured,
-        COALESCE(SUM(total_value), 0) as total_lending_value
-    FROM invoices
+        COALESCE(SUM(invoice_count) FILTER (WHERE dimension = 'all'), 0) as total_invoices,
+        COALESCE(SUM(invoice_count) FILTER (WHERE dimension = 'status' AND bucket = 'issued'), 0) as issued_invoices,
+        COALESCE(SUM(invoice_count) FILTER (WHERE dimension = 'acknowledged'), 0) as acknowledged_invoices,
+        COALESCE(SUM(invoice_count) FILTER (
+            WHERE dimension = 'issued_due' AND bucket >= TO_CHAR(CURRENT_DATE, 'YYYY-MM-DD')
+        ), 0) as pending_returns,
+        COALESCE(SUM(invoice_count) FILTER (
+            WHERE dimension = 'issued_due' AND bucket < TO_CHAR(CURRENT_DATE, 'YYYY-MM-DD')
+        ), 0) as overdue_returns,
+        COALESCE(SUM(invoice_count) FILTER (WHERE dimension = 'physical_captured'), 0) as physical_invoices_captured,
+        COALESCE(SUM(total_value) FILTER (WHERE dimension = 'all'), 0) as total_lending_value
+    FROM invoice_summary_counters
+    WHERE dimension IN ('all', 'status', 'acknowledged', 'issued_due', 'physical_captured')
     """
     
     result = db.execute_query(query)
@@ -1851,33 +2751,21 @@ async def get_invoice_summary(db: DatabaseManager = Depends(get_db)):
 @invoice_router.get("/analytics/stats", response_model=InvoiceStats)
 async def get_invoice_stats(db: DatabaseManager = Depends(get_db)):
     """Get detailed invoice statistics"""
-    # By type
-    type_query = """
-    SELECT invoice_type, COUNT(*) as count
-    FROM invoices 
-    GROUP BY invoice_type
-    """
-    by_type = {row['invoice_type']: row['count'] for row in db.execute_query(type_query)}
-    
-    # By status
-    status_query = """
-    SELECT status, COUNT(*) as count
-    FROM invoices 
-    GROUP BY status
-    """
-    by_status = {row['status']: row['count'] for row in db.execute_query(status_query)}
-    
-    # By month
-    month_query = """
-    SELECT 
-        TO_CHAR(created_at, 'YYYY-MM') as month,
-        COUNT(*) as count
-    FROM invoices 
-    WHERE created_at >= CURRENT_DATE - INTERVAL '12 months'
-    GROUP BY TO_CHAR(created_at, 'YYYY-MM')
-    ORDER BY month
+    # By type, status and month (last 12 months) from the maintained counters
+    counters_query = """
+    SELECT dimension, bucket, invoice_count
+    FROM invoice_summary_counters
+    WHERE invoice_count > 0
+      AND (dimension IN ('type', 'status')
+           OR (dimension = 'month' AND bucket >= TO_CHAR(CURRENT_DATE - INTERVAL '12 months', 'YYYY-MM')))
+    ORDER BY dimension, bucket
     """
-    by_month = {row['month']: row['count'] for row in db.execute_query(month_query)}
+    by_type = {}
+    by_status = {}
+    by_month = {}
+    buckets = {'type': by_type, 'status': by_status, 'month': by_month}
+    for row in db.execute_query(counters_query):
+        buckets[row['dimension']][row['bucket']] = row['invoice_count']
     
     # Recent activity
     activity_query = """
@@ -1902,201 +2790,65 @@ async def get_invoice_stats(db: DatabaseManager = Depends(get_db)):
 
 # UTILITY FUNCTIONS
 
-# UTILITY FUNCTIONS
+async def run_ocr_when_free(path: Path) -> str:
+    """run_ocr for background work: wait for a free slot instead of failing when the OCR queue is full"""
+    while True:
+        try:
+            return await run_ocr(str(path))
+        except OCRQueueFull:
+            await asyncio.sleep(1)
 
-def extract_text_from_image(image_path: str) -> str:
-    """Lightweight OCR optimized for low-memory systems (8GB RAM)"""
-    if not OCR_AVAILABLE:
-        api_logger.warning("OCR libraries not available")
-        return ""
+async def extract_invoice_data_cached(
+    db: DatabaseManager, stored: StoredFile, wait_for_slot: bool = False
+) -> tuple[str, dict, float]:
+    """OCR text, parsed fields and confidence for a stored upload, reusing an earlier run on the same content"""
+    cached = get_cached_ocr(db, stored.sha256)
+    if cached and cached.extracted_data is not None:
+        api_logger.info(f"OCR cache hit for content {stored.sha256}")
+        return cached.ocr_text, cached.extracted_data, cached.confidence_score or 0.0
+    
+    if cached:
+        ocr_text = cached.ocr_text
+    elif wait_for_slot:
+        ocr_text = await run_ocr_when_free(stored.path)
+    else:
+        ocr_text = await run_ocr(str(stored.path))
+    extracted_data, confidence_score = parse_ocr_text(ocr_text)
+    save_ocr_result(db, stored.sha256, ocr_text, extracted_data, confidence_score)
+    return ocr_text, extracted_data, confidence_score
+
+def parse_ocr_text(ocr_text: str) -> tuple[dict, float]:
+    """Structured invoice fields and a 0-1 confidence for OCR text, falling back to the basic parser"""
+    if not ocr_text or len(ocr_text.strip()) <= 10:
+        api_logger.warning("⚠️ OCR text too short or empty")
+        return {}, 0.0
     
+    # Use our enhanced parse_text_simple function for comprehensive extraction
     try:
-        api_logger.info(f"Starting lightweight OCR for: {image_path}")
-        
-        if not os.path.exists(image_path):
-            api_logger.error(f"Image file not found: {image_path}")
-            return ""
-        
-        # Load and resize image if too large (memory optimization)
-        try:
-            # Check if file is a PDF and handle accordingly
-            if image_path.lower().endswith('.pdf'):
-                api_logger.info("Processing PDF file - converting to image")
-                try:
-                    import fitz  # PyMuPDF
-                    # Open PDF and convert first page to image
-                    doc = fitz.open(image_path)
-                    page = doc[0]
-                    
-                    # Convert to high-res image
-                    mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better OCR
-                    pix = page.get_pixmap(matrix=mat)
-                    
-                    # Convert to PIL Image
-                    img_data = pix.tobytes("ppm")
-                    image = Image.open(io.BytesIO(img_data))
-                    
-                    doc.close()
-                    api_logger.info(f"PDF converted to image: {image.size}")
-                    
-                except ImportError:
-                    api_logger.error("PyMuPDF not available for PDF processing")
-                    return ""
-                except Exception as pdf_error:
-                    api_logger.error(f"Failed to process PDF: {pdf_error}")
-                    return ""
-            else:
-                # Handle regular image files
-                image = Image.open(image_path)
-            
-            # Limit image size to reduce memory usage
-            max_dimension = 2000
-            if max(image.size) > max_dimension:
-                ratio = max_dimension / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                # Use LANCZOS for newer PIL versions, fallback to ANTIALIAS for older
-                try:
-                    image = image.resize(new_size, Image.LANCZOS)
-                except AttributeError:
-                    image = image.resize(new_size, Image.ANTIALIAS)
-                api_logger.info(f"Resized image to: {image.size}")
-                
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-                
-            api_logger.info(f"Image loaded: {image.size}, mode: {image.mode}")
-            
-        except Exception as e:
-            api_logger.error(f"Failed to load image: {e}")
-            return ""
-        
-        best_text = ""
-        best_score = 0
-        
-        # Memory-efficient preprocessing - only keep 2 versions max
-        try:
-            # Convert to numpy once
-            img_array = np.array(image)
-            
-            # Simple grayscale conversion
-            if len(img_array.shape) == 3:
-                if CV2_AVAILABLE:
-                    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-                else:
-                    # Fallback using PIL/numpy
-                    gray = np.dot(img_array[...,:3], [0.2989, 0.5870, 0.1140]).astype(np.uint8)
-            else:
-                gray = img_array
-            
-            # Only create 2 versions to save memory
-            versions = [
-                ("Original", gray),
-            ]
-            
-            # Add one enhanced version only if image quality seems poor
-            try:
-                # Quick contrast check
-                contrast = gray.std()
-                if contrast < 40 and CV2_AVAILABLE:  # Low contrast image
-                    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-                    enhanced = clahe.apply(gray)
-                    versions.append(("Enhanced", enhanced))
-                    api_logger.info("Added enhanced version for low contrast")
-                elif contrast < 40:
-                    # Simple contrast enhancement without cv2
-                    enhanced = np.clip(gray * 1.5, 0, 255).astype(np.uint8)
-                    versions.append(("Enhanced", enhanced))
-                    api_logger.info("Added simple enhanced version (no cv2)")
-            except Exception as e:
-                api_logger.debug(f"Enhancement failed: {e}")
-            
-        except Exception as e:
-            api_logger.warning(f"Preprocessing failed, using PIL: {e}")
-            versions = [("PIL", image)]
-        
-        # Simplified OCR configs - only the most effective ones
-        configs = [
-            '--psm 6 --oem 3',      # Most reliable for documents
-            '--psm 4 --oem 3',      # Single column
-        ]
-        
-        # Process each version
-        for version_name, img_data in versions:
-            try:
-                # Convert to PIL if needed
-                if isinstance(img_data, np.ndarray):
-                    pil_img = Image.fromarray(img_data)
-                else:
-                    pil_img = img_data
-                
-                for config in configs:
-                    try:
-                        # Extract text with timeout protection
-                        text = pytesseract.image_to_string(pil_img, config=config, timeout=30)
-                        text_len = len(text.strip())
-                        
-                        # Simple scoring based on text length and basic patterns
-                        score = text_len
-                        
-                        # Bonus for common invoice patterns
-                        if any(word in text.lower() for word in ['invoice', 'total', 'student', 'equipment']):
-                            score += 50
-                        
-                        # Bonus for numbers (prices, dates, IDs)
-                        import re
-                        if re.search(r'\d+', text):
-                            score += 20
-                            
-                        if score > best_score and text_len > 10:
-                            best_text = text
-                            best_score = score
-                            api_logger.info(f"Better OCR: {version_name}, score: {score}, length: {text_len}")
-                    
-                    except Exception as e:
-                        api_logger.debug(f"OCR failed for {version_name}: {e}")
-                        continue
-                
-                # Clear memory immediately after processing each version
-                if isinstance(img_data, np.ndarray):
-                    del img_data
-                    
-            except Exception as e:
-                api_logger.warning(f"Version processing failed: {e}")
-                continue
-        
-        # Fallback if nothing worked
-        if not best_text.strip():
-            try:
-                api_logger.info("Using simple fallback OCR")
-                best_text = pytesseract.image_to_string(image, config='--psm 6', timeout=20)
-            except Exception as e:
-                api_logger.error(f"Fallback OCR failed: {e}")
-                return ""
-        
-        # Memory cleanup
-        del image
-        if 'img_array' in locals():
-            del img_array
-        if 'gray' in locals():
-            del gray
-            
-        result_length = len(best_text.strip())
-        api_logger.info(f"OCR completed. Score: {best_score}, length: {result_length}")
-        
-        # Provide confidence feedback based on score
-        if best_score > 100:
-            api_logger.info("HIGH CONFIDENCE - Good text extraction")
-        elif best_score > 50:
-            api_logger.info("MEDIUM CONFIDENCE - Review extracted data")
-        else:
-            api_logger.warning("LOW CONFIDENCE - Consider retaking photo")
-        
-        return best_text.strip()
-        
-    except Exception as e:
-        api_logger.error(f"OCR processing failed: {e}")
-        return ""
+        extracted_data = parse_text_simple(ocr_text)
+        confidence_score = min(extracted_data.get('confidence_score', 95), 95) / 100.0
+        api_logger.info(f"✅ Data extraction successful with confidence: {confidence_score}")
+        return extracted_data, confidence_score
+    except Exception as parse_error:
+        api_logger.error(f"❌ Error in parse_text_simple: {parse_error}")
+    
+    # Fallback to basic extraction
+    try:
+        api_logger.info("🔄 Trying fallback parser...")
+        extracted_data = parse_text_simple_fallback(ocr_text)
+        api_logger.info(f"✅ Fallback parser successful")
+        return extracted_data, extracted_data.get('confidence_score', 30) / 100.0
+    except Exception as fallback_error:
+        api_logger.error(f"❌ Even fallback parser failed: {fallback_error}")
+        return {
+            "student_name": "",
+            "student_id": "",
+            "student_email": "",
+            "department": "",
+            "due_date": "",
+            "items": [],
+            "confidence_score": 0
+        }, 0.0
 
 def extract_invoice_information(ocr_text: str) -> dict:
     """Extract structured information from OCR text"""
@@ -2242,12 +2994,15 @@ def log_invoice_transaction(
         )
     except Exception as e:
         api_logger.error(f"Error logging transaction: {e}")
+    finally:
+        invalidate_invoice_cache(invoice_id)
 
 @invoice_router.post("/ocr/extract")
 async def extract_invoice_data_from_image(
     file: UploadFile = File(...),
     image_type: str = Form(default="invoice_upload"),
-    extract_data: bool = Form(default=True)
+    extract_data: bool = Form(default=True),
+    db: DatabaseManager = Depends(get_db)
 ):
     """
     Extract invoice data from uploaded image using OCR
@@ -2269,23 +3024,22 @@ async def extract_invoice_data_from_image(
         if file.content_type and not (file.content_type.startswith('image/') or file.content_type == 'application/pdf'):
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
         
-        # Save temporary file with unique name to prevent caching
-        temp_dir = Path("temp_uploads")
-        temp_dir.mkdir(exist_ok=True)
-        
-        file_suffix = Path(file.filename).suffix if file.filename else ".tmp"
-        temp_file_path = temp_dir / f"{processing_id}_{uuid.uuid4()}{file_suffix}"
+        # The upload is only OCR'd, never kept, so it stays in memory
+        content, content_sha256 = await read_upload(file)
         
-        api_logger.info(f"Saving temp file: {temp_file_path}")
-        
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Extract text using OCR
-        ocr_text = extract_text_from_image(str(temp_file_path))
-        
-        # Clean up temp file
-        temp_file_path.unlink()
+        # Extract text using OCR in the worker pool, unless this content was OCR'd before
+        cached = get_cached_ocr(db, content_sha256)
+        try:
+            if cached:
+                api_logger.info(f"OCR cache hit for content {content_sha256}")
+                ocr_text = cached.ocr_text
+            else:
+                ocr_text = await run_ocr(content)
+                save_ocr_result(db, content_sha256, ocr_text)
+        except OCRQueueFull:
+            return ocr_busy_response({"success": False, "ocr_text": "", "extracted_data": {}})
+        except OCRTimeout:
+            raise HTTPException(status_code=504, detail="OCR took too long for this image")
         
         result = {
             "success": True,
@@ -2294,1004 +3048,28 @@ async def extract_invoice_data_from_image(
             "extracted_data": {}
         }
         
-        # If data extraction is requested, parse the OCR text
+        # If data extraction is requested, parse the OCR text the same way as the other OCR endpoints
         if extract_data and ocr_text:
-            try:
-                extracted_data = parse_text_simple(ocr_text)
-                result["extracted_data"] = extracted_data
-                # Use the confidence from the parsing function
-                if "confidence_score" in extracted_data:
-                    result["confidence_score"] = extracted_data["confidence_score"] / 100.0
-                else:
-                    result["confidence_score"] = 0.5  # Default moderate confidence
+            if cached and cached.extracted_data is not None:
+                extracted_data, confidence_score = cached.extracted_data, cached.confidence_score or 0.0
+            else:
+                extracted_data, confidence_score = parse_ocr_text(ocr_text)
+                save_ocr_result(db, content_sha256, ocr_text, extracted_data, confidence_score)
+            result["extracted_data"] = extracted_data
+            result["confidence_score"] = confidence_score
+            
+            # Debug logging for extracted items
+            api_logger.info(f"OCR extracted {len(extracted_data.get('items', []))} items")
+            for i, item in enumerate(extracted_data.get('items', [])):
+                api_logger.info(f"Item {i+1}: {item}")
                 
-                # Debug logging for extracted items
-                api_logger.info(f"OCR extracted {len(extracted_data.get('items', []))} items")
-                for i, item in enumerate(extracted_data.get('items', [])):
-                    api_logger.info(f"Item {i+1}: {item}")
-                    
-                api_logger.info(f"Data extraction successful. Final confidence: {result['confidence_score']*100:.1f}%")
-                api_logger.info(f"🔍 DEBUG: Final extracted_data being returned: {json.dumps(extracted_data, indent=2)}")
-            except Exception as e:
-                api_logger.warning(f"Data extraction failed: {e}")
-                # Fallback to basic parsing
-                result["extracted_data"] = {
-                    "student_name": "",
-                    "student_id": "",
-                    "student_email": "",
-                    "department": "",
-                    "due_date": "",
-                    "notes": ocr_text[:200] + "..." if len(ocr_text) > 200 else ocr_text,
-                    "items": []
-                }
-                result["confidence_score"] = 0.3  # Low confidence for failed parsing
+            api_logger.info(f"Data extraction complete. Final confidence: {result['confidence_score']*100:.1f}%")
+            api_logger.info(f"🔍 DEBUG: Final extracted_data being returned: {json.dumps(extracted_data, indent=2)}")
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         api_logger.error(f"OCR extraction failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-
-def convert_date_to_iso_format(date_str: str) -> str:
-    """
-    Convert various date formats to ISO format (YYYY-MM-DD) for HTML date inputs
-    Handles formats like:
-    - "2025-09-30" (already ISO)
-    - "August 26, 2025"
-    - "Sept 20, 2025" 
-    - "8/26/2025"
-    - "26/8/2025"
-    """
-    if not date_str or not date_str.strip():
-        return ""
-    
-    try:
-        # Clean up common OCR artifacts
-        cleaned = date_str.replace("'", "").replace('"', '').strip()
-        
-        # Check if already in YYYY-MM-DD format
-        iso_match = re.match(r'^(\d{4})-(\d{1,2})-(\d{1,2})$', cleaned)
-        if iso_match:
-            year, month, day = iso_match.groups()
-            year, month, day = int(year), int(month), int(day)
-            # Validate the date components
-            if 1 <= month <= 12 and 1 <= day <= 31 and year >= 1900:
-                return f"{year:04d}-{month:02d}-{day:02d}"
-        
-        # Handle "Sept" abbreviation
-        cleaned = re.sub(r'Sept(\d)', r'September \1', cleaned, flags=re.IGNORECASE)
-        cleaned = re.sub(r'Sept\s*(\d)', r'September \1', cleaned, flags=re.IGNORECASE)
-        
-        # Parse the date using dateutil parser which handles many formats
-        if date_parser:  # Only if dateutil is available
-            parsed_date = date_parser.parse(cleaned)
-            return parsed_date.strftime('%Y-%m-%d')
-        else:
-            # Fallback manual parsing for common formats
-            # Handle "Month Day, Year" format
-            month_match = re.search(r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{1,2}),?\s+(\d{4})', cleaned, re.IGNORECASE)
-            if month_match:
-                month_name = month_match.group(1).lower()
-                day = int(month_match.group(2))
-                year = int(month_match.group(3))
-                
-                months = {
-                    'january': 1, 'february': 2, 'march': 3, 'april': 4,
-                    'may': 5, 'june': 6, 'july': 7, 'august': 8,
-                    'september': 9, 'october': 10, 'november': 11, 'december': 12
-                }
-                
-                if month_name in months:
-                    month = months[month_name]
-                    return f"{year:04d}-{month:02d}-{day:02d}"
-            
-            # Handle MM/DD/YYYY or DD/MM/YYYY format
-            slash_match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})', cleaned)
-            if slash_match:
-                part1, part2, year = slash_match.groups()
-                year = int(year)
-                if year < 100:  # Handle 2-digit years
-                    year += 2000
-                
-                # Assume MM/DD/YYYY format (US format)
-                month = int(part1)
-                day = int(part2)
-                
-                # Validate and swap if needed
-                if month > 12 and day <= 12:
-                    month, day = day, month
-                
-                if 1 <= month <= 12 and 1 <= day <= 31:
-                    return f"{year:04d}-{month:02d}-{day:02d}"
-            
-            return ""  # Could not parse
-            
-    except Exception as e:
-        print(f"Date parsing error for '{date_str}': {e}")
-        return ""
-
-def clean_extracted_text(text: str, field_type: str = "general") -> str:
-    """Clean and validate extracted text based on field type"""
-    if not text:
-        return ""
-    
-    # Basic cleaning
-    cleaned = text.strip()
-    
-    # Remove excessive repeated characters (like sarahhhhh -> sarah)
-    import re
-    if field_type == "name":
-        # Remove excessive repeated characters (more than 2 in a row)
-        cleaned = re.sub(r'(.)\1{2,}', r'\1\1', cleaned)
-        # Capitalize properly
-        cleaned = ' '.join(word.capitalize() for word in cleaned.split())
-        # Remove non-alphabetic characters except spaces
-        cleaned = re.sub(r'[^a-zA-Z\s]', '', cleaned)
-        # Remove extra spaces
-        cleaned = ' '.join(cleaned.split())
-        
-    elif field_type == "email":
-        # Basic email validation
-        if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', cleaned):
-            return ""
-            
-    elif field_type == "student_id":
-        # Remove spaces and non-alphanumeric characters
-        cleaned = re.sub(r'[^a-zA-Z0-9]', '', cleaned)
-        
-    elif field_type == "department":
-        # Capitalize properly and clean
-        cleaned = ' '.join(word.capitalize() for word in cleaned.split())
-        cleaned = re.sub(r'[^a-zA-Z\s&]', '', cleaned)
-        cleaned = ' '.join(cleaned.split())
-    
-    return cleaned
-
-def preprocess_ocr_text(text):
-    """
-    Preprocess OCR text to improve extraction accuracy
-    """
-    # Fix common OCR errors for numbers
-    text = re.sub(r'QTY:\s*I\b', 'QTY: 1', text)  # Fix QTY: I -> QTY: 1
-    text = re.sub(r'QTY:\s*l\b', 'QTY: 1', text)  # Fix QTY: l -> QTY: 1
-    text = re.sub(r'QTY\s*I\b', 'QTY 1', text)    # Fix QTY I -> QTY 1
-    text = re.sub(r'QTY\s*l\b', 'QTY 1', text)    # Fix QTY l -> QTY 1
-    
-    # Fix other common OCR errors
-    text = re.sub(r'\b0(?=[A-Z])', 'O', text)  # Replace 0 with O before uppercase letters
-    
-    # DON'T collapse multiple spaces entirely - preserve some structure
-    # Clean up excessive spacing but preserve line breaks
-    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces/tabs to single space
-    text = re.sub(r'\n\s*\n', '\n', text)  # Multiple newlines to single
-    
-    # Fix common field separators
-    text = re.sub(r'[:|;]\s*', ': ', text)  # Standardize colons
-    text = re.sub(r'\s*\|\s*', ' | ', text)  # Standardize pipes
-    
-    return text
-
-def parse_text_simple(text: str) -> dict:
-    """
-    Enhanced text parsing to extract comprehensive lending invoice fields
-    """
-    # Preprocess text for better extraction
-    text = preprocess_ocr_text(text)
-    
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    extracted = {
-        # Basic student information
-        "student_name": "",
-        "student_id": "",
-        "student_email": "",
-        "department": "",
-        "borrower_phone": "",
-        "borrower_address": "",
-        
-        # Lending information (for frontend compatibility)
-        "lender_name": "",
-        "lending_date": "",
-        "lending_time": "",
-        "invoice_type": "lending",  # Default to lending type
-        
-        # Emergency contact
-        "emergency_contact_name": "",
-        "emergency_contact_phone": "",
-        
-        # Lending purpose and context
-        "lending_purpose": "",
-        "lending_location": "",
-        "project_name": "",
-        
-        # Additional fields needed for logging and functionality
-        "issued_by": "",
-        "due_date": "",
-        "supervisor_name": "",
-        "supervisor_email": "",
-        "invoice_number": "",
-        "notes": "",
-        "items": [],
-        "confidence_score": 0
-    }
-    
-    # Create a clean version for better pattern matching
-    full_text = text
-    api_logger.info(f"📄 Processing text length: {len(text)} characters")
-    
-    # Enhanced patterns to look for
-    import re
-    
-    full_text = ' '.join(lines)
-    
-    # Look for invoice number patterns
-    invoice_patterns = [
-        r'Invoice\s*[#:]?\s*([A-Z0-9-]+)',
-        r'INV[#:-]?\s*([A-Z0-9-]+)',
-        r'Invoice\s+Number[#:]?\s*([A-Z0-9-]+)',
-        r'Lending\s+Agreement[#:]?\s*([A-Z0-9-]+)'
-    ]
-    for pattern in invoice_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["invoice_number"]:
-            extracted["invoice_number"] = match.group(1)
-            break
-    
-    # Look for student ID patterns (more flexible, including hyphenated IDs)
-    student_id_patterns = [
-        r'Student\s+ID[#:]?\s*([A-Z0-9\-]+)',
-        r'STU[#\-]?\s*([A-Z0-9\-]+)',
-        r'ID[#:]?\s*([A-Z0-9\-]{5,15})',
-        r'Student\s+ID[#:]?\s*([A-Z0-9]+)',
-        r'STUD([0-9]{6,8})',
-        r'Borrower\s+ID[#:]?\s*([A-Z0-9\-]+)',
-        # Extract from email patterns
-        r'([a-z]+\.[a-z]+)@[a-z0-9.-]+\.(?:edu|ac\.uk|university)',
-        r'([A-Z]{3}\d{4,8})',  # Match patterns like STU2023078
-        # More flexible ID patterns
-        r'(?:^|\s)([A-Z]{2,4}\d{4,8})(?:\s|$)',
-    ]
-    for pattern in student_id_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["student_id"]:
-            student_id = clean_extracted_text(match.group(1), "student_id")
-            if len(student_id) >= 4:
-                extracted["student_id"] = student_id
-                break
-    
-    # Look for student name patterns (enhanced with more flexible matching)
-    name_patterns = [
-        r'(?:Full\s+Name|Student\s+Name|Name|Borrower)[:\s]*([A-Za-z][A-Za-z\s]{2,30}?)(?:\s*\n|\s*Student\s+ID|\s*Email|\s*Department|\s*Phone|$)',
-        r'Name[:\s]+([A-Za-z][A-Za-z\s]{2,30})',
-        r'([A-Z][a-z]+\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+(?:STU|ID|Email|Department)',
-        r'Student[:\s]+([A-Za-z][A-Za-z\s]{2,30}?)(?:\s|$)',
-        # Handle cases where the name appears before other fields
-        r'^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\s*$',
-    ]
-    for i, pattern in enumerate(name_patterns):
-        match = re.search(pattern, full_text, re.IGNORECASE | re.MULTILINE)
-        if match and not extracted["student_name"]:
-            name = clean_extracted_text(match.group(1), "name")
-            if len(name) > 2 and not any(char.isdigit() for char in name):
-                extracted["student_name"] = name
-                api_logger.info(f"👤 Extracted student name with pattern {i+1}: {name}")
-                break
-    
-    # Look for lender/staff information patterns (enhanced for titles like Dr., Prof., etc.)
-    lender_patterns = [
-        r'Issued\s+by\s+Staff[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',  # "Issued by Staff: Dr. Sarah Johnson"
-        r'Issued\s+by[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Lender[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Staff[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Teacher[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Instructor[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Approved\s+by[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Authorized\s+by[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Lending\s+Staff[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Responsible\s+Person[#:]?\s*([A-Za-z\s\.]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)',
-        r'Dr\.\s+([A-Za-z\s]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)',  # Match "Dr. Sarah Johnson"
-        r'Prof\.\s+([A-Za-z\s]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)',  # Match "Prof. John Smith"
-        r'Mr\.\s+([A-Za-z\s]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)',   # Match "Mr. David Brown"
-        r'Ms\.\s+([A-Za-z\s]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)',   # Match "Ms. Jane Doe"
-        r'Mrs\.\s+([A-Za-z\s]+?)(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)'   # Match "Mrs. Mary White"
-    ]
-    for i, pattern in enumerate(lender_patterns):
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["lender_name"]:
-            lender_name = clean_extracted_text(match.group(1), "name")
-            if len(lender_name) >= 3 and not any(char.isdigit() for char in lender_name):
-                extracted["lender_name"] = lender_name
-                extracted["issued_by"] = lender_name  # Map to issued_by for consistency
-                api_logger.info(f"👥 Extracted lender name with pattern {i+1}: {lender_name}")
-                break
-
-    # Look for email patterns (enhanced for @ symbols)
-    email_patterns = [
-        r'Email[#:]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
-        r'@\s*Email[#:]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
-        r'[@]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
-        r'\b([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\b'
-    ]
-    for i, pattern in enumerate(email_patterns):
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["student_email"]:
-            email = match.group(1).strip()
-            if email and '@' in email and '.' in email:
-                extracted["student_email"] = email
-                api_logger.info(f"📧 Extracted email with pattern {i+1}: {email}")
-                break
-        elif match:
-            api_logger.info(f"📧 Pattern {i+1} found email but field already filled: {match.group(1)}")
-    
-    # Look for phone patterns
-    phone_patterns = [
-        r'Phone[#:]?\s*([+]?[\d\s\-\(\)]{10,15})',
-        r'Mobile[#:]?\s*([+]?[\d\s\-\(\)]{10,15})',
-        r'Contact[#:]?\s*([+]?[\d\s\-\(\)]{10,15})'
-    ]
-    for pattern in phone_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["borrower_phone"]:
-            phone = clean_extracted_text(match.group(1), "phone")
-            if len(phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')) >= 10:
-                extracted["borrower_phone"] = phone
-                break
-    
-    # Look for department
-    dept_patterns = [
-        r'Department[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)',
-        r'Dept[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)',
-        r'Faculty[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)'
-    ]
-    for pattern in dept_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["department"]:
-            dept = clean_extracted_text(match.group(1), "department")
-            if len(dept) > 2:
-                extracted["department"] = dept
-                break
-    
-    # Look for project information
-    project_patterns = [
-        r'Project[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)',
-        r'Assignment[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)',
-        r'Course[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)'
-    ]
-    for pattern in project_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["project_name"]:
-            project = clean_extracted_text(match.group(1), "project")
-            if len(project) > 2:
-                extracted["project_name"] = project
-                break
-    
-    # Look for supervisor information
-    supervisor_patterns = [
-        r'Supervisor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)',
-        r'Instructor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)',
-        r'Professor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)'
-    ]
-    for pattern in supervisor_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["supervisor_name"]:
-            supervisor = clean_extracted_text(match.group(1), "name")
-            if len(supervisor) > 2:
-                extracted["supervisor_name"] = supervisor
-                break
-    
-    # Look for lending purpose
-    purpose_patterns = [
-        r'Purpose[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)',
-        r'Reason[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)',
-        r'Use\s+for[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)'
-    ]
-    for pattern in purpose_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["lending_purpose"]:
-            purpose = clean_extracted_text(match.group(1), "purpose")
-            if len(purpose) > 5:
-                extracted["lending_purpose"] = purpose
-                break
-    
-    # Look for location information
-    location_patterns = [
-        r'Location[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)',
-        r'Lab[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)',
-        r'Room[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)'
-    ]
-    for pattern in location_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["lending_location"]:
-            location = clean_extracted_text(match.group(1), "location")
-            if len(location) > 2:
-                extracted["lending_location"] = location
-                break
-    
-    # Look for emergency contact
-    emergency_patterns = [
-        r'Emergency\s+Contact[#:]?\s*([A-Za-z\s]+?)(?:Phone|Email|Department|\n)',
-        r'Emergency[#:]?\s*([A-Za-z\s]+?)(?:Phone|Email|Department|\n)'
-    ]
-    for pattern in emergency_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["emergency_contact_name"]:
-            emergency = clean_extracted_text(match.group(1), "name")
-            if len(emergency) > 2:
-                extracted["emergency_contact_name"] = emergency
-                break
-    
-    # Look for issued by / lender name (enhanced staff patterns)
-    issued_patterns = [
-        r'Issued\s+by\s+Staff:\s*([A-Za-z\s\.\-]+?)(?:Staff\s+ID|Date|Time|Invoice|Due|\n|$)',
-        r'Issued\s+by\s+Staff[#:]?\s*([A-Za-z\s\.\-]+?)(?:Staff\s+ID|Date|Time|Invoice|Due|\n|$)',
-        r'Staff:\s*([A-Za-z\s\.\-]+?)(?:Staff\s+ID|Date|Time|Invoice|Due|\n|$)',
-        r'Staff[#:]?\s*([A-Za-z\s\.\-]+?)(?:Staff\s+ID|Date|Time|Invoice|Due|\n|$)',
-        r'Dr\.\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
-        r'Prof\.\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
-        r'Professor\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
-        r'Issued\s+by[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)',
-        r'Approved\s+By[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n|Processing)',
-        r'Lender[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)',
-        r'Lab\s+Manager[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)'
-    ]
-    for i, pattern in enumerate(issued_patterns):
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["issued_by"]:
-            issued = clean_extracted_text(match.group(1), "name")
-            if len(issued) > 2:
-                extracted["issued_by"] = issued
-                # Only set lender_name if it's not already set (from the dedicated lender extraction above)
-                if not extracted["lender_name"]:
-                    extracted["lender_name"] = issued  # Add for frontend compatibility
-                    api_logger.info(f"👤 Extracted lender name from issued_by with pattern {i+1}: {issued}")
-                else:
-                    api_logger.info(f"👤 Extracted issued_by with pattern {i+1} but lender_name already set: {issued}")
-                break
-        elif match:
-            api_logger.info(f"👤 Pattern {i+1} found lender but field already filled: {match.group(1)}")
-    
-    # Extract issue date for lending_date
-    issue_date_patterns = [
-        r'Issue\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
-        r'@\s*Issue\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
-        r'Lending\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
-        r'Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
-        r'(September|October|November|December|January|February|March|April|May|June|July|August)\s+\d{1,2},?\s+\d{4}'
-    ]
-    for i, pattern in enumerate(issue_date_patterns):
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match:
-            date_str = match.group(1).strip()
-            converted_date = convert_date_to_iso_format(date_str)
-            if converted_date and not extracted.get("lending_date"):
-                extracted["lending_date"] = converted_date
-                api_logger.info(f"📅 Extracted lending date with pattern {i+1}: {converted_date} from '{date_str}'")
-                break
-            elif converted_date:
-                api_logger.info(f"📅 Pattern {i+1} found date but field already filled: {date_str}")
-        else:
-            api_logger.debug(f"📅 Issue date pattern {i+1} failed")
-    
-    # Look for due date patterns (enhanced with YYYY-MM-DD support)
-    date_patterns = [
-        r'Due\s+Date[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',  # YYYY-MM-DD format first
-        r'Due\s+Date[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
-        r'Return\s+Date[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',  # YYYY-MM-DD format first  
-        r'Return\s+Date[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
-        r'Expected\s+Return[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',  # YYYY-MM-DD format first
-        r'Expected\s+Return[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
-        # Remove the broad (\d{4}-\d{1,2}-\d{1,2}) pattern to avoid wrong matches
-        r'(September|October|November|December|January|February|March|April|May|June|July|August)\s+\d{1,2},?\s+\d{4}',
-        r'Sept?\s*\d{1,2},?\s*\d{4}'
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
-        if match and not extracted["due_date"]:
-            date_str = match.group(1).strip()
-            converted_date = convert_date_to_iso_format(date_str)
-            if converted_date:
-                extracted["due_date"] = converted_date
-                extracted["expected_return_date"] = converted_date
-                break
-    
-    # Extract equipment items with enhanced parsing for lending context
-    try:
-        # Look for equipment/items section using multiple approaches
-        equipment_lines = []
-        full_text_lines = text.split('\n')
-        
-        # Approach 1: Look for table-like structures and "Items:" sections
-        in_items_section = False
-        for i, line in enumerate(full_text_lines):
-            line_clean = line.strip()
-            
-            # Detect start of items section (enhanced to catch "Items:")
-            if re.search(r'^Items:\s*$', line_clean, re.IGNORECASE):
-                in_items_section = True
-                api_logger.info(f"📋 Found items section start: {line_clean}")
-                continue
-            elif re.search(r'(TOTAL|SIGNATURE|TERMS|CONDITIONS|NOTES)', line_clean, re.IGNORECASE):
-                in_items_section = False
-                api_logger.info(f"📋 Items section end: {line_clean}")
-            
-            if in_items_section and line_clean and not re.search(r'^(Items|Item|Name|SKU|Code|Qty|Quantity|Price|Value|Total|Condition)(\s|:|$)', line_clean, re.IGNORECASE):
-                equipment_lines.append(line_clean)
-                api_logger.info(f"📦 Adding to equipment lines: {line_clean}")
-        
-        api_logger.info(f"📋 Found {len(equipment_lines)} lines in items section")
-        
-        # Approach 2: Look for table patterns in the entire text (enhanced for test invoice format)
-        table_patterns = [
-            # Pattern: Name | SKU | Qty | Unit Price | Total
-            r'([A-Za-z\s\-]+)\s*\|\s*([A-Z0-9\-]+)\s*\|\s*(\d+)\s*\|\s*\$?([\d,.]+)\s*\|\s*\$?([\d,.]+)',
-            # Pattern: Name SKU Qty $Price $Total (tabular)
-            r'([A-Za-z\s\-]{3,})\s+([A-Z0-9\-]{2,})\s+(\d+)\s+\$?([\d,.]+)\s+\$?([\d,.]+)',
-            # Pattern: Name, SKU, Qty, Price, Total (comma separated)
-            r'([A-Za-z\s\-]{3,}),\s*([A-Z0-9\-]+),\s*(\d+),\s*\$?([\d,.]+),\s*\$?([\d,.]+)',
-            # Pattern: Detect items with clearer boundaries
-            r'(\d+)\.\s*([A-Za-z\s\-]+)\s+([A-Z0-9\-]+)\s+(\d+)\s+\$?([\d,.]+)',
-            # Note: Removed the duplicate Item Name - QTY: # - $Price patterns since they're handled in enhanced_patterns
-        ]
-        
-        # Process equipment lines first
-        for line in equipment_lines:
-            # Skip obvious header lines
-            if re.search(r'^(Item|Name|SKU|Code|Qty|Quantity|Price|Value|Total|Condition)(\s|$)', line, re.IGNORECASE):
-                continue
-            
-            item = extract_item_from_line(line)
-            if item:
-                extracted["items"].append(item)
-        
-        # If no items found in equipment section, scan entire text (enhanced with specific patterns)
-        if not extracted["items"]:
-            api_logger.info("🔍 Scanning entire text for items with specific patterns...")
-            
-            # Add the specific patterns for our test invoice format first
-            enhanced_patterns = [
-                # Pattern: Item Name - QTY: # - $Price (improved to capture full names including "Digital 6-inch")
-                r'([A-Za-z][A-Za-z\s\-\d]{2,30}?)\s*-\s*QTY:\s*(\d+)\s*-\s*\$?([\d,.]+)',
-                # Pattern: Item Name QTY # $Price (improved)
-                r'([A-Za-z][A-Za-z\s\-\d]{3,30}?)\s+QTY:\s*(\d+)\s+\$?([\d,.]+)',
-            ] + table_patterns  # Add the existing patterns after
-            
-            for pattern_idx, pattern in enumerate(enhanced_patterns):
-                matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-                for match in matches:
-                    groups = match.groups()
-                    if len(groups) >= 3:
-                        try:
-                            name = groups[0].strip()
-                            
-                            # Skip invalid names
-                            if (not name or len(name) < 3 or 
-                                name.lower() in ['item', 'name', 'product', 'component', 'equipment', 'qty', 'quantity', 'price', 'total', 'sku', 'code']):
-                                continue
-                            
-                            if pattern_idx < 2:  # Our enhanced patterns
-                                sku = f"AUTO{len(extracted['items'])+1:03d}"
-                                qty = int(groups[1])
-                                unit_price = float(groups[2].replace(',', ''))
-                                total = qty * unit_price
-                                api_logger.info(f"🎯 Enhanced pattern {pattern_idx+1} matched: {name}, QTY: {qty}, Price: ${unit_price}")
-                            else:
-                                # Handle original patterns
-                                if len(groups) >= 5:  # Full pattern with name, sku, qty, unit_price, total
-                                    if groups[0].startswith(tuple('0123456789')):  # Number at start
-                                        name = groups[1].strip()
-                                        sku = groups[2]
-                                        qty = int(groups[3])
-                                        unit_price = float(groups[4].replace(',', ''))
-                                        total = qty * unit_price
-                                    else:
-                                        name = groups[0].strip()
-                                        sku = groups[1]
-                                        qty = int(groups[2])
-                                        unit_price = float(groups[3].replace(',', ''))
-                                        total = float(groups[4].replace(',', ''))
-                                elif len(groups) == 3:  # Handle Item Name - QTY: # - $Price format
-                                    sku = f"AUTO{len(extracted['items'])+1:03d}"
-                                    qty = int(groups[1])
-                                    unit_price = float(groups[2].replace(',', ''))
-                                    total = qty * unit_price
-                                    api_logger.info(f"🎯 Matched 3-group pattern (idx {pattern_idx}): {name}, QTY: {qty}, Price: ${unit_price}")
-                                else:
-                                    sku = groups[1] if len(groups) > 1 else f"AUTO{len(extracted['items'])+1:03d}"
-                                    qty = int(groups[2]) if len(groups) > 2 else 1
-                                    unit_price = float(groups[3].replace(',', '')) if len(groups) > 3 else 0.0
-                                    total = qty * unit_price
-                            
-                            # Validate item data and check for duplicates
-                            if (len(name) > 2 and name.lower() not in ['item', 'name', 'product', 'component'] and
-                                not any(existing_item['name'].lower() == name.lower() for existing_item in extracted["items"])):
-                                item = {
-                                    "name": name,
-                                    "sku": sku,
-                                    "serial_number": "",
-                                    "quantity": qty,
-                                    "unit_value": unit_price,
-                                    "total_value": total,
-                                    "condition_at_lending": "good",
-                                    "risk_level": "low",
-                                    "safety_requirements": "",
-                                    "usage_purpose": extracted.get("lending_purpose", ""),
-                                    "usage_location": extracted.get("lending_location", "")
-                                }
-                                extracted["items"].append(item)
-                                api_logger.info(f"✅ Successfully extracted item: {name}")
-                            elif any(existing_item['name'].lower() == name.lower() for existing_item in extracted["items"]):
-                                api_logger.info(f"🔄 Skipping duplicate item: {name}")
-                        except (ValueError, IndexError) as e:
-                            api_logger.debug(f"Failed to parse item match: {e}")
-                            continue
-        
-        # Fallback: Extract any product-like words if still no items (enhanced)
-        if not extracted["items"]:
-            api_logger.info("🔍 No items found in structured data, trying fallback extraction...")
-            
-            # Look for equipment names in text (expanded list)
-            equipment_words = re.findall(r'\b(Oscilloscope|Multimeter|Microscope|Caliper|Micrometer|Generator|Analyzer|Sensor|Breadboard|Arduino|Resistor|Capacitor|Inductor|Transistor|IC|Chip|Module|Board|Kit|Tool|Meter|Probe|Cable|Wire|Component|Computer|Laptop|Monitor|Keyboard|Mouse|Tablet|Phone|Camera|Lens|Tripod|Battery|Charger|Adapter|Switch|Router|Hub|Speaker|Headphone|Microphone|Projector|Screen|Printer|Scanner|Drive|Disk|Memory|Card|Reader)\b', text, re.IGNORECASE)
-            
-            for i, equipment in enumerate(set(equipment_words)):
-                if i >= 5:  # Limit to 5 items to avoid spam
-                    break
-                item = {
-                    "name": equipment.title(),
-                    "sku": f"AUTO{i+1:03d}",
-                    "serial_number": "",
-                    "quantity": 1,
-                    "unit_value": 0.0,
-                    "total_value": 0.0,
-                    "condition_at_lending": "good",
-                    "risk_level": "low",
-                    "safety_requirements": "",
-                    "usage_purpose": extracted.get("lending_purpose", ""),
-                    "usage_location": extracted.get("lending_location", "")
-                }
-                extracted["items"].append(item)
-                api_logger.info(f"🎯 Fallback extracted equipment: {equipment}")
-            
-            # Try to extract from any line that looks like it might contain items
-            if not extracted["items"]:
-                api_logger.info("🔍 Trying line-by-line extraction as final fallback...")
-                lines = text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if len(line) < 3 or not line:
-                        continue
-                    
-                    # Skip obvious non-item lines
-                    if re.search(r'^(date|time|total|signature|terms|conditions|notes|email|phone|address|department)', line, re.IGNORECASE):
-                        continue
-                    
-                    # Look for lines that might contain items
-                    if (re.search(r'\b(equipment|tool|device|component|item|product)\b', line, re.IGNORECASE) or
-                        re.search(r'\b[A-Z]{2,}[\d\-]+\b', line) or  # SKU-like patterns
-                        re.search(r'\d+\s*x\s*[A-Za-z]', line, re.IGNORECASE) or  # Quantity patterns
-                        re.search(r'\$\d+', line)):  # Price patterns
-                        
-                        item = extract_item_from_line(line)
-                        if item and len(extracted["items"]) < 10:  # Limit to avoid spam
-                            extracted["items"].append(item)
-                            api_logger.info(f"📦 Line extraction found: {item['name']}")
-    
-    except Exception as e:
-        api_logger.warning(f"Failed to parse equipment items: {e}")
-
-    # Set sensible defaults for missing but important fields
-    if not extracted["lending_time"]:
-        extracted["lending_time"] = "09:00"  # Default to 9 AM
-    
-    if not extracted["notes"] and extracted["lending_purpose"]:
-        extracted["notes"] = f"Lending for: {extracted['lending_purpose']}"
-    elif not extracted["notes"]:
-        extracted["notes"] = "Equipment lending - see attached invoice for details"
-    
-    # Calculate confidence score based on extracted fields (enhanced)
-    confidence = 0
-    if extracted["student_name"]: confidence += 15
-    if extracted["student_id"]: confidence += 15
-    if extracted["student_email"]: confidence += 10
-    if extracted["department"]: confidence += 10
-    if extracted["due_date"]: confidence += 10
-    if extracted["invoice_number"]: confidence += 5
-    if extracted["project_name"]: confidence += 10
-    if extracted["supervisor_name"]: confidence += 10
-    if extracted["lending_purpose"]: confidence += 10
-    if extracted["lending_location"]: confidence += 5
-    if extracted["issued_by"]: confidence += 5
-    if extracted["borrower_phone"]: confidence += 5
-    if extracted["items"]: confidence += 5 * min(len(extracted["items"]), 4)  # Cap at 4 items
-    
-    extracted["confidence_score"] = min(confidence, 100)
-    
-    # Enhanced logging with comprehensive data validation (fixed for safety)
-    try:
-        api_logger.info(f"✨ Enhanced lending invoice parsing completed. Confidence: {extracted.get('confidence_score', 0)}%")
-        api_logger.info(f"📋 Extracted Lending Data Summary:")
-        api_logger.info(f"   👤 Borrower: '{extracted.get('student_name', '')}' (ID: {extracted.get('student_id', '')})")
-        api_logger.info(f"   📧 Contact: {extracted.get('student_email', '')} | {extracted.get('borrower_phone', '')}")
-        api_logger.info(f"   🏫 Department: '{extracted.get('department', '')}'")
-        api_logger.info(f"   📁 Project: '{extracted.get('project_name', '')}' (Supervisor: {extracted.get('supervisor_name', '')})")
-        
-        # Safe string slicing
-        purpose = extracted.get('lending_purpose', '')
-        purpose_display = purpose[:50] + "..." if len(purpose) > 50 else purpose
-        api_logger.info(f"   🎯 Purpose: '{purpose_display}' (Location: {extracted.get('lending_location', '')})")
-        
-        api_logger.info(f"   📅 Due Date: {extracted.get('due_date', '')}")
-        api_logger.info(f"   👨‍💼 Issued By: '{extracted.get('issued_by', '')}'")
-        api_logger.info(f"   📦 Components: {len(extracted.get('items', []))} extracted")
-    except Exception as log_error:
-        api_logger.warning(f"Logging error (non-critical): {log_error}")
-    
-    # Enhanced validation warnings (also made safe)
-    try:
-        if len(extracted.get('student_name', '')) < 3:
-            api_logger.warning("⚠️  Student name seems too short")
-        if len(extracted.get('student_id', '')) < 4:
-            api_logger.warning("⚠️  Student ID seems invalid")
-        if not extracted.get('student_email') and extracted.get('confidence_score', 0) > 50:
-            api_logger.warning("⚠️  No valid email found despite good OCR")
-        if not extracted.get('lending_purpose') and extracted.get('confidence_score', 0) > 60:
-            api_logger.warning("⚠️  No lending purpose found - manual entry may be needed")
-        if not extracted.get('project_name') and extracted.get('confidence_score', 0) > 70:
-            api_logger.warning("⚠️  No project information found")
-    except Exception as validation_error:
-        api_logger.warning(f"Validation error (non-critical): {validation_error}")
-    
-    api_logger.info("🎯 About to return extracted data...")
-    api_logger.info(f"🔧 DEBUG: extracted type = {type(extracted)}")
-    api_logger.info(f"🔧 DEBUG: extracted keys = {list(extracted.keys()) if extracted else 'None'}")
-    return extracted
-
-def extract_item_from_line(line):
-    """Helper function to extract item information from a single line"""
-    try:
-        # Enhanced patterns to handle more formats
-        patterns = [
-            # Pattern 1: Name SKU Qty Price Total
-            r'^([A-Za-z\s\-]+?)\s+([A-Z0-9\-]{2,})\s+(\d+)\s+\$?([\d,.]+)\s+\$?([\d,.]+)',
-            # Pattern 2: Name | SKU | Qty | Price | Total
-            r'^([A-Za-z\s\-]+?)\s*\|\s*([A-Z0-9\-]+)\s*\|\s*(\d+)\s*\|\s*\$?([\d,.]+)\s*\|\s*\$?([\d,.]+)',
-            # Pattern 3: Name, SKU, Qty, Price
-            r'^([A-Za-z\s\-]{3,}),\s*([A-Z0-9\-]+),\s*(\d+),\s*\$?([\d,.]+)',
-            # Pattern 4: Just name and basic info
-            r'^([A-Za-z\s\-]{3,})\s+([A-Z0-9\-]{2,})',
-            # Pattern 5: Detect equipment/component names with numbers
-            r'^(\d+)[\.\)]\s*([A-Za-z\s\-]{3,})(?:\s+([A-Z0-9\-]+))?\s*(?:(\d+))?\s*(?:\$?([\d,.]+))?',
-            # Pattern 6: Simple component name detection
-            r'^([A-Za-z][A-Za-z\s\-]{2,50})(?:\s+(\d+))?\s*(?:\$?([\d,.]+))?',
-            # Pattern 7: Tab or multiple space separated
-            r'^([A-Za-z\s\-]{3,})\s{2,}([A-Z0-9\-]+)\s{2,}(\d+)\s{2,}\$?([\d,.]+)',
-            # Pattern 8: Item Name - QTY: # - $Price (NEW - for test invoice format)
-            r'^([A-Za-z\s\-]+?)\s*-\s*QTY:\s*(\d+)\s*-\s*\$?([\d,.]+)',
-            # Pattern 9: Item Name - Quantity: # - Price: $#
-            r'^([A-Za-z\s\-]+?)\s*-\s*Quantity:\s*(\d+)\s*-\s*Price:\s*\$?([\d,.]+)',
-            # Pattern 10: Item Name QTY # $Price
-            r'^([A-Za-z\s\-]+?)\s+QTY\s+(\d+)\s+\$?([\d,.]+)',
-        ]
-        
-        for i, pattern in enumerate(patterns):
-            match = re.search(pattern, line.strip())
-            if match:
-                groups = match.groups()
-                
-                # Extract name (always first group)
-                name = groups[0].strip() if groups[0] else ""
-                
-                # Skip header-like entries and invalid names
-                if (not name or len(name) < 3 or 
-                    name.lower() in ['item', 'name', 'product', 'component', 'equipment', 'qty', 'quantity', 'price', 'total', 'sku', 'code']):
-                    continue
-                
-                # Extract other fields based on pattern
-                sku = ""
-                quantity = 1
-                unit_value = 0.0
-                total_value = 0.0
-                
-                if i == 4:  # Pattern 5 (numbered list)
-                    name = groups[1].strip() if groups[1] else ""
-                    sku = groups[2] if groups[2] else f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[3]) if groups[3] else 1
-                    unit_value = float(groups[4].replace(',', '')) if groups[4] else 0.0
-                elif i == 5:  # Pattern 6 (simple detection)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 7:  # Pattern 8 (Item Name - QTY: # - $Price)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 8:  # Pattern 9 (Item Name - Quantity: # - Price: $#)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 9:  # Pattern 10 (Item Name QTY # $Price)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                else:  # Other patterns
-                    sku = groups[1] if len(groups) > 1 and groups[1] else f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[2]) if len(groups) > 2 and groups[2] else 1
-                    unit_value = float(groups[3].replace(',', '')) if len(groups) > 3 and groups[3] else 0.0
-                    total_value = float(groups[4].replace(',', '')) if len(groups) > 4 and groups[4] else 0.0
-                
-                # Skip if name still invalid
-                if not name or len(name) < 3:
-                    continue
-                
-                item = {
-                    "name": name,
-                    "sku": sku,
-                    "serial_number": "",
-                    "quantity": quantity,
-                    "unit_value": unit_value,
-                    "total_value": total_value if total_value > 0 else (quantity * unit_value),
-                    "condition_at_lending": "good",
-                    "risk_level": "low",
-                    "safety_requirements": "",
-                    "usage_purpose": "",
-                    "usage_location": ""
-                }
-                
-                api_logger.info(f"🔧 Extracted item with pattern {i+1}: {name} (SKU: {sku}, Qty: {quantity})")
-                return item
-                
-    except Exception as e:
-        api_logger.debug(f"Failed to extract item from line '{line}': {e}")
-    
-    return None
-
-def extract_item_from_line(line):
-    """Helper function to extract item information from a single line"""
-    try:
-        # Enhanced patterns to handle more formats
-        patterns = [
-            # Pattern 1: Name SKU Qty Price Total
-            r'^([A-Za-z\s\-]+?)\s+([A-Z0-9\-]{2,})\s+(\d+)\s+\$?([\d,.]+)\s+\$?([\d,.]+)',
-            # Pattern 2: Name | SKU | Qty | Price | Total
-            r'^([A-Za-z\s\-]+?)\s*\|\s*([A-Z0-9\-]+)\s*\|\s*(\d+)\s*\|\s*\$?([\d,.]+)\s*\|\s*\$?([\d,.]+)',
-            # Pattern 3: Name, SKU, Qty, Price
-            r'^([A-Za-z\s\-]{3,}),\s*([A-Z0-9\-]+),\s*(\d+),\s*\$?([\d,.]+)',
-            # Pattern 4: Just name and basic info
-            r'^([A-Za-z\s\-]{3,})\s+([A-Z0-9\-]{2,})',
-            # Pattern 5: Detect equipment/component names with numbers
-            r'^(\d+)[\.\)]\s*([A-Za-z\s\-]{3,})(?:\s+([A-Z0-9\-]+))?\s*(?:(\d+))?\s*(?:\$?([\d,.]+))?',
-            # Pattern 6: Simple component name detection
-            r'^([A-Za-z][A-Za-z\s\-]{2,50})(?:\s+(\d+))?\s*(?:\$?([\d,.]+))?',
-            # Pattern 7: Tab or multiple space separated
-            r'^([A-Za-z\s\-]{3,})\s{2,}([A-Z0-9\-]+)\s{2,}(\d+)\s{2,}\$?([\d,.]+)',
-            # Pattern 8: Item Name - QTY: # - $Price (NEW - for test invoice format)
-            r'^([A-Za-z\s\-]+?)\s*-\s*QTY:\s*(\d+)\s*-\s*\$?([\d,.]+)',
-            # Pattern 9: Item Name - Quantity: # - Price: $#
-            r'^([A-Za-z\s\-]+?)\s*-\s*Quantity:\s*(\d+)\s*-\s*Price:\s*\$?([\d,.]+)',
-            # Pattern 10: Item Name QTY # $Price
-            r'^([A-Za-z\s\-]+?)\s+QTY\s+(\d+)\s+\$?([\d,.]+)',
-        ]
-        
-        for i, pattern in enumerate(patterns):
-            match = re.search(pattern, line.strip())
-            if match:
-                groups = match.groups()
-                
-                # Extract name (always first group)
-                name = groups[0].strip() if groups[0] else ""
-                
-                # Skip header-like entries and invalid names
-                if (not name or len(name) < 3 or 
-                    name.lower() in ['item', 'name', 'product', 'component', 'equipment', 'qty', 'quantity', 'price', 'total', 'sku', 'code']):
-                    continue
-                
-                # Extract other fields based on pattern
-                sku = ""
-                quantity = 1
-                unit_value = 0.0
-                total_value = 0.0
-                
-                if i == 4:  # Pattern 5 (numbered list)
-                    name = groups[1].strip() if groups[1] else ""
-                    sku = groups[2] if groups[2] else f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[3]) if groups[3] else 1
-                    unit_value = float(groups[4].replace(',', '')) if groups[4] else 0.0
-                elif i == 5:  # Pattern 6 (simple detection)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 7:  # Pattern 8 (Item Name - QTY: # - $Price)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 8:  # Pattern 9 (Item Name - Quantity: # - Price: $#)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                elif i == 9:  # Pattern 10 (Item Name QTY # $Price)
-                    sku = f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[1]) if groups[1] else 1
-                    unit_value = float(groups[2].replace(',', '')) if groups[2] else 0.0
-                else:  # Other patterns
-                    sku = groups[1] if len(groups) > 1 and groups[1] else f"AUTO{random.randint(100,999)}"
-                    quantity = int(groups[2]) if len(groups) > 2 and groups[2] else 1
-                    unit_value = float(groups[3].replace(',', '')) if len(groups) > 3 and groups[3] else 0.0
-                    total_value = float(groups[4].replace(',', '')) if len(groups) > 4 and groups[4] else 0.0
-                
-                # Skip if name still invalid
-                if not name or len(name) < 3:
-                    continue
-                
-                item = {
-                    "name": name,
-                    "sku": sku,
-                    "serial_number": "",
-                    "quantity": quantity,
-                    "unit_value": unit_value,
-                    "total_value": total_value if total_value > 0 else (quantity * unit_value),
-                    "condition_at_lending": "good",
-                    "risk_level": "low",
-                    "safety_requirements": "",
-                    "usage_purpose": "",
-                    "usage_location": ""
-                }
-                
-                api_logger.info(f"🔧 Extracted item with pattern {i+1}: {name} (SKU: {sku}, Qty: {quantity})")
-                return item
-                
-    except Exception as e:
-        api_logger.debug(f"Failed to extract item from line '{line}': {e}")
-    
-    return None
-
-def calculate_confidence_score(extracted_data: dict) -> float:
-    """
-    Calculate confidence score based on extracted data completeness
-    """
-    fields = ["student_name", "student_id", "student_email", "department"]
-    filled_fields = sum(1 for field in fields if extracted_data.get(field))
-    return min(0.9, filled_fields / len(fields))
-
-def parse_text_simple_fallback(text: str) -> dict:
-    """
-    Simple fallback parsing function if the main one fails
-    """
-    try:
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        extracted = {
-            "student_name": "",
-            "student_id": "",
-            "student_email": "",
-            "department": "",
-            "due_date": "",
-            "items": [],
-            "confidence_score": 30
-        }
-        
-        full_text = ' '.join(lines)
-        
-        # Basic name extraction
-        name_match = re.search(r'(?:Name|Student)[:\s]+([A-Za-z\s]+)', full_text, re.IGNORECASE)
-        if name_match:
-            extracted["student_name"] = name_match.group(1).strip()
-        
-        # Basic ID extraction
-        id_match = re.search(r'(?:ID|Student\s+ID)[:\s]+([A-Z0-9]+)', full_text, re.IGNORECASE)
-        if id_match:
-            extracted["student_id"] = id_match.group(1).strip()
-        
-        # Basic email extraction
-        email_match = re.search(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})', full_text)
-        if email_match:
-            extracted["student_email"] = email_match.group(1)
-        
-        return extracted
-    except Exception as e:
-        api_logger.error(f"Even fallback parsing failed: {e}")
-        return {
-            "student_name": "",
-            "student_id": "",
-            "student_email": "",
-            "department": "",
-            "due_date": "",
-            "items": [],
-            "confidence_score": 0
-        }
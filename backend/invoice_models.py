@@ -417,6 +417,67 @@ class InvoiceDetail(Invoice):
     class Config:
         from_attributes = True
 
+class InvoiceListItem(BaseModel):
+    """Sparse invoice row for GET /api/invoices - only the columns asked for via ?fields="""
+    id: str
+    invoice_number: Optional[str] = None
+    order_id: Optional[str] = None
+    student_id: Optional[str] = None
+    invoice_type: Optional[str] = None
+    status: Optional[str] = None
+    total_items: Optional[int] = None
+    total_value: Optional[float] = None
+    lending_fee: Optional[float] = None
+    damage_fee: Optional[float] = None
+    replacement_fee: Optional[float] = None
+    issue_date: Optional[datetime] = None
+    due_date: Optional[datetime] = None
+    acknowledgment_date: Optional[datetime] = None
+    has_physical_copy: Optional[bool] = None
+    physical_invoice_captured: Optional[bool] = None
+    physical_invoice_image_url: Optional[str] = None
+    issued_by: Optional[str] = None
+    acknowledged_by_student: Optional[bool] = None
+    lender_id: Optional[str] = None
+    issued_by_lender: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    
+    # Heavy text columns (fields=all or by name)
+    notes: Optional[str] = None
+    physical_invoice_notes: Optional[str] = None
+    student_signature_url: Optional[str] = None
+    lending_purpose: Optional[str] = None
+    lending_terms: Optional[str] = None
+    special_instructions: Optional[str] = None
+    borrower_address: Optional[str] = None
+    
+    # Order information
+    order_number: Optional[str] = None
+    order_status: Optional[str] = None
+    requested_date: Optional[datetime] = None
+    expected_return_date: Optional[datetime] = None
+    
+    # Student information
+    student_name: Optional[str] = None
+    student_id_number: Optional[str] = None
+    student_email: Optional[str] = None
+    department: Optional[str] = None
+    year_of_study: Optional[int] = None
+    
+    # Lender/Staff information
+    lender_name: Optional[str] = None
+    lender_email: Optional[str] = None
+    lender_department: Optional[str] = None
+    lender_designation: Optional[str] = None
+    issued_by_lender_name: Optional[str] = None
+    
+    # Summary counts
+    item_count: Optional[int] = None
+    image_count: Optional[int] = None
+    acknowledgment_count: Optional[int] = None
+    latest_acknowledgment: Optional[datetime] = None
+
 # Dashboard and reporting models
 class InvoiceSummary(BaseModel):
     total_invoices: int
@@ -441,6 +502,7 @@ class CameraUploadResponse(BaseModel):
     image_url: Optional[str] = None
     processing_status: str = "pending"
     ocr_extracted: Optional[dict] = None
+    job_id: Optional[str] = None  # OCR job to poll at /api/invoices/ocr/jobs/{job_id}
 
 class BulkInvoiceCreate(BaseModel):
     """Model for creating multiple invoices from orders"""
@@ -448,6 +510,11 @@ class BulkInvoiceCreate(BaseModel):
     issued_by: str
     notes: Optional[str] = None
 
+class InvoiceRenderRequest(BaseModel):
+    """Model for rendering many invoices at once"""
+    invoice_ids: List[str]
+    format: str = "pdf"  # pdf or png
+
 class InvoiceSearchFilter(BaseModel):
     """Model for filtering invoices"""
     status: Optional[str] = None
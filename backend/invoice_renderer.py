@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Invoice rendering service - PDF/PNG output for invoices
+
+The page layout follows create_invoice_png.py. Static parts of the page (title,
+section headings, table header, terms, signature lines) are drawn once per
+worker process into template images; each invoice only copies a template and
+fills in its own fields. Rasterization runs in a ProcessPoolExecutor so it does
+not block the API event loop, and output is cached on disk keyed by invoice id
+and the invoice's last modification time.
+
+Worker processes only import this module (Pillow, no database or FastAPI), so
+they start quickly on spawn-based platforms such as Windows.
+"""
+
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+RENDER_FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+RENDER_CACHE_DIR = Path(os.getenv(
+    'INVOICE_RENDER_CACHE_DIR',
+    Path(__file__).resolve().parent / "uploads" / "rendered"
+))
+RENDER_WORKERS = int(os.getenv('INVOICE_RENDER_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+
+# Page geometry (US Letter at 100 dpi)
+PAGE_WIDTH, PAGE_HEIGHT = 850, 1100
+PAGE_DPI = 100.0
+MARGIN = 50
+BOTTOM_MARGIN = 60
+ROW_HEIGHT = 25
+FIRST_TABLE_BODY_TOP = 475
+CONTINUATION_TABLE_BODY_TOP = 140
+TRAILER_HEIGHT = 330
+
+HEADER_COLOR = '#2E5BBA'
+TEXT_COLOR = '#333333'
+LINE_COLOR = '#CCCCCC'
+
+# (x, header label, width) for the equipment table
+TABLE_COLUMNS = [
+    (50, "Item", 240),
+    (300, "SKU", 110),
+    (420, "Qty", 40),
+    (470, "Unit Value", 100),
+    (580, "Total Value", 100),
+    (690, "Condition", 110),
+]
+
+TERMS = [
+    "• Equipment must be returned by the due date in good condition",
+    "• Student is responsible for any damage or loss",
+    "• Late returns may incur additional fees",
+    "• Equipment should be used only for educational purposes"
+]
+
+# Per-worker state, built once by _init_worker
+_fonts: Dict[str, Any] = {}
+_templates: Dict[str, Image.Image] = {}
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _load_font(size: int):
+    for name in ("arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def _draw_table_header(draw: ImageDraw.ImageDraw, y_pos: int):
+    draw.line([(MARGIN, y_pos), (PAGE_WIDTH - MARGIN, y_pos)], fill=LINE_COLOR, width=1)
+    for x_pos, label, _ in TABLE_COLUMNS:
+        draw.text((x_pos, y_pos + 10), label, font=_fonts['normal'], fill=TEXT_COLOR)
+    draw.line([(MARGIN, y_pos + 35), (PAGE_WIDTH - MARGIN, y_pos + 35)], fill=LINE_COLOR, width=1)
+
+
+def _build_templates():
+    """Draw the static parts of each page type once"""
+    first = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT), 'white')
+    draw = ImageDraw.Draw(first)
+    draw.text((MARGIN, 40), "EQUIPMENT LENDING INVOICE", font=_fonts['title'], fill=HEADER_COLOR)
+    draw.text((MARGIN, 130), "STUDENT INFORMATION", font=_fonts['header'], fill=HEADER_COLOR)
+    draw.text((MARGIN, 250), "LENDING INFORMATION", font=_fonts['header'], fill=HEADER_COLOR)
+    draw.text((MARGIN, 395), "EQUIPMENT DETAILS", font=_fonts['header'], fill=HEADER_COLOR)
+    _draw_table_header(draw, 425)
+    _templates['first'] = first
+
+    continuation = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT), 'white')
+    draw = ImageDraw.Draw(continuation)
+    draw.text((MARGIN, 40), "EQUIPMENT LENDING INVOICE (continued)", font=_fonts['header'], fill=HEADER_COLOR)
+    _draw_table_header(draw, 90)
+    _templates['continuation'] = continuation
+
+    _templates['blank'] = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT), 'white')
+
+    # Terms and signature block, pasted at the end of the last page
+    trailer = Image.new('RGB', (PAGE_WIDTH, TRAILER_HEIGHT - 75), 'white')
+    draw = ImageDraw.Draw(trailer)
+    y_pos = 0
+    draw.text((MARGIN, y_pos), "TERMS & CONDITIONS", font=_fonts['header'], fill=HEADER_COLOR)
+    y_pos += 25
+    for term in TERMS:
+        draw.text((MARGIN, y_pos), term, font=_fonts['small'], fill=TEXT_COLOR)
+        y_pos += 20
+    y_pos += 20
+    draw.text((MARGIN, y_pos), "SIGNATURES", font=_fonts['header'], fill=HEADER_COLOR)
+    y_pos += 30
+    draw.text((MARGIN, y_pos), "Student Signature: ________________________", font=_fonts['normal'], fill=TEXT_COLOR)
+    draw.text((450, y_pos), "Date: ___________", font=_fonts['normal'], fill=TEXT_COLOR)
+    y_pos += 40
+    draw.text((MARGIN, y_pos), "Staff Signature: ________________________", font=_fonts['normal'], fill=TEXT_COLOR)
+    draw.text((450, y_pos), "Date: ___________", font=_fonts['normal'], fill=TEXT_COLOR)
+    _templates['trailer'] = trailer
+
+
+def _init_worker():
+    """Process pool initializer: load fonts and precompile the page templates"""
+    _fonts.update({
+        'title': _load_font(24),
+        'header': _load_font(16),
+        'normal': _load_font(12),
+        'small': _load_font(10),
+    })
+    _build_templates()
+
+
+def _fit(draw: ImageDraw.ImageDraw, text: Any, font, width: int) -> str:
+    """Truncate text with an ellipsis so it stays inside its table column"""
+    text = "" if text is None else str(text)
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _format_date(value: Any) -> str:
+    if not value:
+        return "-"
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value.strftime("%B %d, %Y")
+
+
+def _money(value: Any) -> str:
+    return f"${float(value or 0):.2f}"
+
+
+def _draw_item_row(draw: ImageDraw.ImageDraw, y_pos: int, item: Dict[str, Any]):
+    quantity = item.get('quantity') or 0
+    unit_value = float(item.get('unit_value') or 0)
+    total_value = item.get('total_value') or unit_value * quantity
+    values = [
+        item.get('product_name'),
+        item.get('product_sku'),
+        quantity,
+        _money(unit_value),
+        _money(total_value),
+        item.get('condition_at_lending') or item.get('return_condition') or "Good",
+    ]
+    for (x_pos, _, width), value in zip(TABLE_COLUMNS, values):
+        draw.text((x_pos, y_pos), _fit(draw, value, _fonts['normal'], width), font=_fonts['normal'], fill=TEXT_COLOR)
+
+
+def _draw_pages(invoice: Dict[str, Any]) -> List[Image.Image]:
+    if not _templates:
+        _init_worker()
+
+    pages = []
+    page = _templates['first'].copy()
+    draw = ImageDraw.Draw(page)
+    normal = _fonts['normal']
+
+    draw.text((MARGIN, 90), f"Invoice #: {invoice.get('invoice_number') or '-'}", font=normal, fill=TEXT_COLOR)
+    draw.text((600, 90), f"Date: {_format_date(invoice.get('issue_date') or invoice.get('created_at'))}",
+              font=normal, fill=TEXT_COLOR)
+
+    y_pos = 160
+    for label, key in (("Student Name", 'student_name'), ("Student ID", 'student_id_number'), ("Email", 'student_email')):
+        draw.text((MARGIN, y_pos), f"{label}: {invoice.get(key) or '-'}", font=normal, fill=TEXT_COLOR)
+        y_pos += 25
+
+    y_pos = 280
+    lender = invoice.get('lender_name') or invoice.get('issued_by_lender_name') or invoice.get('issued_by') or '-'
+    for text in (
+        f"Lender: {lender}",
+        f"Lending Date: {_format_date(invoice.get('issue_date'))}",
+        f"Due Date: {_format_date(invoice.get('due_date'))}",
+        f"Invoice Type: {(invoice.get('invoice_type') or '-').title()}",
+    ):
+        draw.text((MARGIN, y_pos), text, font=normal, fill=TEXT_COLOR)
+        y_pos += 25
+
+    items = invoice.get('items') or []
+    total_amount = 0.0
+    y_pos = FIRST_TABLE_BODY_TOP
+    for item in items:
+        if y_pos + ROW_HEIGHT > PAGE_HEIGHT - BOTTOM_MARGIN:
+            pages.append(page)
+            page = _templates['continuation'].copy()
+            draw = ImageDraw.Draw(page)
+            y_pos = CONTINUATION_TABLE_BODY_TOP
+        _draw_item_row(draw, y_pos, item)
+        total_amount += float(item.get('total_value') or float(item.get('unit_value') or 0) * (item.get('quantity') or 0))
+        y_pos += ROW_HEIGHT
+
+    if y_pos + TRAILER_HEIGHT > PAGE_HEIGHT - BOTTOM_MARGIN:
+        pages.append(page)
+        page = _templates['blank'].copy()
+        draw = ImageDraw.Draw(page)
+        y_pos = MARGIN
+
+    # Total line
+    y_pos += 10
+    draw.line([(470, y_pos), (PAGE_WIDTH - MARGIN, y_pos)], fill=LINE_COLOR, width=2)
+    y_pos += 15
+    draw.text((470, y_pos), "TOTAL:", font=_fonts['header'], fill=TEXT_COLOR)
+    draw.text((580, y_pos), _money(invoice.get('total_value') or total_amount), font=_fonts['header'], fill=TEXT_COLOR)
+    y_pos += 50
+    page.paste(_templates['trailer'], (0, y_pos))
+    pages.append(page)
+
+    for number, page in enumerate(pages, start=1):
+        draw = ImageDraw.Draw(page)
+        footer_y = PAGE_HEIGHT - 40
+        draw.text((MARGIN, footer_y), "College Incubation Inventory System", font=_fonts['small'], fill=LINE_COLOR)
+        draw.text((PAGE_WIDTH - 150, footer_y), f"Page {number} of {len(pages)}", font=_fonts['small'], fill=LINE_COLOR)
+
+    return pages
+
+
+def render_invoice_document(invoice: Dict[str, Any], fmt: str = "pdf") -> bytes:
+    """Render one invoice to PDF or PNG bytes. Runs inside a pool worker."""
+    pages = _draw_pages(invoice)
+    buffer = io.BytesIO()
+    if fmt == "pdf":
+        pages[0].save(buffer, "PDF", resolution=PAGE_DPI, save_all=True, append_images=pages[1:])
+    else:
+        # Multi-page invoices become one tall PNG
+        sheet = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT * len(pages)), 'white')
+        for index, page in enumerate(pages):
+            sheet.paste(page, (0, index * PAGE_HEIGHT))
+        sheet.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_init_worker)
+        logger.info(f"Invoice render pool started with {RENDER_WORKERS} workers")
+    return _executor
+
+
+def shutdown_render_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def cache_path(invoice_id: str, version: Any, fmt: str, digest: Optional[str] = None) -> Path:
+    """Cache file for one rendered version of an invoice
+
+    digest covers drawn data that has no modification time of its own.
+    """
+    if isinstance(version, str):
+        version = datetime.fromisoformat(version)
+    stamp = version.strftime("%Y%m%d%H%M%S%f") if version else "0"
+    if digest:
+        stamp = f"{stamp}_{digest}"
+    return RENDER_CACHE_DIR / f"{invoice_id}_{stamp}.{fmt}"
+
+
+def _store(invoice_id: str, path: Path, content: bytes):
+    """Write atomically and drop older renders of the same invoice and format"""
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(path.suffix + ".tmp")
+    temp_path.write_bytes(content)
+    os.replace(temp_path, path)
+    for stale in RENDER_CACHE_DIR.glob(f"{invoice_id}_*{path.suffix}"):
+        if stale != path:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+
+async def render_invoices(invoices: List[Dict[str, Any]], fmt: str = "pdf") -> Dict[str, Path]:
+    """Return the cached file for each invoice, rendering missing ones in the pool.
+
+    Each invoice dict needs 'id' and 'render_version' (its latest modification
+    time) plus the fields drawn on the page; 'render_names_digest', when given,
+    is also part of the cache key.
+    """
+    loop = asyncio.get_running_loop()
+    paths: Dict[str, Path] = {}
+    pending = {}
+
+    for invoice in invoices:
+        invoice_id = str(invoice['id'])
+        path = cache_path(invoice_id, invoice.get('render_version'), fmt, invoice.get('render_names_digest'))
+        paths[invoice_id] = path
+        if not path.exists():
+            pending[invoice_id] = loop.run_in_executor(get_render_executor(), render_invoice_document, invoice, fmt)
+
+    if pending:
+        logger.info(f"Rendering {len(pending)} invoices as {fmt} ({len(invoices) - len(pending)} cached)")
+        results = await asyncio.gather(*pending.values(), return_exceptions=True)
+        for invoice_id, result in zip(pending.keys(), results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to render invoice {invoice_id}: {result}")
+                paths.pop(invoice_id)
+                continue
+            _store(invoice_id, paths[invoice_id], result)
+
+    return paths
+
+
+if __name__ == "__main__":
+    # Render a sample invoice without the pool, for checking the layout
+    sample = {
+        "id": "sample",
+        "invoice_number": "LA-2025-001",
+        "invoice_type": "lending",
+        "issue_date": datetime.now(),
+        "due_date": datetime.now(),
+        "student_name": "Alex Rodriguez",
+        "student_id_number": "STU2023078",
+        "student_email": "alex.rodriguez@university.edu",
+        "lender_name": "Ms Lisa Thompson",
+        "items": [
+            {"product_name": "Caliper Digital 6-inch", "product_sku": "AUTO001", "quantity": 1, "unit_value": 45.00},
+            {"product_name": "Micrometer Set", "product_sku": "AUTO002", "quantity": 1, "unit_value": 89.50},
+        ],
+    }
+    with open("sample_invoice.pdf", "wb") as f:
+        f.write(render_invoice_document(sample, "pdf"))
+    print("✅ Sample invoice rendered to sample_invoice.pdf")
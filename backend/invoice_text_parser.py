@@ -0,0 +1,678 @@
+"""
+Field extraction from OCR'd lending invoices.
+
+parse_text_simple() turns the text Tesseract read off an invoice photo into the
+fields of the lending invoice form. Header fields are described by _FIELD_RULES:
+for each field, an ordered list of precompiled patterns searched over the whole
+text (the lines joined by spaces, since OCR often splits a label from its value)
+and the check a match must pass. The first pattern whose match passes wins, so
+pattern order is priority order. Items come from the "Items:" section, found in
+a single pass over the lines, with whole-text table patterns and equipment names
+as fallbacks.
+
+The golden files in test_data/ocr_parser pin the output of this module; run
+test_invoice_text_parser.py after changing any pattern.
+"""
+import random
+import re
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from dateutil import parser as date_parser
+except ImportError:
+    date_parser = None
+
+from logging_config import api_logger
+
+
+def _compile(patterns: Sequence[str], flags: int = re.IGNORECASE) -> Tuple[re.Pattern, ...]:
+    return tuple(re.compile(pattern, flags) for pattern in patterns)
+
+
+# Dates
+
+_ISO_DATE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+_SEPT_ABBREVIATIONS = _compile([r'Sept(\d)', r'Sept\s*(\d)'])
+_MONTH_DAY_YEAR = re.compile(
+    r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{1,2}),?\s+(\d{4})',
+    re.IGNORECASE
+)
+_SLASH_DATE = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})')
+_MONTHS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4,
+    'may': 5, 'june': 6, 'july': 7, 'august': 8,
+    'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+
+
+def convert_date_to_iso_format(date_str: str) -> str:
+    """
+    Convert various date formats to ISO format (YYYY-MM-DD) for HTML date inputs
+    Handles formats like:
+    - "2025-09-30" (already ISO)
+    - "August 26, 2025"
+    - "Sept 20, 2025"
+    - "8/26/2025"
+    - "26/8/2025"
+    Returns "" when the text is not a date.
+    """
+    if not date_str or not date_str.strip():
+        return ""
+
+    try:
+        # Clean up common OCR artifacts
+        cleaned = date_str.replace("'", "").replace('"', '').strip()
+
+        iso_match = _ISO_DATE.match(cleaned)
+        if iso_match:
+            year, month, day = (int(part) for part in iso_match.groups())
+            if 1 <= month <= 12 and 1 <= day <= 31 and year >= 1900:
+                return f"{year:04d}-{month:02d}-{day:02d}"
+
+        for abbreviation in _SEPT_ABBREVIATIONS:
+            cleaned = abbreviation.sub(r'September \1', cleaned)
+
+        if date_parser:
+            return date_parser.parse(cleaned).strftime('%Y-%m-%d')
+
+        # Without dateutil: "Month Day, Year", then MM/DD/YYYY (swapped when the month is > 12)
+        month_match = _MONTH_DAY_YEAR.search(cleaned)
+        if month_match:
+            month = _MONTHS[month_match.group(1).lower()]
+            day = int(month_match.group(2))
+            year = int(month_match.group(3))
+            return f"{year:04d}-{month:02d}-{day:02d}"
+
+        slash_match = _SLASH_DATE.search(cleaned)
+        if slash_match:
+            month, day, year = (int(part) for part in slash_match.groups())
+            if year < 100:
+                year += 2000
+            if month > 12 and day <= 12:
+                month, day = day, month
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                return f"{year:04d}-{month:02d}-{day:02d}"
+
+        return ""
+
+    except Exception as e:
+        api_logger.debug(f"Date parsing error for '{date_str}': {e}")
+        return ""
+
+
+# Text cleanup
+
+_REPEATED_CHARACTERS = re.compile(r'(.)\1{2,}')
+_NON_NAME_CHARACTERS = re.compile(r'[^a-zA-Z\s]')
+_NON_DEPARTMENT_CHARACTERS = re.compile(r'[^a-zA-Z\s&]')
+_NON_ID_CHARACTERS = re.compile(r'[^a-zA-Z0-9]')
+_EMAIL = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
+def clean_extracted_text(text: str, field_type: str = "general") -> str:
+    """Clean and validate extracted text based on field type"""
+    if not text:
+        return ""
+
+    cleaned = text.strip()
+
+    if field_type == "name":
+        # Collapse OCR stutter (sarahhhhh -> sarahh), capitalize, keep letters only
+        cleaned = _REPEATED_CHARACTERS.sub(r'\1\1', cleaned)
+        cleaned = ' '.join(word.capitalize() for word in cleaned.split())
+        cleaned = _NON_NAME_CHARACTERS.sub('', cleaned)
+        cleaned = ' '.join(cleaned.split())
+
+    elif field_type == "email":
+        if not _EMAIL.match(cleaned):
+            return ""
+
+    elif field_type == "student_id":
+        cleaned = _NON_ID_CHARACTERS.sub('', cleaned)
+
+    elif field_type == "department":
+        cleaned = ' '.join(word.capitalize() for word in cleaned.split())
+        cleaned = _NON_DEPARTMENT_CHARACTERS.sub('', cleaned)
+        cleaned = ' '.join(cleaned.split())
+
+    return cleaned
+
+
+_OCR_FIXES = (
+    (re.compile(r'QTY:\s*I\b'), 'QTY: 1'),
+    (re.compile(r'QTY:\s*l\b'), 'QTY: 1'),
+    (re.compile(r'QTY\s*I\b'), 'QTY 1'),
+    (re.compile(r'QTY\s*l\b'), 'QTY 1'),
+    (re.compile(r'\b0(?=[A-Z])'), 'O'),  # 0 read for O before uppercase letters
+    (re.compile(r'[ \t]+'), ' '),  # Collapse spacing but keep line breaks
+    (re.compile(r'\n\s*\n'), '\n'),
+    (re.compile(r'[:|;]\s*'), ': '),  # Standardize field separators
+    (re.compile(r'\s*\|\s*'), ' | '),
+)
+
+
+def preprocess_ocr_text(text: str) -> str:
+    """Fix common OCR misreads and normalize spacing and separators"""
+    for pattern, replacement in _OCR_FIXES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+# Header fields
+
+class FieldRule(NamedTuple):
+    fields: Tuple[str, ...]  # Filled with the accepted value; the rule is skipped if the first is already set
+    patterns: Tuple[re.Pattern, ...]  # Tried in order, first accepted match wins; group 1 is the value
+    accept: Callable[[str], str]  # Cleaned value, or "" to try the next pattern
+
+
+def _cleaned(field_type: str, min_length: int) -> Callable[[str], str]:
+    def accept(raw: str) -> str:
+        value = clean_extracted_text(raw, field_type)
+        return value if len(value) >= min_length else ""
+    return accept
+
+
+def _phone(raw: str) -> str:
+    phone = raw.strip()
+    digits = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    return phone if len(digits) >= 10 else ""
+
+
+_LENDER_END = r'(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Department|\n|$)'
+_TITLED_LENDER_END = r'(?:\s*Lending|\s*Date|\s*Phone|\s*Email|\s*Staff\s+ID|\s*Employee\s+ID|\s*Department|\n|$)'
+_ISSUER_END = r'(?:Staff\s+ID|Date|Time|Invoice|Due|\n|$)'
+_MONTH_DATE = r'(September|October|November|December|January|February|March|April|May|June|July|August)\s+\d{1,2},?\s+\d{4}'
+
+_FIELD_RULES = (
+    FieldRule(("invoice_number",), _compile([
+        r'Invoice\s*[#:]?\s*([A-Z0-9-]+)',
+        r'INV[#:-]?\s*([A-Z0-9-]+)',
+        r'Invoice\s+Number[#:]?\s*([A-Z0-9-]+)',
+        r'Lending\s+Agreement[#:]?\s*([A-Z0-9-]+)',
+    ]), _cleaned("general", 1)),
+    FieldRule(("student_id",), _compile([
+        r'Student\s+ID[#:]?\s*([A-Z0-9\-]+)',
+        r'STU[#\-]?\s*([A-Z0-9\-]+)',
+        r'ID[#:]?\s*([A-Z0-9\-]{5,15})',
+        r'Student\s+ID[#:]?\s*([A-Z0-9]+)',
+        r'STUD([0-9]{6,8})',
+        r'Borrower\s+ID[#:]?\s*([A-Z0-9\-]+)',
+        r'([a-z]+\.[a-z]+)@[a-z0-9.-]+\.(?:edu|ac\.uk|university)',  # Local part of a university email
+        r'([A-Z]{3}\d{4,8})',  # STU2023078
+        r'(?:^|\s)([A-Z]{2,4}\d{4,8})(?:\s|$)',
+    ]), _cleaned("student_id", 4)),
+    FieldRule(("student_name",), _compile([
+        r'(?:Full\s+Name|Student\s+Name|Name|Borrower)[:\s]*([A-Za-z][A-Za-z\s]{2,30}?)(?:\s*\n|\s*Student\s+ID|\s*Email|\s*Department|\s*Phone|$)',
+        r'Name[:\s]+([A-Za-z][A-Za-z\s]{2,30})',
+        r'([A-Z][a-z]+\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+(?:STU|ID|Email|Department)',
+        r'Student[:\s]+([A-Za-z][A-Za-z\s]{2,30}?)(?:\s|$)',
+        r'^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\s*$',
+    ], re.IGNORECASE | re.MULTILINE), _cleaned("name", 3)),
+    FieldRule(("lender_name", "issued_by"), _compile([
+        r'Issued\s+by\s+Staff[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Issued\s+by[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Lender[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Staff[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Teacher[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Instructor[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Approved\s+by[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Authorized\s+by[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Lending\s+Staff[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Responsible\s+Person[#:]?\s*([A-Za-z\s\.]+?)' + _LENDER_END,
+        r'Dr\.\s+([A-Za-z\s]+?)' + _TITLED_LENDER_END,
+        r'Prof\.\s+([A-Za-z\s]+?)' + _TITLED_LENDER_END,
+        r'Mr\.\s+([A-Za-z\s]+?)' + _TITLED_LENDER_END,
+        r'Ms\.\s+([A-Za-z\s]+?)' + _TITLED_LENDER_END,
+        r'Mrs\.\s+([A-Za-z\s]+?)' + _TITLED_LENDER_END,
+    ]), _cleaned("name", 3)),
+    FieldRule(("student_email",), _compile([
+        r'Email[#:]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
+        r'@\s*Email[#:]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
+        r'[@]?\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})',
+        r'\b([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\b',
+    ]), _cleaned("general", 1)),
+    FieldRule(("borrower_phone",), _compile([
+        r'Phone[#:]?\s*([+]?[\d\s\-\(\)]{10,15})',
+        r'Mobile[#:]?\s*([+]?[\d\s\-\(\)]{10,15})',
+        r'Contact[#:]?\s*([+]?[\d\s\-\(\)]{10,15})',
+    ]), _phone),
+    FieldRule(("department",), _compile([
+        r'Department[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)',
+        r'Dept[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)',
+        r'Faculty[#:]?\s*([A-Za-z\s&]+?)(?:Email|Year|Due|Phone|Project|\n)',
+    ]), _cleaned("department", 3)),
+    FieldRule(("project_name",), _compile([
+        r'Project[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)',
+        r'Assignment[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)',
+        r'Course[#:]?\s*([A-Za-z0-9\s]+?)(?:Supervisor|Due|Location|Purpose|\n)',
+    ]), _cleaned("general", 3)),
+    FieldRule(("supervisor_name",), _compile([
+        r'Supervisor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)',
+        r'Instructor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)',
+        r'Professor[#:]?\s*([A-Za-z\s]+?)(?:Email|Department|Project|Due|\n)',
+    ]), _cleaned("name", 3)),
+    FieldRule(("lending_purpose",), _compile([
+        r'Purpose[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)',
+        r'Reason[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)',
+        r'Use\s+for[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Location|Due|Project|Supervisor|\n)',
+    ]), _cleaned("general", 6)),
+    FieldRule(("lending_location",), _compile([
+        r'Location[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)',
+        r'Lab[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)',
+        r'Room[#:]?\s*([A-Za-z0-9\s,.-]+?)(?:Purpose|Due|Project|Supervisor|\n)',
+    ]), _cleaned("general", 3)),
+    FieldRule(("emergency_contact_name",), _compile([
+        r'Emergency\s+Contact[#:]?\s*([A-Za-z\s]+?)(?:Phone|Email|Department|\n)',
+        r'Emergency[#:]?\s*([A-Za-z\s]+?)(?:Phone|Email|Department|\n)',
+    ]), _cleaned("name", 3)),
+    # Only reached when no lender rule matched, so it fills both fields
+    FieldRule(("issued_by", "lender_name"), _compile([
+        r'Issued\s+by\s+Staff:\s*([A-Za-z\s\.\-]+?)' + _ISSUER_END,
+        r'Issued\s+by\s+Staff[#:]?\s*([A-Za-z\s\.\-]+?)' + _ISSUER_END,
+        r'Staff:\s*([A-Za-z\s\.\-]+?)' + _ISSUER_END,
+        r'Staff[#:]?\s*([A-Za-z\s\.\-]+?)' + _ISSUER_END,
+        r'Dr\.\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
+        r'Prof\.\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
+        r'Professor\s+([A-Za-z\s\.\-]+?)(?:Date|Time|Invoice|Due|Staff\s+ID|\n|$)',
+        r'Issued\s+by[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)',
+        r'Approved\s+By[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n|Processing)',
+        r'Lender[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)',
+        r'Lab\s+Manager[#:]?\s*([A-Za-z\s\.\-]+?)(?:Designation|Department|Date|\n)',
+    ]), _cleaned("name", 3)),
+    FieldRule(("lending_date",), _compile([
+        r'Issue\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
+        r'@\s*Issue\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
+        r'Lending\s+Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
+        r'Date[#:]?\s*([A-Za-z0-9,\s]+?)(?:\n|@|Due)',
+        _MONTH_DATE,
+    ]), convert_date_to_iso_format),
+    FieldRule(("due_date", "expected_return_date"), _compile([
+        r'Due\s+Date[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',
+        r'Due\s+Date[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
+        r'Return\s+Date[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',
+        r'Return\s+Date[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
+        r'Expected\s+Return[#:]?\s*(\d{4}-\d{1,2}-\d{1,2})',
+        r'Expected\s+Return[#:]?\s*([A-Za-z0-9,\s-]+?)(?:\n|$|Invoice|Type)',
+        _MONTH_DATE,
+        r'Sept?\s*\d{1,2},?\s*\d{4}',
+    ]), convert_date_to_iso_format),
+)
+
+
+def _extract_fields(extracted: dict, full_text: str):
+    for rule in _FIELD_RULES:
+        if extracted.get(rule.fields[0]):
+            continue
+        for pattern in rule.patterns:
+            match = pattern.search(full_text)
+            if not match:
+                continue
+            value = rule.accept(match.group(1))
+            if value:
+                for field in rule.fields:
+                    extracted[field] = value
+                api_logger.debug(f"Extracted {rule.fields[0]} with {pattern.pattern!r}: {value}")
+                break
+
+
+# Items
+
+_ITEMS_SECTION_START = re.compile(r'^Items:\s*$', re.IGNORECASE)
+_ITEMS_SECTION_END = re.compile(r'(TOTAL|SIGNATURE|TERMS|CONDITIONS|NOTES)', re.IGNORECASE)
+_ITEMS_HEADER = re.compile(
+    r'^(Items|Item|Name|SKU|Code|Qty|Quantity|Price|Value|Total|Condition)(\s|:|$)', re.IGNORECASE
+)
+_NOT_ITEM_NAMES = {'item', 'name', 'product', 'component', 'equipment', 'qty', 'quantity', 'price', 'total', 'sku', 'code'}
+_NOT_ITEM_ROW_NAMES = {'item', 'name', 'product', 'component'}  # Checked again on the name column of numbered rows
+
+# Line layouts for extract_item_from_line: "table" rows carry name, SKU, qty,
+# price and total; "numbered" rows start with a list number; "named" rows have
+# a name, qty and price but no SKU
+_LINE_ITEM_PATTERNS = (
+    (re.compile(r'^([A-Za-z\s\-]+?)\s+([A-Z0-9\-]{2,})\s+(\d+)\s+\$?([\d,.]+)\s+\$?([\d,.]+)'), "table"),
+    (re.compile(r'^([A-Za-z\s\-]+?)\s*\|\s*([A-Z0-9\-]+)\s*\|\s*(\d+)\s*\|\s*\$?([\d,.]+)\s*\|\s*\$?([\d,.]+)'), "table"),
+    (re.compile(r'^([A-Za-z\s\-]{3,}),\s*([A-Z0-9\-]+),\s*(\d+),\s*\$?([\d,.]+)'), "table"),
+    (re.compile(r'^([A-Za-z\s\-]{3,})\s+([A-Z0-9\-]{2,})'), "table"),
+    (re.compile(r'^(\d+)[\.\)]\s*([A-Za-z\s\-]{3,})(?:\s+([A-Z0-9\-]+))?\s*(?:(\d+))?\s*(?:\$?([\d,.]+))?'), "numbered"),
+    (re.compile(r'^([A-Za-z][A-Za-z\s\-]{2,50})(?:\s+(\d+))?\s*(?:\$?([\d,.]+))?'), "named"),
+    (re.compile(r'^([A-Za-z\s\-]{3,})\s{2,}([A-Z0-9\-]+)\s{2,}(\d+)\s{2,}\$?([\d,.]+)'), "table"),
+    (re.compile(r'^([A-Za-z\s\-]+?)\s*-\s*QTY:\s*(\d+)\s*-\s*\$?([\d,.]+)'), "named"),
+    (re.compile(r'^([A-Za-z\s\-]+?)\s*-\s*Quantity:\s*(\d+)\s*-\s*Price:\s*\$?([\d,.]+)'), "named"),
+    (re.compile(r'^([A-Za-z\s\-]+?)\s+QTY\s+(\d+)\s+\$?([\d,.]+)'), "named"),
+)
+
+# Whole-text item patterns, used when the text has no usable "Items:" section.
+# The first two are name/qty/price rows; the rest are name/SKU/qty/price/total
+# tables, the last of them numbered. Each is paired with a lowercase literal
+# every match contains; the scan is skipped when the text lacks it.
+_TEXT_ITEM_PATTERNS = tuple((re.compile(pattern, re.IGNORECASE | re.MULTILINE), required) for pattern, required in (
+    (r'([A-Za-z][A-Za-z\s\-\d]{2,30}?)\s*-\s*QTY:\s*(\d+)\s*-\s*\$?([\d,.]+)', 'qty:'),
+    (r'([A-Za-z][A-Za-z\s\-\d]{3,30}?)\s+QTY:\s*(\d+)\s+\$?([\d,.]+)', 'qty:'),
+    (r'([A-Za-z\s\-]+)\s*\|\s*([A-Z0-9\-]+)\s*\|\s*(\d+)\s*\|\s*\$?([\d,.]+)\s*\|\s*\$?([\d,.]+)', '|'),
+    (r'([A-Za-z\s\-]{3,})\s+([A-Z0-9\-]{2,})\s+(\d+)\s+\$?([\d,.]+)\s+\$?([\d,.]+)', ''),
+    (r'([A-Za-z\s\-]{3,}),\s*([A-Z0-9\-]+),\s*(\d+),\s*\$?([\d,.]+),\s*\$?([\d,.]+)', ','),
+    (r'(\d+)\.\s*([A-Za-z\s\-]+)\s+([A-Z0-9\-]+)\s+(\d+)\s+\$?([\d,.]+)', '.'),
+))
+_NAMED_TEXT_ITEM_PATTERNS = 2
+
+_EQUIPMENT_WORDS = re.compile(
+    r'\b(Oscilloscope|Multimeter|Microscope|Caliper|Micrometer|Generator|Analyzer|Sensor|Breadboard|Arduino|'
+    r'Resistor|Capacitor|Inductor|Transistor|IC|Chip|Module|Board|Kit|Tool|Meter|Probe|Cable|Wire|Component|'
+    r'Computer|Laptop|Monitor|Keyboard|Mouse|Tablet|Phone|Camera|Lens|Tripod|Battery|Charger|Adapter|Switch|'
+    r'Router|Hub|Speaker|Headphone|Microphone|Projector|Screen|Printer|Scanner|Drive|Disk|Memory|Card|Reader)\b',
+    re.IGNORECASE
+)
+MAX_FALLBACK_EQUIPMENT_ITEMS = 5
+MAX_FALLBACK_LINE_ITEMS = 10
+
+_NOT_ITEM_LINE = re.compile(r'^(date|time|total|signature|terms|conditions|notes|email|phone|address|department)', re.IGNORECASE)
+_ITEM_LINE_HINTS = (
+    re.compile(r'\b(equipment|tool|device|component|item|product)\b', re.IGNORECASE),
+    re.compile(r'\b[A-Z]{2,}[\d\-]+\b'),  # SKU-like
+    re.compile(r'\d+\s*x\s*[A-Za-z]', re.IGNORECASE),  # Quantity
+    re.compile(r'\$\d+'),  # Price
+)
+
+
+def _lending_item(name: str, sku: str, quantity: int, unit_value: float, total_value: float,
+                  usage_purpose: str = "", usage_location: str = "") -> dict:
+    return {
+        "name": name,
+        "sku": sku,
+        "serial_number": "",
+        "quantity": quantity,
+        "unit_value": unit_value,
+        "total_value": total_value,
+        "condition_at_lending": "good",
+        "risk_level": "low",
+        "safety_requirements": "",
+        "usage_purpose": usage_purpose,
+        "usage_location": usage_location
+    }
+
+
+def _price(value: str) -> float:
+    return float(value.replace(',', ''))
+
+
+def extract_item_from_line(line: str) -> Optional[dict]:
+    """Item fields from a single line of an items section, or None if it does not look like one"""
+    line = line.strip()
+    try:
+        for pattern, layout in _LINE_ITEM_PATTERNS:
+            match = pattern.search(line)
+            if not match:
+                continue
+            groups = match.groups()
+
+            # Skip header-like entries; for numbered rows this checks the list number
+            name = groups[0].strip() if groups[0] else ""
+            if len(name) < 3 or name.lower() in _NOT_ITEM_NAMES:
+                continue
+
+            total_value = 0.0
+            if layout == "numbered":
+                name = groups[1].strip() if groups[1] else ""
+                sku = groups[2] or f"AUTO{random.randint(100, 999)}"
+                quantity = int(groups[3]) if groups[3] else 1
+                unit_value = _price(groups[4]) if groups[4] else 0.0
+            elif layout == "named":
+                sku = f"AUTO{random.randint(100, 999)}"
+                quantity = int(groups[1]) if groups[1] else 1
+                unit_value = _price(groups[2]) if groups[2] else 0.0
+            else:
+                sku = groups[1] or f"AUTO{random.randint(100, 999)}"
+                quantity = int(groups[2]) if len(groups) > 2 and groups[2] else 1
+                unit_value = _price(groups[3]) if len(groups) > 3 and groups[3] else 0.0
+                total_value = _price(groups[4]) if len(groups) > 4 and groups[4] else 0.0
+
+            if len(name) < 3:
+                continue
+
+            api_logger.debug(f"Extracted item with {layout} pattern: {name} (SKU: {sku}, Qty: {quantity})")
+            return _lending_item(name, sku, quantity, unit_value, total_value if total_value > 0 else quantity * unit_value)
+
+    except Exception as e:
+        api_logger.debug(f"Failed to extract item from line '{line}': {e}")
+
+    return None
+
+
+def _items_section_lines(lines: Sequence[str]) -> list:
+    """Lines between an "Items:" heading and the next total/signature/terms/notes line, headers excluded"""
+    section = []
+    in_section = False
+    for line in lines:
+        line = line.strip()
+        if _ITEMS_SECTION_START.search(line):
+            in_section = True
+            continue
+        if _ITEMS_SECTION_END.search(line):
+            in_section = False
+        elif in_section and line and not _ITEMS_HEADER.search(line):
+            section.append(line)
+    return section
+
+
+def _items_from_text(text: str, usage_purpose: str, usage_location: str) -> list:
+    items = []
+    seen_names = set()
+    lowered = text.lower()
+    for pattern_index, (pattern, required) in enumerate(_TEXT_ITEM_PATTERNS):
+        if required not in lowered:
+            continue
+        for match in pattern.finditer(text):
+            groups = match.groups()
+            try:
+                name = groups[0].strip()
+                if len(name) < 3 or name.lower() in _NOT_ITEM_NAMES:
+                    continue
+
+                if pattern_index < _NAMED_TEXT_ITEM_PATTERNS:
+                    sku = f"AUTO{len(items) + 1:03d}"
+                    quantity = int(groups[1])
+                    unit_value = _price(groups[2])
+                    total_value = quantity * unit_value
+                elif groups[0][0] in "0123456789":  # Numbered row
+                    name = groups[1].strip()
+                    sku = groups[2]
+                    quantity = int(groups[3])
+                    unit_value = _price(groups[4])
+                    total_value = quantity * unit_value
+                else:
+                    sku = groups[1]
+                    quantity = int(groups[2])
+                    unit_value = _price(groups[3])
+                    total_value = _price(groups[4])
+            except (ValueError, IndexError) as e:
+                api_logger.debug(f"Failed to parse item match: {e}")
+                continue
+
+            if len(name) > 2 and name.lower() not in _NOT_ITEM_ROW_NAMES and name.lower() not in seen_names:
+                seen_names.add(name.lower())
+                items.append(_lending_item(name, sku, quantity, unit_value, total_value, usage_purpose, usage_location))
+    return items
+
+
+def _items_from_equipment_words(text: str, usage_purpose: str, usage_location: str) -> list:
+    # First mention order, case-sensitive like the match itself
+    equipment_names = list(dict.fromkeys(_EQUIPMENT_WORDS.findall(text)))[:MAX_FALLBACK_EQUIPMENT_ITEMS]
+    return [
+        _lending_item(equipment.title(), f"AUTO{i + 1:03d}", 1, 0.0, 0.0, usage_purpose, usage_location)
+        for i, equipment in enumerate(equipment_names)
+    ]
+
+
+def _items_from_lines(lines: Sequence[str]) -> list:
+    items = []
+    for line in lines:
+        line = line.strip()
+        if len(line) < 3 or _NOT_ITEM_LINE.search(line):
+            continue
+        if any(hint.search(line) for hint in _ITEM_LINE_HINTS):
+            item = extract_item_from_line(line)
+            if item and len(items) < MAX_FALLBACK_LINE_ITEMS:
+                items.append(item)
+    return items
+
+
+def _extract_items(text: str, lines: Sequence[str], extracted: dict) -> list:
+    purpose, location = extracted.get("lending_purpose", ""), extracted.get("lending_location", "")
+
+    items = [item for item in map(extract_item_from_line, _items_section_lines(lines)) if item]
+    if items:
+        return items
+
+    items = _items_from_text(text, purpose, location)
+    if items:
+        return items
+
+    api_logger.debug("No structured items found, falling back to equipment names")
+    return _items_from_equipment_words(text, purpose, location) or _items_from_lines(lines)
+
+
+# Confidence weights per filled field; items add ITEM_CONFIDENCE each, up to MAX_CONFIDENCE_ITEMS
+FIELD_CONFIDENCE = {
+    "student_name": 15,
+    "student_id": 15,
+    "student_email": 10,
+    "department": 10,
+    "due_date": 10,
+    "invoice_number": 5,
+    "project_name": 10,
+    "supervisor_name": 10,
+    "lending_purpose": 10,
+    "lending_location": 5,
+    "issued_by": 5,
+    "borrower_phone": 5,
+}
+ITEM_CONFIDENCE = 5
+MAX_CONFIDENCE_ITEMS = 4
+
+
+def parse_text_simple(text: str) -> dict:
+    """
+    Extract lending invoice fields and items from OCR text
+
+    confidence_score (0-100) reflects how many of the fields were found.
+    """
+    text = preprocess_ocr_text(text)
+    raw_lines = text.split('\n')
+    lines = [line.strip() for line in raw_lines if line.strip()]
+
+    extracted = {
+        # Student
+        "student_name": "",
+        "student_id": "",
+        "student_email": "",
+        "department": "",
+        "borrower_phone": "",
+        "borrower_address": "",
+
+        # Lending
+        "lender_name": "",
+        "lending_date": "",
+        "lending_time": "",
+        "invoice_type": "lending",
+
+        # Emergency contact
+        "emergency_contact_name": "",
+        "emergency_contact_phone": "",
+
+        # Purpose and context
+        "lending_purpose": "",
+        "lending_location": "",
+        "project_name": "",
+
+        "issued_by": "",
+        "due_date": "",
+        "supervisor_name": "",
+        "supervisor_email": "",
+        "invoice_number": "",
+        "notes": "",
+        "items": [],
+        "confidence_score": 0
+    }
+
+    _extract_fields(extracted, ' '.join(lines))
+
+    try:
+        extracted["items"] = _extract_items(text, raw_lines, extracted)
+    except Exception as e:
+        api_logger.warning(f"Failed to parse equipment items: {e}")
+
+    # Defaults for fields the form needs
+    extracted["lending_time"] = extracted["lending_time"] or "09:00"
+    if extracted["lending_purpose"]:
+        extracted["notes"] = f"Lending for: {extracted['lending_purpose']}"
+    else:
+        extracted["notes"] = "Equipment lending - see attached invoice for details"
+
+    confidence = sum(weight for field, weight in FIELD_CONFIDENCE.items() if extracted[field])
+    confidence += ITEM_CONFIDENCE * min(len(extracted["items"]), MAX_CONFIDENCE_ITEMS)
+    extracted["confidence_score"] = min(confidence, 100)
+
+    api_logger.info(
+        f"Parsed lending invoice text ({len(text)} characters): confidence {extracted['confidence_score']}%, "
+        f"borrower '{extracted['student_name']}' ({extracted['student_id']}), {len(extracted['items'])} items"
+    )
+    return extracted
+
+
+def calculate_confidence_score(extracted_data: dict) -> float:
+    """
+    Calculate confidence score based on extracted data completeness
+    """
+    fields = ["student_name", "student_id", "student_email", "department"]
+    filled_fields = sum(1 for field in fields if extracted_data.get(field))
+    return min(0.9, filled_fields / len(fields))
+
+
+_FALLBACK_NAME = re.compile(r'(?:Name|Student)[:\s]+([A-Za-z\s]+)', re.IGNORECASE)
+_FALLBACK_ID = re.compile(r'(?:ID|Student\s+ID)[:\s]+([A-Z0-9]+)', re.IGNORECASE)
+_FALLBACK_EMAIL = re.compile(r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})')
+
+
+def parse_text_simple_fallback(text: str) -> dict:
+    """
+    Simple fallback parsing function if the main one fails
+    """
+    try:
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        extracted = {
+            "student_name": "",
+            "student_id": "",
+            "student_email": "",
+            "department": "",
+            "due_date": "",
+            "items": [],
+            "confidence_score": 30
+        }
+
+        full_text = ' '.join(lines)
+
+        name_match = _FALLBACK_NAME.search(full_text)
+        if name_match:
+            extracted["student_name"] = name_match.group(1).strip()
+
+        id_match = _FALLBACK_ID.search(full_text)
+        if id_match:
+            extracted["student_id"] = id_match.group(1).strip()
+
+        email_match = _FALLBACK_EMAIL.search(full_text)
+        if email_match:
+            extracted["student_email"] = email_match.group(1)
+
+        return extracted
+    except Exception as e:
+        api_logger.error(f"Even fallback parsing failed: {e}")
+        return {
+            "student_name": "",
+            "student_id": "",
+            "student_email": "",
+            "department": "",
+            "due_date": "",
+            "items": [],
+            "confidence_score": 0
+        }
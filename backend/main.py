@@ -1,10 +1,18 @@
 import logging
-from inventory_api import app
-from invoice_api import invoice_router
+from inventory_api import (
+    app, refresh_product_spec_facets, SPEC_FACETS_REFRESH_MINUTES,
+    take_stock_snapshot, STOCK_SNAPSHOT_HOUR
+)
+from invoice_api import invoice_router, reconcile_invoice_summary, resume_ocr_jobs, INVOICE_SUMMARY_RECONCILE_HOUR
 from settings_api import settings_router
 from analytics_basic import router as analytics_router
 from analytics_premium import router as premium_analytics_router
 from simple_auth_api import router as auth_router
+from invoice_renderer import shutdown_render_pool
+from image_variants import shutdown_variant_pool
+from ocr_service import shutdown_ocr_pool
+from upload_store import collect_unreferenced_files, UPLOAD_STORE_GC_HOUR
+from ocr_cache import evict_ocr_cache, OCR_CACHE_EVICT_HOUR
 from overdue_scheduler import overdue_scheduler, get_scheduler_status, manual_overdue_check
 
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +28,84 @@ async def startup_event():
         logger.info("📅 Daily checks scheduled for 9:00 AM")
     except Exception as e:
         logger.error(f"Failed to start overdue scheduler: {e}")
+    
+    try:
+        # Maintenance jobs share the overdue scheduler's event loop
+        refresh_product_spec_facets()
+        overdue_scheduler.scheduler.add_job(
+            refresh_product_spec_facets,
+            'interval',
+            minutes=SPEC_FACETS_REFRESH_MINUTES,
+            id='refresh_product_spec_facets',
+            name='Refresh Product Specification Facets',
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f"📊 Product specification facets refresh every {SPEC_FACETS_REFRESH_MINUTES} minutes")
+        
+        overdue_scheduler.scheduler.add_job(
+            take_stock_snapshot,
+            'cron',
+            hour=STOCK_SNAPSHOT_HOUR,
+            minute=0,
+            id='stock_balance_snapshot',
+            name='Nightly Stock Balance Snapshot',
+            misfire_grace_time=3600,
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f"📦 Stock balance snapshots scheduled daily at {STOCK_SNAPSHOT_HOUR}:00")
+        
+        overdue_scheduler.scheduler.add_job(
+            reconcile_invoice_summary,
+            'cron',
+            hour=INVOICE_SUMMARY_RECONCILE_HOUR,
+            minute=0,
+            id='invoice_summary_reconciliation',
+            name='Nightly Invoice Summary Reconciliation',
+            misfire_grace_time=3600,
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f"🧮 Invoice summary reconciliation scheduled daily at {INVOICE_SUMMARY_RECONCILE_HOUR}:00")
+        
+        overdue_scheduler.scheduler.add_job(
+            collect_unreferenced_files,
+            'cron',
+            hour=UPLOAD_STORE_GC_HOUR,
+            minute=0,
+            id='upload_store_cleanup',
+            name='Nightly Upload Store Cleanup',
+            misfire_grace_time=3600,
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f"🗂️ Upload store cleanup scheduled daily at {UPLOAD_STORE_GC_HOUR}:00")
+        
+        overdue_scheduler.scheduler.add_job(
+            evict_ocr_cache,
+            'cron',
+            hour=OCR_CACHE_EVICT_HOUR,
+            minute=30,
+            id='ocr_cache_eviction',
+            name='Nightly OCR Cache Eviction',
+            misfire_grace_time=3600,
+            coalesce=True,
+            max_instances=1,
+            replace_existing=True
+        )
+        logger.info(f"🔁 OCR cache eviction scheduled daily at {OCR_CACHE_EVICT_HOUR}:30")
+    except Exception as e:
+        logger.error(f"Failed to schedule maintenance jobs: {e}")
+    
+    try:
+        resume_ocr_jobs()
+    except Exception as e:
+        logger.error(f"Failed to resume OCR jobs: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -29,6 +115,10 @@ async def shutdown_event():
         logger.info("✅ Overdue notification system stopped")
     except Exception as e:
         logger.error(f"Error stopping scheduler: {e}")
+    
+    shutdown_render_pool()
+    shutdown_variant_pool()
+    shutdown_ocr_pool()
 
 logger.info("=> Using simple authentication system")
 logger.info("=> Admin credentials: admin / College@2025")
@@ -0,0 +1,88 @@
+"""
+OCR results cached by image content.
+
+Running Tesseract over an invoice photo takes seconds; looking up a row by primary
+key takes milliseconds. Results are keyed by the SHA-256 of the file bytes plus
+OCR_CONFIG_VERSION, so re-uploads and re-extractions of the same photo skip the
+OCR pipeline, while a change to the pipeline makes old entries miss instead of
+returning stale text. Each entry holds the raw text and the parsed invoice fields.
+
+The table is bounded: evict_ocr_cache() keeps the OCR_CACHE_MAX_ENTRIES most
+recently used entries and is run nightly by the scheduler.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from database_manager import job_db, DatabaseManager
+from logging_config import api_logger
+from ocr_service import OCR_CONFIG_VERSION
+
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 5000))
+OCR_CACHE_EVICT_HOUR = int(os.getenv('OCR_CACHE_EVICT_HOUR', 4))
+
+
+@dataclass
+class CachedOCRResult:
+    ocr_text: str
+    extracted_data: Optional[dict]  # None when the text was cached without being parsed
+    confidence_score: Optional[float]
+
+
+def get_cached_ocr(db: DatabaseManager, sha256: str) -> Optional[CachedOCRResult]:
+    """Cached result for a file's content under the current OCR configuration"""
+    result = db.execute_query("""
+    UPDATE ocr_cache SET last_accessed_at = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+    WHERE sha256 = %s AND config_version = %s
+    RETURNING ocr_text, extracted_data, confidence_score
+    """, (sha256, OCR_CONFIG_VERSION))
+    if not result:
+        return None
+    row = result[0]
+    return CachedOCRResult(row['ocr_text'], row['extracted_data'], row['confidence_score'])
+
+
+def save_ocr_result(
+    db: DatabaseManager,
+    sha256: str,
+    ocr_text: str,
+    extracted_data: Optional[dict] = None,
+    confidence_score: Optional[float] = None
+):
+    """Cache OCR output; parsed fields already cached for the content are kept when none are given"""
+    if not ocr_text or not ocr_text.strip():
+        return  # Failed runs return empty text; caching them would make the failure permanent
+    try:
+        db.execute_command("""
+        INSERT INTO ocr_cache (sha256, config_version, ocr_text, extracted_data, confidence_score)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (sha256, config_version) DO UPDATE SET
+            ocr_text = EXCLUDED.ocr_text,
+            extracted_data = COALESCE(EXCLUDED.extracted_data, ocr_cache.extracted_data),
+            confidence_score = COALESCE(EXCLUDED.confidence_score, ocr_cache.confidence_score),
+            last_accessed_at = CURRENT_TIMESTAMP
+        """, (
+            sha256, OCR_CONFIG_VERSION, ocr_text,
+            json.dumps(extracted_data, default=str) if extracted_data is not None else None,
+            confidence_score
+        ))
+    except Exception as e:
+        api_logger.warning(f"Failed to cache OCR result for {sha256}: {e}")
+
+
+def evict_ocr_cache(db: Optional[DatabaseManager] = None) -> int:
+    """Drop entries from older OCR configurations and all but the most recently used ones"""
+    with job_db(db) as job_connection:
+        removed = job_connection.execute_query("""
+        DELETE FROM ocr_cache
+        WHERE config_version <> %s
+           OR (sha256, config_version) IN (
+               SELECT sha256, config_version FROM ocr_cache
+               ORDER BY last_accessed_at DESC
+               OFFSET %s
+           )
+        RETURNING sha256
+        """, (OCR_CONFIG_VERSION, OCR_CACHE_MAX_ENTRIES))
+    api_logger.info(f"OCR cache eviction removed {len(removed)} entries")
+    return len(removed)
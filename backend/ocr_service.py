@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+OCR for uploaded invoice images, run in a bounded process pool
+
+Tesseract, NumPy and OpenCV work is CPU-bound and can take tens of seconds per
+image, so the API never calls extract_text_from_image directly: run_ocr() hands
+it to a ProcessPoolExecutor and awaits the result. The number of jobs waiting
+for a worker is capped; past that run_ocr raises OCRQueueFull immediately and
+the endpoints answer 202 instead of piling up work.
+
+Within a job the Tesseract passes for each page segmentation mode run on
+OCR_CANDIDATE_THREADS threads (each pass is a separate tesseract process), and
+the job returns as soon as one pass reaches OCR_EARLY_EXIT_CONFIDENCE mean word
+confidence; a contrast-enhanced version of the page is only OCR'd when no pass
+over the original does. The pages of a PDF are separate pool jobs, and pages
+with an embedded text layer are read without OCR.
+
+run_ocr takes a file path or the file's bytes. Bytes go to the worker as they
+are and are decoded in memory, so uploads that are only OCR'd never touch disk.
+
+Each worker process creates its OCR engine once, when it starts, and reuses it
+for every job: with tesserocr installed that is a set of initialised libtesseract
+instances with the language data already loaded; otherwise passes fall back to
+pytesseract, which starts the tesseract executable for every call.
+
+Like invoice_renderer, worker processes only import this module (no database
+or FastAPI).
+"""
+
+import asyncio
+import io
+import logging
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Concurrent passes each get one thread instead of competing for all cores.
+# OpenMP reads this only when it is loaded, so it is set before tesserocr (and
+# OpenCV) are imported below; pool workers and tesseract processes inherit it.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 2))
+OCR_JOB_TIMEOUT_SECONDS = int(os.getenv('OCR_JOB_TIMEOUT_SECONDS', 120))
+OCR_MAX_QUEUED_JOBS = int(os.getenv('OCR_MAX_QUEUED_JOBS', 8))
+# Suggested Retry-After for clients turned away while the queue is full
+OCR_RETRY_AFTER_SECONDS = int(os.getenv('OCR_RETRY_AFTER_SECONDS', 15))
+# Tesseract passes run at once inside one OCR job, and the mean word confidence
+# (0-100) at which a pass is accepted without waiting for the others
+OCR_CANDIDATE_THREADS = int(os.getenv('OCR_CANDIDATE_THREADS', max(1, (os.cpu_count() or 2) // OCR_WORKERS)))
+OCR_EARLY_EXIT_CONFIDENCE = float(os.getenv('OCR_EARLY_EXIT_CONFIDENCE', 85))
+# Part of the OCR cache key: bump whenever preprocessing, Tesseract options or
+# the invoice text parser change, so results cached by older versions are not reused
+OCR_CONFIG_VERSION = 4
+# auto (tesserocr when installed, else pytesseract) | tesserocr | pytesseract
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto').lower()
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+OCR_PASS_TIMEOUT_SECONDS = 30
+# PDFs: pages are rasterized at OCR_PDF_DPI and OCR'd in parallel across the pool,
+# except pages whose embedded text layer has at least OCR_PDF_TEXT_LAYER_MIN_CHARS characters
+OCR_PDF_DPI = int(os.getenv('OCR_PDF_DPI', 144))
+OCR_PDF_MAX_PAGES = int(os.getenv('OCR_PDF_MAX_PAGES', 20))
+OCR_PDF_TEXT_LAYER_MIN_CHARS = 20
+# Page segmentation modes tried for each image version, most reliable for documents first
+OCR_PAGE_SEGMENTATION_MODES = (
+    6,  # Single uniform block of text
+    4,  # Single column of text of variable sizes
+)
+
+# OCR imports with robust error handling
+CV2_AVAILABLE = False
+OCR_AVAILABLE = False
+cv2 = None
+pytesseract = None
+tesserocr = None
+np = None
+
+try:
+    # Import basic OCR dependencies first
+    from PIL import Image
+    
+    # Try importing numpy
+    try:
+        import numpy as np
+        print("NumPy imported successfully")
+    except ImportError as np_error:
+        print(f"NumPy not available: {np_error}")
+        np = None
+    
+    # Try importing tesseract
+    try:
+        import pytesseract
+        # Configure Tesseract path for Windows, or wherever TESSERACT_CMD points
+        if os.getenv('TESSERACT_CMD') or os.name == 'nt':
+            pytesseract.pytesseract.tesseract_cmd = os.getenv(
+                'TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+            )
+        print("Tesseract imported successfully")
+    except ImportError as tess_error:
+        print(f"Tesseract not available: {tess_error}")
+        pytesseract = None
+    
+    # In-process libtesseract binding; optional, pytesseract is used without it
+    try:
+        import tesserocr
+        print("tesserocr imported successfully")
+    except ImportError:
+        tesserocr = None
+    
+    # Try importing cv2 last (most problematic)
+    try:
+        import cv2
+        CV2_AVAILABLE = True
+        print("OpenCV imported successfully")
+    except (ImportError, AttributeError) as cv2_error:
+        print(f"OpenCV not available: {cv2_error}")
+        cv2 = None
+    
+    # OCR is available if we have the basic tools
+    if pytesseract is not None or tesserocr is not None:
+        OCR_AVAILABLE = True
+        print("OCR libraries loaded successfully")
+    else:
+        print("OCR not available - missing tesseract")
+        
+except ImportError as e:
+    print(f"OCR libraries not available: {e}")
+
+
+class PytesseractEngine:
+    """Runs the tesseract executable once per pass"""
+    name = "pytesseract"
+    
+    def recognize(self, image, psm: int) -> tuple:
+        """Text of one pass and the mean confidence (0-100) of the words it recognised"""
+        data = pytesseract.image_to_data(
+            image, lang=OCR_LANGUAGE, config=f'--psm {psm} --oem 3',
+            timeout=OCR_PASS_TIMEOUT_SECONDS, output_type=pytesseract.Output.DICT
+        )
+        
+        # Rebuild the text line by line, with a blank line between paragraphs
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            confidence = float(data['conf'][i])
+            if not word or confidence < 0:
+                continue
+            lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+            confidences.append(confidence)
+        
+        text_lines = []
+        previous_paragraph = None
+        for (block, paragraph, _), words in lines.items():
+            if previous_paragraph is not None and (block, paragraph) != previous_paragraph:
+                text_lines.append("")
+            text_lines.append(" ".join(words))
+            previous_paragraph = (block, paragraph)
+        
+        mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return "\n".join(text_lines), mean_confidence
+    
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """libtesseract through tesserocr, initialised once and reused for every pass
+
+    A tesseract API object is not thread-safe, so there is one per concurrent pass.
+    """
+    name = "tesserocr"
+    
+    def __init__(self, instances: int):
+        self._apis = queue.LifoQueue()
+        for _ in range(instances):
+            self._apis.put(tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGE))
+    
+    def recognize(self, image, psm: int) -> tuple:
+        """Text of one pass and the mean confidence (0-100) of the words it recognised"""
+        api = self._apis.get()
+        try:
+            api.SetPageSegMode(psm)
+            api.SetImage(image)
+            if not api.Recognize(OCR_PASS_TIMEOUT_SECONDS * 1000):
+                raise RuntimeError("tesseract pass timed out")
+            text = api.GetUTF8Text()
+            confidences = [confidence for confidence in api.AllWordConfidences() if confidence >= 0]
+            return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+        finally:
+            api.Clear()
+            self._apis.put(api)
+    
+    def close(self):
+        while not self._apis.empty():
+            self._apis.get().End()
+
+
+_engine = None
+
+
+def get_ocr_engine():
+    """The OCR engine of this process, created on first use"""
+    global _engine
+    if _engine is None:
+        if OCR_ENGINE in ("auto", "tesserocr") and tesserocr is not None:
+            try:
+                _engine = TesserocrEngine(OCR_CANDIDATE_THREADS)
+            except Exception as e:
+                logger.warning(f"tesserocr engine failed to start, using pytesseract: {e}")
+        if _engine is None:
+            if pytesseract is None:
+                raise RuntimeError("No OCR engine available - install tesserocr or pytesseract")
+            _engine = PytesseractEngine()
+        logger.info(f"OCR engine: {_engine.name} (pid {os.getpid()})")
+    return _engine
+
+
+def _init_ocr_worker():
+    """Pool initializer: load the engine before the first job arrives"""
+    try:
+        get_ocr_engine()
+    except Exception as e:
+        logger.error(f"OCR worker could not start an engine: {e}")
+
+
+# A file path, or the file's bytes; bytes are decoded from memory without touching disk
+OCRSource = Union[str, os.PathLike, bytes, bytearray, memoryview]
+
+
+def _in_memory(source: OCRSource) -> bool:
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def _describe(source: OCRSource) -> str:
+    return f"<{len(source)} bytes in memory>" if _in_memory(source) else str(source)
+
+
+def is_pdf(source: OCRSource) -> bool:
+    if _in_memory(source):
+        return bytes(source[:5]) == b"%PDF-"
+    return str(source).lower().endswith('.pdf')
+
+
+def extract_text_from_image(source: OCRSource) -> str:
+    """Lightweight OCR optimized for low-memory systems (8GB RAM)"""
+    if not OCR_AVAILABLE:
+        logger.warning("OCR libraries not available")
+        return ""
+    
+    try:
+        logger.info(f"Starting lightweight OCR for: {_describe(source)}")
+        
+        if not _in_memory(source) and not os.path.exists(source):
+            logger.error(f"Image file not found: {source}")
+            return ""
+        
+        if is_pdf(source):
+            return extract_text_from_pdf(source)
+        
+        try:
+            image = _prepare_image(Image.open(io.BytesIO(source) if _in_memory(source) else source))
+        except Exception as e:
+            logger.error(f"Failed to load image: {e}")
+            return ""
+        
+        return ocr_image(image)
+        
+    except Exception as e:
+        logger.error(f"OCR processing failed: {e}")
+        return ""
+
+
+def _prepare_image(image):
+    """Downscale very large images (memory optimization) and convert to grayscale, which is all OCR uses"""
+    max_dimension = 2000
+    if max(image.size) > max_dimension:
+        ratio = max_dimension / max(image.size)
+        new_size = tuple(int(dim * ratio) for dim in image.size)
+        # Use LANCZOS for newer PIL versions, fallback to ANTIALIAS for older
+        try:
+            image = image.resize(new_size, Image.LANCZOS)
+        except AttributeError:
+            image = image.resize(new_size, Image.ANTIALIAS)
+        logger.info(f"Resized image to: {image.size}")
+        
+    if image.mode != 'L':
+        image = image.convert('L')
+        
+    logger.info(f"Image loaded: {image.size}, mode: {image.mode}")
+    return image
+
+
+# Below this grey-level standard deviation a page gets a contrast-enhanced pass
+# when the passes over the original did not reach OCR_EARLY_EXIT_CONFIDENCE
+OCR_LOW_CONTRAST_STD = 40
+
+
+def _enhance_contrast(gray) -> None:
+    """Stretch the contrast of a grayscale uint8 array in place"""
+    if CV2_AVAILABLE:
+        cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray, gray)
+    else:
+        # gray * 1.5 clipped to 255: values above 170 saturate
+        np.minimum(gray, 170, out=gray)
+        np.add(gray, gray >> 1, out=gray)
+
+
+def _run_passes(engine, name: str, image, best: tuple) -> tuple:
+    """Run the page segmentation mode passes over one image version concurrently
+
+    best is the (text, confidence) to beat; returns the new best as soon as one
+    reaches OCR_EARLY_EXIT_CONFIDENCE.
+    """
+    best_text, best_confidence = best
+    executor = ThreadPoolExecutor(max_workers=min(OCR_CANDIDATE_THREADS, len(OCR_PAGE_SEGMENTATION_MODES)))
+    try:
+        futures = {
+            executor.submit(engine.recognize, image, psm): f"{name} --psm {psm}"
+            for psm in OCR_PAGE_SEGMENTATION_MODES
+        }
+        for future in as_completed(futures):
+            pass_name = futures[future]
+            try:
+                text, confidence = future.result()
+            except Exception as e:
+                logger.debug(f"OCR failed for {pass_name}: {e}")
+                continue
+            
+            if confidence > best_confidence and len(text.strip()) > 10:
+                best_text, best_confidence = text, confidence
+                logger.info(f"Better OCR: {pass_name}, confidence: {confidence:.1f}, length: {len(text.strip())}")
+            
+            if best_confidence >= OCR_EARLY_EXIT_CONFIDENCE:
+                logger.info(f"Accepting {pass_name} at confidence {best_confidence:.1f}, skipping remaining passes")
+                break
+    finally:
+        # Passes that have not started are dropped; running ones finish on their own
+        executor.shutdown(wait=False, cancel_futures=True)
+    return best_text, best_confidence
+
+
+def ocr_image(image) -> str:
+    """Best text from the candidate Tesseract passes over one loaded grayscale page image
+
+    The page is copied into one NumPy array. Passes run over it as is first, and
+    only if none is confident enough and the page has low contrast is the same
+    array enhanced in place for a second round of passes.
+    """
+    try:
+        engine = get_ocr_engine()
+        best = ("", 0.0)
+        
+        gray = None
+        if np is not None:
+            try:
+                gray = np.array(image, dtype=np.uint8)
+            except Exception as e:
+                logger.warning(f"Preprocessing failed, using PIL: {e}")
+        
+        if gray is None:
+            best = _run_passes(engine, "PIL", image, best)
+        else:
+            # fromarray shares the array's memory; it is only enhanced once these passes have all finished
+            best = _run_passes(engine, "Original", Image.fromarray(gray), best)
+            if best[1] < OCR_EARLY_EXIT_CONFIDENCE:
+                try:
+                    if gray.std() < OCR_LOW_CONTRAST_STD:
+                        _enhance_contrast(gray)
+                        logger.info("Low contrast page, running enhanced passes")
+                        best = _run_passes(engine, "Enhanced", Image.fromarray(gray), best)
+                except Exception as e:
+                    logger.debug(f"Enhancement failed: {e}")
+        best_text, best_confidence = best
+        
+        # Fallback if nothing worked
+        if not best_text.strip():
+            try:
+                logger.info("Using simple fallback OCR")
+                best_text, _ = engine.recognize(image, OCR_PAGE_SEGMENTATION_MODES[0])
+            except Exception as e:
+                logger.error(f"Fallback OCR failed: {e}")
+                return ""
+        
+        del image, gray
+        
+        result_length = len(best_text.strip())
+        logger.info(f"OCR completed. Confidence: {best_confidence:.1f}, length: {result_length}")
+        
+        # Provide confidence feedback based on mean word confidence
+        if best_confidence >= 80:
+            logger.info("HIGH CONFIDENCE - Good text extraction")
+        elif best_confidence >= 60:
+            logger.info("MEDIUM CONFIDENCE - Review extracted data")
+        else:
+            logger.warning("LOW CONFIDENCE - Consider retaking photo")
+        
+        return best_text.strip()
+        
+    except Exception as e:
+        logger.error(f"OCR processing failed: {e}")
+        return ""
+
+
+def _open_pdf(source: OCRSource):
+    import fitz  # PyMuPDF
+    if _in_memory(source):
+        return fitz.open(stream=bytes(source) if isinstance(source, memoryview) else source, filetype="pdf")
+    return fitz.open(source)
+
+
+def read_pdf_text_layer(source: OCRSource) -> List[Optional[str]]:
+    """Embedded text of each page, or None for pages that have to be OCR'd (scans)"""
+    with _open_pdf(source) as doc:
+        if doc.page_count > OCR_PDF_MAX_PAGES:
+            logger.warning(f"PDF has {doc.page_count} pages, only the first {OCR_PDF_MAX_PAGES} are read")
+        texts = []
+        for page in doc.pages(0, min(doc.page_count, OCR_PDF_MAX_PAGES)):
+            text = page.get_text("text").strip()
+            texts.append(text if len(text) >= OCR_PDF_TEXT_LAYER_MIN_CHARS else None)
+        return texts
+
+
+def ocr_pdf_page(source: OCRSource, page_index: int) -> str:
+    """Rasterize one PDF page in grayscale at OCR_PDF_DPI and OCR it"""
+    try:
+        import fitz  # PyMuPDF
+        with _open_pdf(source) as doc:
+            pix = doc[page_index].get_pixmap(dpi=OCR_PDF_DPI, colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        logger.info(f"PDF page {page_index + 1} rasterized: {image.size}")
+        return ocr_image(_prepare_image(image))
+    except Exception as e:
+        logger.error(f"Failed to OCR page {page_index + 1} of {_describe(source)}: {e}")
+        return ""
+
+
+def merge_page_texts(page_texts: List[str]) -> str:
+    """Page texts in page order, separated by a blank line"""
+    return "\n\n".join(text.strip() for text in page_texts if text and text.strip())
+
+
+def extract_text_from_pdf(source: OCRSource) -> str:
+    """Text of every page of a PDF in this process: the text layer where there is one, OCR elsewhere
+
+    run_ocr spreads the pages of a PDF across the pool instead.
+    """
+    try:
+        page_texts = read_pdf_text_layer(source)
+    except ImportError:
+        logger.error("PyMuPDF not available for PDF processing")
+        return ""
+    except Exception as pdf_error:
+        logger.error(f"Failed to process PDF: {pdf_error}")
+        return ""
+    return merge_page_texts([
+        text if text is not None else ocr_pdf_page(source, index)
+        for index, text in enumerate(page_texts)
+    ])
+
+
+class OCRQueueFull(Exception):
+    """Every worker is busy and the waiting queue is at OCR_MAX_QUEUED_JOBS"""
+
+
+class OCRTimeout(Exception):
+    """An OCR job did not finish within OCR_JOB_TIMEOUT_SECONDS"""
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_jobs_in_flight = 0
+
+
+def get_ocr_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=_init_ocr_worker)
+        logger.info(f"OCR pool started with {OCR_WORKERS} workers")
+    return _executor
+
+
+def shutdown_ocr_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def ocr_queue_status() -> dict:
+    return {
+        "workers": OCR_WORKERS,
+        "jobs_in_flight": _jobs_in_flight,
+        "queued": max(0, _jobs_in_flight - OCR_WORKERS),
+        "max_queued": OCR_MAX_QUEUED_JOBS,
+    }
+
+
+def _queue_full() -> bool:
+    return _jobs_in_flight >= OCR_WORKERS + OCR_MAX_QUEUED_JOBS
+
+
+def _submit(fn, *args) -> asyncio.Future:
+    """Run fn in the OCR pool, counting it as in flight until it has really finished"""
+    global _jobs_in_flight
+    future = get_ocr_executor().submit(fn, *args)
+    _jobs_in_flight += 1
+
+    # A timed-out job that already started keeps its worker busy until Tesseract's
+    # own timeouts stop it, so it only leaves the count once it has really finished
+    def _finished(_):
+        global _jobs_in_flight
+        _jobs_in_flight -= 1
+
+    loop = asyncio.get_running_loop()
+    future.add_done_callback(lambda f: loop.call_soon_threadsafe(_finished, f))
+    return asyncio.wrap_future(future)
+
+
+async def _ocr_pdf(source: OCRSource) -> str:
+    """Read the text layer, then OCR the remaining pages concurrently and merge them in page order
+
+    PDFs given as bytes are sent along with each page job. Page jobs count
+    against the queue limit like any other job and are only submitted while
+    there is room. OCRQueueFull is raised if there is none for the first page;
+    once pages are running the PDF waits for a slot rather than dropping the
+    pages it already has.
+    """
+    try:
+        page_texts = await _submit(read_pdf_text_layer, source)
+    except ImportError:
+        logger.error("PyMuPDF not available for PDF processing")
+        return ""
+    except Exception as pdf_error:
+        logger.error(f"Failed to process PDF: {pdf_error}")
+        return ""
+
+    missing = [index for index, text in enumerate(page_texts) if text is None]
+    if missing:
+        logger.info(f"OCR of {len(missing)} of {len(page_texts)} PDF pages for {_describe(source)}")
+        pages = {}
+        try:
+            for index in missing:
+                while _queue_full():
+                    if not pages:
+                        raise OCRQueueFull()
+                    running = [page for page in pages if not page.done()]
+                    if running:
+                        await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    else:
+                        await asyncio.sleep(1)  # Other jobs hold every slot
+                pages[_submit(ocr_pdf_page, source, index)] = index
+            await asyncio.gather(*pages)
+        finally:
+            for page in pages:
+                page.cancel()  # No-op for finished pages; drops queued ones when this job fails or times out
+        for page, index in pages.items():
+            page_texts[index] = page.result()
+    return merge_page_texts(page_texts)
+
+
+async def run_ocr(source: OCRSource) -> str:
+    """Extract text from an image or PDF in the OCR pool
+
+    source is a file path or the file's content; content is handed to the worker
+    process directly and never written to disk.
+
+    Raises OCRQueueFull when the queue is at capacity and OCRTimeout when the
+    job takes longer than OCR_JOB_TIMEOUT_SECONDS.
+    """
+    if _queue_full():
+        raise OCRQueueFull()
+
+    if isinstance(source, memoryview):
+        source = bytes(source)  # Sent to the worker by pickling, which memoryviews do not support
+    elif not _in_memory(source):
+        source = str(source)
+
+    if is_pdf(source):
+        job = _ocr_pdf(source)
+    else:
+        job = _submit(extract_text_from_image, source)
+
+    try:
+        return await asyncio.wait_for(job, OCR_JOB_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"OCR timed out after {OCR_JOB_TIMEOUT_SECONDS}s for {_describe(source)}")
+        raise OCRTimeout()
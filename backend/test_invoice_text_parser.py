@@ -0,0 +1,56 @@
+"""
+Golden-file check for the OCR invoice parser.
+
+Each test_data/ocr_parser/<name>.txt is OCR output for an invoice photo and
+<name>.json the fields parse_text_simple() must return for it. Items without a
+SKU get a random AUTO### one, so the generator is seeded per document.
+
+After an intended change to the parser, review the diff and rewrite the golden
+files with:  python test_invoice_text_parser.py --update
+
+Usage: python test_invoice_text_parser.py   (or pytest test_invoice_text_parser.py)
+"""
+import json
+import random
+import sys
+from pathlib import Path
+
+from invoice_text_parser import parse_text_simple
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "test_data" / "ocr_parser"
+
+
+def documents():
+    documents = sorted(GOLDEN_DIR.glob("*.txt"))
+    assert documents, f"No golden documents in {GOLDEN_DIR}"
+    return documents
+
+
+def parse(document: Path) -> dict:
+    random.seed(0)
+    return parse_text_simple(document.read_text())
+
+
+def test_matches_golden_files():
+    mismatched = []
+    for document in documents():
+        expected = json.loads(document.with_suffix(".json").read_text())
+        actual = parse(document)
+        if actual != expected:
+            changed = sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+            mismatched.append(f"{document.name}: {', '.join(changed)}")
+    assert not mismatched, "Parser output differs from golden files:\n  " + "\n  ".join(mismatched)
+
+
+def update_golden_files():
+    for document in documents():
+        document.with_suffix(".json").write_text(json.dumps(parse(document), indent=2) + "\n")
+        print(f"Wrote {document.with_suffix('.json').name}")
+
+
+if __name__ == "__main__":
+    if "--update" in sys.argv:
+        update_golden_files()
+    else:
+        test_matches_golden_files()
+        print(f"{len(documents())} documents match their golden files")
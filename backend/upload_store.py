@@ -0,0 +1,187 @@
+"""
+Content-addressed store for uploaded invoice files.
+
+Each distinct file content is written once, to STORE_DIR/<aa>/<bb>/<sha256><ext>,
+and tracked in the stored_files table. invoice_images rows point at their content
+through content_sha256; a database trigger keeps stored_files.ref_count in step,
+and collect_unreferenced_files() removes content that nothing points at any more.
+"""
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from database_manager import job_db, DatabaseManager
+from logging_config import api_logger
+
+# Upload paths saved in the database are relative to the backend directory,
+# so they do not depend on the server's working directory
+BACKEND_DIR = Path(__file__).resolve().parent
+STORE_DIR = BACKEND_DIR / os.getenv('UPLOAD_STORE_DIR', 'uploads/store')
+STORE_TMP_DIR = STORE_DIR / "tmp"
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Bytes read from the request per step when streaming uploads to disk
+
+# Unreferenced content is kept this long after it was last uploaded, so an upload
+# that has been stored but not yet linked to an invoice image is never collected
+UPLOAD_STORE_GRACE_HOURS = int(os.getenv('UPLOAD_STORE_GRACE_HOURS', 24))
+UPLOAD_STORE_GC_HOUR = int(os.getenv('UPLOAD_STORE_GC_HOUR', 4))
+
+
+@dataclass
+class StoredFile:
+    sha256: str
+    size: int
+    path: Path
+    deduplicated: bool  # True when identical content was already in the store
+
+    @property
+    def url(self) -> str:
+        """Relative path saved in invoice_images.image_url"""
+        return relative_upload_path(self.path)
+
+
+def resolve_upload_path(stored_path: str) -> Path:
+    """Local file for a path saved in the database (image_url, stored_files.path)
+
+    Older rows store it with a leading slash ("/uploads/invoices/...").
+    """
+    path = Path(stored_path)
+    if path.is_absolute() and path.exists():
+        return path
+    return BACKEND_DIR / stored_path.lstrip('/')
+
+
+def relative_upload_path(path: Path) -> str:
+    try:
+        return path.resolve().relative_to(BACKEND_DIR).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB"
+    )
+
+
+async def read_upload(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> tuple[bytearray, str]:
+    """Read an upload into memory chunk by chunk and return (content, sha256 hex digest)
+
+    For uploads that are only processed, not kept. The upload is rejected with 413
+    as soon as it grows past max_size.
+    """
+    content = bytearray()
+    digest = hashlib.sha256()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(content) + len(chunk) > max_size:
+            raise _too_large(max_size)
+        digest.update(chunk)
+        content += chunk
+    return content, digest.hexdigest()
+
+
+async def stream_upload_to_disk(file: UploadFile, destination: Path, max_size: int = MAX_FILE_SIZE) -> tuple[int, str]:
+    """Write an upload to destination chunk by chunk and return (size, sha256 hex digest)
+
+    Memory use is one chunk regardless of file size. The upload is rejected with 413
+    as soon as it grows past max_size, and nothing is left on disk in that case.
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = destination.with_name(destination.name + ".part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise _too_large(max_size)
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(partial_path, destination)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+
+    return size, digest.hexdigest()
+
+
+def content_path(sha256: str, extension: str) -> Path:
+    """Location of a piece of content, sharded by the first two bytes of its hash"""
+    return STORE_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+
+
+async def store_upload(db: DatabaseManager, file: UploadFile, max_size: int = MAX_FILE_SIZE) -> StoredFile:
+    """Stream an upload into the store, keeping a single copy per distinct content"""
+    extension = Path(file.filename).suffix.lower() if file.filename else ''
+    extension = extension or '.jpg'
+
+    temp_path = STORE_TMP_DIR / uuid.uuid4().hex
+    size, sha256 = await stream_upload_to_disk(file, temp_path, max_size)
+
+    try:
+        existing = db.execute_query("SELECT path FROM stored_files WHERE sha256 = %s", (sha256,))
+        if existing and resolve_upload_path(existing[0]['path']).exists():
+            temp_path.unlink(missing_ok=True)
+            db.execute_command(
+                "UPDATE stored_files SET last_stored_at = CURRENT_TIMESTAMP WHERE sha256 = %s",
+                (sha256,)
+            )
+            api_logger.info(f"Upload {file.filename} matches stored content {sha256}, not written again")
+            return StoredFile(sha256, size, resolve_upload_path(existing[0]['path']), True)
+
+        path = content_path(sha256, extension)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, path)
+        db.execute_command("""
+        INSERT INTO stored_files (sha256, path, size)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (sha256) DO UPDATE SET
+            path = EXCLUDED.path,
+            last_stored_at = CURRENT_TIMESTAMP
+        """, (sha256, relative_upload_path(path), size))
+        return StoredFile(sha256, size, path, False)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def collect_unreferenced_files(db: Optional[DatabaseManager] = None) -> int:
+    """Delete stored content no invoice image refers to. Called nightly by the scheduler."""
+    with job_db(db) as job_connection:
+        removed = job_connection.execute_query("""
+        DELETE FROM stored_files sf
+        WHERE sf.ref_count <= 0
+          AND sf.last_stored_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+          AND NOT EXISTS (SELECT 1 FROM invoice_images im WHERE im.content_sha256 = sf.sha256)
+        RETURNING sf.path
+        """, (UPLOAD_STORE_GRACE_HOURS,))
+
+    for row in removed:
+        resolve_upload_path(row['path']).unlink(missing_ok=True)
+
+    # Leftovers of uploads interrupted between streaming and linking
+    if STORE_TMP_DIR.exists():
+        cutoff = time.time() - UPLOAD_STORE_GRACE_HOURS * 3600
+        for temp_file in STORE_TMP_DIR.iterdir():
+            if temp_file.stat().st_mtime < cutoff:
+                temp_file.unlink(missing_ok=True)
+
+    api_logger.info(f"Upload store cleanup removed {len(removed)} unreferenced files")
+    return len(removed)
@@ -0,0 +1,16 @@
+-- Indexes for GET /api/invoices (keyset pagination and per-page count aggregates)
+
+-- Keyset pagination: ORDER BY created_at DESC, id DESC with (created_at, id) < cursor
+CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at DESC, id DESC);
+
+-- Count aggregates joined per invoice
+CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice_id ON invoice_items(invoice_id);
+CREATE INDEX IF NOT EXISTS idx_invoice_images_invoice_id ON invoice_images(invoice_id);
+CREATE INDEX IF NOT EXISTS idx_student_acknowledgments_invoice_id ON student_acknowledgments(invoice_id);
+
+ANALYZE invoices;
+ANALYZE invoice_items;
+ANALYZE invoice_images;
+ANALYZE student_acknowledgments;
+
+SELECT 'Invoice list indexes added successfully!' as message;
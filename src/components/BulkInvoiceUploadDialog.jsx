@@ -47,6 +47,34 @@ import { motion, AnimatePresence } from 'framer-motion';
 
 const API_BASE_URL = 'http://localhost:8000';
 const steps = ['Upload Files', 'Review Extracted Data', 'Processing', 'Results'];
+const OCR_POLL_INTERVAL_MS = 1000;
+
+// Queue OCR for a file and poll the job until it has finished
+const runOcrJob = async (file) => {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  const response = await fetch(`${API_BASE_URL}/api/invoices/ocr/jobs`, {
+    method: 'POST',
+    body: formData,
+  });
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const { job_id: jobId } = await response.json();
+
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, OCR_POLL_INTERVAL_MS));
+    const statusResponse = await fetch(`${API_BASE_URL}/api/invoices/ocr/jobs/${jobId}`);
+    if (!statusResponse.ok) {
+      throw new Error(`HTTP error! status: ${statusResponse.status}`);
+    }
+    const job = await statusResponse.json();
+    if (job.status === 'completed' || job.status === 'failed') {
+      return job;
+    }
+  }
+};
 
 const BulkInvoiceUploadDialog = ({ open, onClose, onSuccess }) => {
   const [selectedFiles, setSelectedFiles] = useState([]);
@@ -83,29 +111,48 @@ const BulkInvoiceUploadDialog = ({ open, onClose, onSuccess }) => {
 
     setProcessing(true);
     setError('');
-    const extracted = [];
+    const failed = (file, message) => ({
+      file: file,
+      fileName: file.name,
+      success: false,
+      data: {},
+      confidence: 0,
+      rawText: '',
+      error: message,
+      processingMethod: 'failed'
+    });
+    const extracted = selectedFiles.map((file) => failed(file, 'No result received'));
 
     try {
-      for (let i = 0; i < selectedFiles.length; i++) {
-        const file = selectedFiles[i];
-        const formData = new FormData();
-        formData.append('file', file);
-        // Disable auto-creation during extraction phase
-        formData.append('auto_create_invoice', 'false');
+      // One request for the whole stack; invoices are created after review
+      const formData = new FormData();
+      selectedFiles.forEach((file) => formData.append('files', file));
+      formData.append('auto_create_invoice', 'false');
 
-        try {
-          const response = await fetch(`${API_BASE_URL}/api/invoices/ocr-upload`, {
-            method: 'POST',
-            body: formData,
-          });
-
-          if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-          }
+      const response = await fetch(`${API_BASE_URL}/api/invoices/ocr-batch`, {
+        method: 'POST',
+        body: formData,
+      });
 
-          const result = await response.json();
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
 
-          extracted.push({
+      // Results arrive as NDJSON, one line per file as soon as it is done
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop();
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const result = JSON.parse(line);
+          if (result.type !== 'ocr') continue;
+          const file = selectedFiles[result.index];
+          extracted[result.index] = {
             file: file,
             fileName: file.name,
             success: result.success,
@@ -113,20 +160,10 @@ const BulkInvoiceUploadDialog = ({ open, onClose, onSuccess }) => {
             confidence: result.confidence_score || 0,
             rawText: result.raw_text || '',
             error: result.error || null,
-            processingMethod: result.processing_method || 'unknown'
-          });
-        } catch (err) {
-          extracted.push({
-            file: file,
-            fileName: file.name,
-            success: false,
-            data: {},
-            confidence: 0,
-            rawText: '',
-            error: err.message,
-            processingMethod: 'failed'
-          });
+            processingMethod: 'tesseract_ocr'
+          };
         }
+        if (done) break;
       }
 
       setExtractedData(extracted);
@@ -184,16 +221,9 @@ const BulkInvoiceUploadDialog = ({ open, onClose, onSuccess }) => {
 
   const retryExtraction = async (index) => {
     const file = extractedData[index].file;
-    const formData = new FormData();
-    formData.append('file', file);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/invoices/ocr-upload`, {
-        method: 'POST',
-        body: formData,
-      });
-
-      const result = await response.json();
+      const result = await runOcrJob(file);
 
       const updated = [...extractedData];
       updated[index] = {
@@ -40,7 +40,7 @@ function InstrumentCluster() {
 
       // Fetch real data from each module's API (no authentication needed for basic endpoints)
       const [productsRes, studentsRes, ordersRes, invoicesRes, usersRes] = await Promise.allSettled([
-        fetch('http://localhost:8000/api/products'),
+        fetch('http://localhost:8000/api/products?fields=all'),
         fetch('http://localhost:8000/api/students'),
         fetch('http://localhost:8000/api/orders'),
         fetch('http://localhost:8000/api/invoices').catch(() => ({ status: 'rejected', reason: 'Invoice API not available' })),
@@ -462,7 +462,7 @@ function InstrumentCluster() {
             
             console.log(`Exporting ${module} from ${endpoint}`);
             const timestamp = Date.now();
-            const urlWithTimestamp = `${endpoint}?_t=${timestamp}`;
+            const urlWithTimestamp = `${endpoint}?fields=all&_t=${timestamp}`;
             const response = await fetch(urlWithTimestamp, {
               cache: 'no-cache',
               headers: {
@@ -518,7 +518,7 @@ function InstrumentCluster() {
         
         console.log(`Exporting ${type} from ${endpoint}`);
         const timestamp = Date.now();
-        const urlWithTimestamp = `${endpoint}?_t=${timestamp}`;
+        const urlWithTimestamp = `${endpoint}?fields=all&_t=${timestamp}`;
         const response = await fetch(urlWithTimestamp, {
           cache: 'no-cache',
           headers: {
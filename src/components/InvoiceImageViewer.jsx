@@ -46,6 +46,12 @@ import { motion, AnimatePresence } from 'framer-motion';
 
 const API_BASE_URL = 'http://127.0.0.1:8000';
 
+// Content-hash URLs never change, so the browser can cache them for good
+const imageSrc = (image, size) => {
+  const path = image.content_url || `/api/invoices/images/${image.id}`;
+  return `${API_BASE_URL}${path}${size ? `?size=${size}` : ''}`;
+};
+
 const InvoiceImageViewer = ({ open, onClose, invoiceId, invoiceNumber }) => {
   const [images, setImages] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -64,7 +70,7 @@ const InvoiceImageViewer = ({ open, onClose, invoiceId, invoiceNumber }) => {
     setError(null);
     
     try {
-      const response = await fetch(`${API_BASE_URL}/api/invoices/${invoiceId}/images`);
+      const response = await fetch(`${API_BASE_URL}/api/invoices/${invoiceId}/images?fields=all`);
       
       if (!response.ok) {
         throw new Error(`Failed to fetch images: ${response.status} ${response.statusText}`);
@@ -222,7 +228,7 @@ const InvoiceImageViewer = ({ open, onClose, invoiceId, invoiceNumber }) => {
                         <CardMedia
                           component="img"
                           height="200"
-                          image={`${API_BASE_URL}/api/invoices/images/${image.id}`}
+                          image={imageSrc(image, 'thumb')}
                           alt={image.image_filename || 'Invoice Image'}
                           onClick={() => handleImageClick(image)}
                           sx={{
@@ -432,7 +438,7 @@ const InvoiceImageViewer = ({ open, onClose, invoiceId, invoiceNumber }) => {
           {selectedImage && (
             <Box sx={{ position: 'relative', maxWidth: '100%', maxHeight: '90vh' }}>
               <img
-                src={`${API_BASE_URL}/api/invoices/images/${selectedImage.id}`}
+                src={imageSrc(selectedImage, 'preview')}
                 alt={selectedImage.image_filename}
                 style={{
                   maxWidth: '100%',
@@ -421,6 +421,8 @@ const InvoiceManagement = () => {
       Object.entries(filters).forEach(([key, value]) => {
         if (value) params.append(key, value);
       });
+      // Notes are needed for the client-side search box
+      params.append('fields', 'summary,notes');
       
       const response = await fetch(`${API_BASE_URL}/api/invoices?${params}`);
       const data = await response.json();
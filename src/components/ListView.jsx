@@ -304,7 +304,7 @@ const ListView = ({ type = 'products' }) => {
       setError(null);  // Clear any existing errors
       console.log(`Fetching data for ${type} from ${API_BASE_URL}${currentConfig.endpoint}`);
       
-      const response = await fetch(`${API_BASE_URL}${currentConfig.endpoint}?_t=${Date.now()}`, {
+      const response = await fetch(`${API_BASE_URL}${currentConfig.endpoint}?fields=all&_t=${Date.now()}`, {
         method: 'GET',
         headers: {
           'Content-Type': 'application/json',
@@ -459,7 +459,7 @@ const ListView = ({ type = 'products' }) => {
         
         // Refresh data to get updated statuses (only if updates were made)
         if (successfulUpdates.length > 0) {
-          const response = await fetch(`${API_BASE_URL}${currentConfig.endpoint}?_t=${Date.now()}`, {
+          const response = await fetch(`${API_BASE_URL}${currentConfig.endpoint}?fields=all&_t=${Date.now()}`, {
             headers: { 'Cache-Control': 'no-cache' }
           });
           if (response.ok) {
@@ -142,7 +142,7 @@ const EnhancedProducts = () => {
   const fetchProducts = async () => {
     try {
       setLoading(true);
-      let url = `${API_BASE}/api/products?status=${statusFilter}`;
+      let url = `${API_BASE}/api/products?fields=all&status=${statusFilter}`;
       if (selectedCategory) url += `&category_id=${selectedCategory}`;
       if (searchTerm) url += `&search=${searchTerm}`;
       
@@ -16,12 +16,18 @@ DROP TABLE IF EXISTS user_sessions CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS system_settings CASCADE;
 DROP TABLE IF EXISTS student_acknowledgments CASCADE;
+DROP TABLE IF EXISTS invoice_summary_counters CASCADE;
 DROP TABLE IF EXISTS invoice_transactions CASCADE;
 DROP TABLE IF EXISTS invoice_items CASCADE;
+DROP TABLE IF EXISTS ocr_jobs CASCADE;
+DROP TABLE IF EXISTS ocr_cache CASCADE;
 DROP TABLE IF EXISTS invoice_images CASCADE;
+DROP TABLE IF EXISTS stored_files CASCADE;
 DROP TABLE IF EXISTS invoices CASCADE;
 DROP TABLE IF EXISTS order_items CASCADE;
 DROP TABLE IF EXISTS orders CASCADE;
+DROP TABLE IF EXISTS stock_snapshots CASCADE;
+DROP TABLE IF EXISTS stock_movements CASCADE;
 DROP TABLE IF EXISTS product_transactions CASCADE;
 DROP TABLE IF EXISTS products CASCADE;
 DROP TABLE IF EXISTS categories CASCADE;
@@ -41,12 +47,18 @@ DROP FUNCTION IF EXISTS generate_student_id() CASCADE;
 DROP FUNCTION IF EXISTS generate_invoice_number() CASCADE;
 DROP FUNCTION IF EXISTS create_lending_invoice() CASCADE;
 DROP FUNCTION IF EXISTS update_product_quantity() CASCADE;
+DROP FUNCTION IF EXISTS prevent_stock_movement_update() CASCADE;
+DROP FUNCTION IF EXISTS maintain_invoice_summary() CASCADE;
+DROP FUNCTION IF EXISTS maintain_stored_file_refs() CASCADE;
+DROP FUNCTION IF EXISTS invoice_search_document(text, text, text) CASCADE;
+DROP FUNCTION IF EXISTS apply_invoice_summary_delta(invoices, integer) CASCADE;
 DROP FUNCTION IF EXISTS find_or_create_student(character varying, character varying, character varying, character varying, character varying, integer, character varying) CASCADE;
 
 -- Drop all views
 DROP VIEW IF EXISTS invoice_details CASCADE;
 DROP VIEW IF EXISTS students_clean CASCADE;
 DROP VIEW IF EXISTS students_unique CASCADE;
+DROP MATERIALIZED VIEW IF EXISTS product_spec_facets CASCADE;
 
 -- ===================================================================
 -- CORE UTILITY FUNCTIONS
@@ -113,11 +125,14 @@ $$ LANGUAGE plpgsql;
 
 CREATE OR REPLACE FUNCTION update_product_quantity() 
 RETURNS TRIGGER AS $$
+DECLARE
+    new_balance INTEGER;
 BEGIN
     IF TG_OP = 'INSERT' THEN
         UPDATE products 
         SET quantity_available = quantity_available - NEW.quantity_approved
-        WHERE id = NEW.product_id;
+        WHERE id = NEW.product_id
+        RETURNING quantity_available INTO new_balance;
         
         INSERT INTO product_transactions (
             product_id, transaction_type, quantity_change, 
@@ -130,6 +145,11 @@ BEGIN
             'order', NEW.order_id
         FROM products p WHERE p.id = NEW.product_id;
         
+        IF NEW.quantity_approved <> 0 THEN
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'order', -NEW.quantity_approved, new_balance, 'order', NEW.order_id);
+        END IF;
+        
         RETURN NEW;
     END IF;
     
@@ -137,13 +157,21 @@ BEGIN
         IF OLD.quantity_approved != NEW.quantity_approved THEN
             UPDATE products 
             SET quantity_available = quantity_available + OLD.quantity_approved - NEW.quantity_approved
-            WHERE id = NEW.product_id;
+            WHERE id = NEW.product_id
+            RETURNING quantity_available INTO new_balance;
+            
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'order_approval', OLD.quantity_approved - NEW.quantity_approved, new_balance, 'order', NEW.order_id);
         END IF;
         
         IF OLD.quantity_returned != NEW.quantity_returned THEN
             UPDATE products 
             SET quantity_available = quantity_available + (NEW.quantity_returned - OLD.quantity_returned)
-            WHERE id = NEW.product_id;
+            WHERE id = NEW.product_id
+            RETURNING quantity_available INTO new_balance;
+            
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (NEW.product_id, 'return', NEW.quantity_returned - OLD.quantity_returned, new_balance, 'order', NEW.order_id);
         END IF;
         
         RETURN NEW;
@@ -152,7 +180,13 @@ BEGIN
     IF TG_OP = 'DELETE' THEN
         UPDATE products 
         SET quantity_available = quantity_available + OLD.quantity_approved - OLD.quantity_returned
-        WHERE id = OLD.product_id;
+        WHERE id = OLD.product_id
+        RETURNING quantity_available INTO new_balance;
+        
+        IF OLD.quantity_approved - OLD.quantity_returned <> 0 AND new_balance IS NOT NULL THEN
+            INSERT INTO stock_movements (product_id, movement_type, quantity_change, balance_after, reference_type, reference_id)
+            VALUES (OLD.product_id, 'order_cancel', OLD.quantity_approved - OLD.quantity_returned, new_balance, 'order', OLD.order_id);
+        END IF;
         
         RETURN OLD;
     END IF;
@@ -161,6 +195,21 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+CREATE OR REPLACE FUNCTION prevent_stock_movement_update() 
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'stock_movements is append-only; record a correcting movement instead';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Search document for an invoice's own text; shared by idx_invoices_search and /api/invoices/search
+CREATE OR REPLACE FUNCTION invoice_search_document(invoice_number TEXT, notes TEXT, physical_invoice_notes TEXT) 
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', COALESCE(invoice_number, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(notes, '')), 'C')
+        || setweight(to_tsvector('simple', COALESCE(physical_invoice_notes, '')), 'C')
+$$ LANGUAGE SQL IMMUTABLE;
+
 CREATE OR REPLACE FUNCTION create_lending_invoice() 
 RETURNS TRIGGER AS $$
 BEGIN
@@ -567,6 +616,17 @@ CREATE TABLE invoice_items (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed upload store: one row (and one file on disk) per distinct upload content
+-- ref_count is the number of invoice_images rows pointing at the content, kept by a trigger
+CREATE TABLE stored_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    path TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_stored_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE invoice_images (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     invoice_id UUID REFERENCES invoices(id) ON DELETE CASCADE,
@@ -582,9 +642,41 @@ CREATE TABLE invoice_images (
     processing_status VARCHAR(50) DEFAULT 'pending',
     ocr_text TEXT,
     notes TEXT,
+    content_sha256 CHAR(64) REFERENCES stored_files(sha256),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- OCR results by file content (SHA-256) and OCR configuration version, evicted least recently used first
+-- No foreign key to stored_files: files OCR'd without being stored are cached too
+CREATE TABLE ocr_cache (
+    sha256 CHAR(64) NOT NULL,
+    config_version INTEGER NOT NULL,
+    ocr_text TEXT NOT NULL,
+    extracted_data JSONB,
+    confidence_score REAL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sha256, config_version)
+);
+
+-- Background OCR of uploaded invoices, polled through /api/invoices/ocr/jobs/{id}
+CREATE TABLE ocr_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    image_id UUID REFERENCES invoice_images(id) ON DELETE CASCADE,
+    content_sha256 CHAR(64),
+    file_path TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'processing', 'completed', 'failed')),
+    progress SMALLINT NOT NULL DEFAULT 0,
+    ocr_text TEXT,
+    extracted_data JSONB,
+    confidence_score REAL,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
 CREATE TABLE invoice_transactions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     invoice_id UUID REFERENCES invoices(id) ON DELETE CASCADE,
@@ -632,6 +724,42 @@ CREATE TABLE product_transactions (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Incrementally maintained invoice counters read by /api/invoices/analytics/*
+-- dimension: all | status | type | month (YYYY-MM of created_at) | acknowledged |
+--            physical_captured | issued_due (YYYY-MM-DD of due_date, issued invoices only)
+CREATE TABLE invoice_summary_counters (
+    dimension VARCHAR(30) NOT NULL,
+    bucket VARCHAR(100) NOT NULL,
+    invoice_count BIGINT NOT NULL DEFAULT 0,
+    total_value DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dimension, bucket)
+);
+
+-- Append-only ledger of every change to products.quantity_available
+CREATE TABLE stock_movements (
+    id BIGSERIAL PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    movement_type VARCHAR(30) NOT NULL,  -- opening, order, order_approval, order_cancel, return, adjustment, manual
+    quantity_change INTEGER NOT NULL,
+    balance_after INTEGER NOT NULL,
+    reference_type VARCHAR(50),
+    reference_id UUID,
+    reason TEXT,
+    performed_by VARCHAR(200),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+-- Periodic per-product balances; history at time T = latest snapshot before T + ledger tail
+CREATE TABLE stock_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity_available INTEGER NOT NULL,
+    quantity_total INTEGER NOT NULL,
+    last_movement_id BIGINT NOT NULL DEFAULT 0,
+    snapshot_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
 CREATE TABLE notifications (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID,
@@ -666,6 +794,7 @@ CREATE INDEX idx_products_sku ON products(sku);
 CREATE INDEX idx_products_status ON products(status);
 CREATE INDEX idx_products_name ON products(name);
 CREATE INDEX idx_products_low_stock ON products(quantity_available) WHERE quantity_available <= minimum_stock_level;
+CREATE INDEX idx_products_specifications ON products USING GIN (specifications jsonb_path_ops);
 
 -- Student indexes
 CREATE INDEX idx_students_student_id ON students(student_id);
@@ -692,17 +821,29 @@ CREATE INDEX idx_invoices_student_id ON invoices(student_id);
 CREATE INDEX idx_invoices_status ON invoices(status);
 CREATE INDEX idx_invoices_issue_date ON invoices(issue_date);
 CREATE INDEX idx_invoices_type ON invoices(invoice_type);
+CREATE INDEX idx_invoices_created_at ON invoices(created_at DESC, id DESC);
 CREATE INDEX idx_invoice_items_invoice_id ON invoice_items(invoice_id);
 CREATE INDEX idx_invoice_items_product_id ON invoice_items(product_id);
 CREATE INDEX idx_invoice_images_invoice_id ON invoice_images(invoice_id);
 CREATE INDEX idx_invoice_images_image_type ON invoice_images(image_type);
+CREATE INDEX idx_invoice_images_content_sha256 ON invoice_images(content_sha256);
+CREATE INDEX idx_stored_files_unreferenced ON stored_files(last_stored_at) WHERE ref_count <= 0;
+CREATE INDEX idx_ocr_cache_last_accessed ON ocr_cache(last_accessed_at);
+CREATE INDEX idx_ocr_jobs_unfinished ON ocr_jobs(created_at) WHERE status IN ('queued', 'processing');
 CREATE INDEX idx_invoice_transactions_invoice_id ON invoice_transactions(invoice_id);
 CREATE INDEX idx_student_acknowledgments_invoice_id ON student_acknowledgments(invoice_id);
 CREATE INDEX idx_student_acknowledgments_student_id ON student_acknowledgments(student_id);
 
+-- Full-text search indexes
+CREATE INDEX idx_invoices_search ON invoices USING GIN (invoice_search_document(invoice_number, notes, physical_invoice_notes));
+CREATE INDEX idx_invoice_images_ocr_search ON invoice_images USING GIN (to_tsvector('simple', COALESCE(ocr_text, '')));
+CREATE INDEX idx_students_name_search ON students USING GIN (to_tsvector('simple', COALESCE(name, '')));
+
 -- Transaction and notification indexes
 CREATE INDEX idx_product_transactions_product_id ON product_transactions(product_id);
 CREATE INDEX idx_product_transactions_type ON product_transactions(transaction_type);
+CREATE INDEX idx_stock_movements_product_time ON stock_movements(product_id, created_at);
+CREATE INDEX idx_stock_snapshots_product_time ON stock_snapshots(product_id, snapshot_at DESC);
 CREATE INDEX idx_notifications_type ON notifications(type);
 CREATE INDEX idx_notifications_is_read ON notifications(is_read);
 CREATE INDEX idx_notifications_user_id ON notifications(user_id);
@@ -711,6 +852,55 @@ CREATE INDEX idx_notifications_user_id ON notifications(user_id);
 -- TRIGGERS FOR AUTOMATED BUSINESS LOGIC
 -- ===================================================================
 
+-- Add (sign = 1) or remove (sign = -1) one invoice row from the summary counters
+CREATE OR REPLACE FUNCTION apply_invoice_summary_delta(inv invoices, sign INTEGER) 
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO invoice_summary_counters AS c (dimension, bucket, invoice_count, total_value)
+    SELECT k.dimension, k.bucket, sign, sign * COALESCE(inv.total_value, 0)
+    FROM (VALUES
+        ('all', 'all'),
+        ('status', COALESCE(inv.status, 'unknown')),
+        ('type', COALESCE(inv.invoice_type, 'unknown')),
+        ('month', TO_CHAR(inv.created_at, 'YYYY-MM')),
+        ('acknowledged', CASE WHEN inv.acknowledged_by_student THEN 'true' END),
+        ('physical_captured', CASE WHEN inv.physical_invoice_captured THEN 'true' END),
+        ('issued_due', CASE WHEN inv.status = 'issued' THEN TO_CHAR(inv.due_date, 'YYYY-MM-DD') END)
+    ) AS k(dimension, bucket)
+    WHERE k.bucket IS NOT NULL
+    ON CONFLICT (dimension, bucket) DO UPDATE SET
+        invoice_count = c.invoice_count + EXCLUDED.invoice_count,
+        total_value = c.total_value + EXCLUDED.total_value,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_invoice_summary() 
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_invoice_summary_delta(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_invoice_summary_delta(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION maintain_stored_file_refs() 
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.content_sha256 IS NOT NULL THEN
+        UPDATE stored_files SET ref_count = ref_count - 1 WHERE sha256 = OLD.content_sha256;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.content_sha256 IS NOT NULL THEN
+        UPDATE stored_files SET ref_count = ref_count + 1 WHERE sha256 = NEW.content_sha256;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TRIGGER update_categories_updated_at BEFORE UPDATE ON categories FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_products_updated_at BEFORE UPDATE ON products FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 CREATE TRIGGER update_students_updated_at BEFORE UPDATE ON students FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
@@ -723,6 +913,9 @@ CREATE TRIGGER generate_student_id_trigger BEFORE INSERT ON students FOR EACH RO
 CREATE TRIGGER generate_invoice_number_trigger BEFORE INSERT ON invoices FOR EACH ROW WHEN ((new.invoice_number IS NULL) OR ((new.invoice_number)::text = ''::text)) EXECUTE FUNCTION generate_invoice_number();
 CREATE TRIGGER create_lending_invoice_trigger AFTER UPDATE ON orders FOR EACH ROW EXECUTE FUNCTION create_lending_invoice();
 CREATE TRIGGER update_product_quantity_trigger AFTER INSERT OR DELETE OR UPDATE ON order_items FOR EACH ROW EXECUTE FUNCTION update_product_quantity();
+CREATE TRIGGER stock_movements_append_only BEFORE UPDATE ON stock_movements FOR EACH ROW EXECUTE FUNCTION prevent_stock_movement_update();
+CREATE TRIGGER maintain_invoice_summary_trigger AFTER INSERT OR DELETE OR UPDATE OF status, invoice_type, created_at, due_date, total_value, acknowledged_by_student, physical_invoice_captured ON invoices FOR EACH ROW EXECUTE FUNCTION maintain_invoice_summary();
+CREATE TRIGGER maintain_stored_file_refs_trigger AFTER INSERT OR DELETE OR UPDATE OF content_sha256 ON invoice_images FOR EACH ROW EXECUTE FUNCTION maintain_stored_file_refs();
 
 -- ===================================================================
 -- VIEWS FOR COMPLEX DATA ACCESS
@@ -812,6 +1005,21 @@ SELECT
 FROM students_clean
 WHERE student_id_rank = 1 AND email_rank = 1;
 
+-- Facet counts per product specification key/value (refreshed by the backend scheduler)
+CREATE MATERIALIZED VIEW product_spec_facets AS
+SELECT spec.key AS spec_key,
+       spec.value #>> '{}' AS spec_value,
+       COUNT(*) AS product_count,
+       CURRENT_TIMESTAMP AS refreshed_at
+FROM products p
+CROSS JOIN LATERAL jsonb_each(p.specifications) AS spec
+WHERE p.status = 'active'
+  AND jsonb_typeof(p.specifications) = 'object'
+  AND jsonb_typeof(spec.value) IN ('string', 'number', 'boolean')
+GROUP BY spec.key, spec.value #>> '{}';
+
+CREATE UNIQUE INDEX idx_product_spec_facets_key_value ON product_spec_facets(spec_key, spec_value);
+
 -- ===================================================================
 -- DEFAULT DATA INSERTION
 -- ===================================================================